@@ -0,0 +1,123 @@
+"""
+Micro-benchmark: per-email vs batch scoring
+
+Compares, on synthetic emails:
+
+    fallback  EmailFilter._fallback_filter called per email vs
+              batch_scoring.fallback_codes over the whole list
+    features  local_model feature hashing one email at a time vs one
+              feature_rows call per chunk
+    corpus    batch_scoring.score_corpus in one process vs a process pool
+
+The pooled run always uses at least two processes (the corpus is grown to
+give each PARALLEL_THRESHOLD emails if needed), and the CPU count is
+printed with it: on a single CPU a pool cannot beat one process, and the
+numbers say so rather than showing a speedup that is not there.
+
+    python benchmarks/bench_batch_scoring.py
+    python benchmarks/bench_batch_scoring.py --emails 1000000 --workers 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import numpy as np  # noqa: E402
+from batch_scoring import (PARALLEL_THRESHOLD, available_cpus, fallback_codes, fallback_decision,  # noqa: E402
+                           pool_size, score_corpus)
+from email_filter import EmailFilter  # noqa: E402
+from local_model import LocalModel, feature_rows, feature_tokens  # noqa: E402
+
+WORDS = ('hello meeting lunch report sale update invoice photos weekend trip offer order shipped '
+         'receipt password security alert team project notes agenda budget review plan call').split()
+# One email in twenty mentions something the fallback rules look for
+KEYWORDS = ['newsletter', 'winner', 'interview', 'unsubscribe', 'limited time']
+LABELS = (['INBOX'], ['INBOX', 'CATEGORY_PROMOTIONS'], ['INBOX', 'CATEGORY_SOCIAL'], ['INBOX', 'CATEGORY_UPDATES'])
+PREFERENCES = {'delete_promotional': True, 'delete_social': False, 'delete_newsletters': True,
+               'blocked_senders': ['deals7.com', 'spam@junk.biz']}
+
+
+def synthetic_emails(count, seed=1):
+    rng = random.Random(seed)
+    domains = [f'deals{i}.com' for i in range(50)] + [f'friend{i}.org' for i in range(200)]
+    return [{
+        'message_id': f'{i:016x}',
+        'sender': f"Someone <{rng.choice(['news', 'hello', 'noreply', 'ana'])}@{rng.choice(domains)}>",
+        'subject': ' '.join(rng.sample(WORDS, 4)),
+        'body': ' '.join(rng.choice(WORDS) for _ in range(60)) + (
+            f' {rng.choice(KEYWORDS)}' if rng.random() < 0.05 else ''),
+        'labels': rng.choice(LABELS),
+    } for i in range(count)]
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def per_email_hashing(contents, bits=18):
+    import zlib
+    mask = (1 << bits) - 1
+    return [np.unique(np.fromiter((zlib.crc32(token.encode()) & mask for token in feature_tokens(content)),
+                                  dtype=np.int64)) for content in contents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--emails', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=max(2, available_cpus()),
+                        help="Processes for the pooled run (at least 2)")
+    args = parser.parse_args()
+    args.workers = max(2, args.workers)
+
+    contents = synthetic_emails(args.emails)
+    cpus = available_cpus()
+    print(f"{len(contents)} emails, {cpus} CPU{'s' if cpus != 1 else ''} available")
+    print(f"{'step':<34}{'seconds':>10}{'emails/s':>14}{'speedup':>10}")
+
+    def report(name, seconds, baseline=None, count=len(contents)):
+        speedup = f"{baseline / seconds:>9.2f}x" if baseline else ''
+        print(f"{name:<34}{seconds:>10.2f}{count / seconds:>14,.0f}{speedup:>10}")
+
+    per_email, scalar = timed(lambda: [EmailFilter._fallback_filter(None, content, PREFERENCES) for content in contents])
+    report('fallback, per email', per_email)
+    seconds, codes = timed(lambda: fallback_codes(contents, PREFERENCES))
+    report('fallback, batch', seconds, per_email)
+    mismatches = sum(fallback_decision(code, content, PREFERENCES) != decision
+                     for code, content, decision in zip(codes, contents, scalar))
+    print(f"   (decisions differing from the per-email filter: {mismatches})")
+
+    per_email, _ = timed(lambda: per_email_hashing(contents))
+    report('feature hashing, per email', per_email)
+    seconds, _ = timed(lambda: [feature_rows(contents[start:start + 5000]) for start in range(0, len(contents), 5000)])
+    report('feature hashing, per chunk', seconds, per_email)
+
+    # Below the threshold score_corpus would quietly stay in one process
+    corpus = contents
+    if len(corpus) < args.workers * PARALLEL_THRESHOLD:
+        corpus = synthetic_emails(args.workers * PARALLEL_THRESHOLD, seed=2)
+    model = LocalModel()
+    model.weights = np.random.default_rng(0).normal(0, 0.1, len(model.weights)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'model.npz')
+        model.save(path)
+        processes = pool_size(len(corpus), args.workers, model_path=path)
+        single_seconds, (_, single) = timed(lambda: score_corpus(corpus, PREFERENCES, model=model, workers=1))
+        report('score_corpus, 1 process', single_seconds, count=len(corpus))
+        seconds, (_, pooled) = timed(lambda: score_corpus(corpus, PREFERENCES, model_path=path,
+                                                          workers=args.workers))
+        report(f'score_corpus, {processes} processes', seconds, single_seconds, count=len(corpus))
+    print(f"   (max probability difference: {np.abs(single - pooled).max():.2e})")
+    if cpus < processes:
+        print(f"   ({processes} processes shared {cpus} CPU{'s' if cpus != 1 else ''}: the pool adds startup and "
+              f"pickling cost here and cannot run faster than one process)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""
+Multi-account cleanup orchestrator
+
+Each account gets its own credential store, preferences file and quota
+limit, and runs an independent headless cleanup in a separate process. The
+process pool size is the global concurrency cap. Accounts are described in a
+JSON file:
+
+    {
+      "max_workers": 4,
+      "log_dir": "logs",
+      "accounts": [
+        {
+          "name": "support",
+          "token": "tokens/support.pickle",
+          "preferences": "prefs/support.json",
+          "quota_units_per_second": 100,
+          "max_deletions": 1000,
+          "dry_run": false
+        }
+      ]
+    }
+
+Relative paths are resolved against the accounts file's directory. Each
+account's progress is written to <log_dir>/<name>.log so parallel runs do
+not interleave on the console.
+"""
+
+import contextlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from gmail_client import GmailClient
+from config import load_user_preferences
+from pipeline import ConfirmationPolicy
+from main import start_email_cleanup
+
+# Gmail's per-user limit; accounts without their own quota stay a little under it
+DEFAULT_QUOTA_UNITS_PER_SECOND = 200
+
+
+def load_accounts(accounts_file):
+    """Load the accounts config and resolve its paths"""
+    with open(accounts_file, 'r') as f:
+        config = json.load(f)
+
+    base_dir = os.path.dirname(os.path.abspath(accounts_file))
+
+    def resolve(path):
+        return path if path is None or os.path.isabs(path) else os.path.join(base_dir, path)
+
+    accounts = []
+    for account in config.get('accounts', []):
+        if 'name' not in account or 'token' not in account:
+            raise ValueError(f"Account entries need a 'name' and a 'token' path: {account}")
+        account = dict(account)
+        account['token'] = resolve(account['token'])
+        account['preferences'] = resolve(account.get('preferences'))
+        accounts.append(account)
+
+    names = [account['name'] for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError("Account names must be unique")
+
+    config['accounts'] = accounts
+    config['log_dir'] = resolve(config.get('log_dir', 'logs'))
+    return config
+
+
+def run_account(account, log_dir, defaults=None):
+    """Run one account's cleanup; executed in a worker process"""
+    settings = dict(defaults or {})
+    settings.update(account)
+    started = time.time()
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{account['name']}.log")
+
+    result = {'account': account['name'], 'log': log_path}
+    with open(log_path, 'a') as log, contextlib.redirect_stdout(log):
+        print(f"\n===== {time.strftime('%Y-%m-%d %H:%M:%S')} cleanup for {account['name']} =====")
+        try:
+            gmail_client = GmailClient(
+                token_path=settings['token'],
+                quota_units_per_second=settings.get('quota_units_per_second', DEFAULT_QUOTA_UNITS_PER_SECOND)
+            )
+            if not gmail_client.authenticate(interactive=False):
+                result['error'] = 'authentication failed'
+                return result
+
+            preferences = load_user_preferences(settings.get('preferences'))
+            if settings.get('max_emails') is not None:
+                preferences['max_emails_per_run'] = settings['max_emails']
+
+            # A dry run or deletion cap requested for the whole batch wins over per-account settings
+            caps = [cap for cap in (settings.get('max_deletions'), (defaults or {}).get('max_deletions'))
+                    if cap is not None]
+            policy = ConfirmationPolicy(
+                max_deletions=min(caps) if caps else None,
+                dry_run=settings.get('dry_run', False) or (defaults or {}).get('dry_run', False)
+            )
+            summary = start_email_cleanup(
+                gmail_client,
+                policy=policy,
+                attribution=settings.get('attribution', False),
+                preferences=preferences,
+                query=settings.get('query'),
+                threads=settings.get('threads', False)
+            ) or {}
+            summary.pop('emails_to_delete', None)
+            result.update(summary)
+        except Exception as e:
+            print(f"❌ Cleanup failed: {e}")
+            result['error'] = str(e)
+        finally:
+            result['elapsed'] = time.time() - started
+    return result
+
+
+def run_accounts(accounts_file, max_workers=None, defaults=None):
+    """
+    Run every account in a process pool and return one aggregated summary.
+    max_workers overrides the file's global concurrency cap; defaults supplies
+    settings for accounts that do not set them, except that a dry_run or
+    max_deletions in defaults also applies to accounts that set their own
+    (the smaller cap wins).
+    """
+    config = load_accounts(accounts_file)
+    accounts = config['accounts']
+    if not accounts:
+        print("❌ No accounts configured")
+        return {'accounts': [], 'totals': {}}
+
+    workers = max(1, min(max_workers or config.get('max_workers', 4), len(accounts)))
+    print(f"👥 Running cleanup for {len(accounts)} accounts ({workers} at a time)...")
+
+    started = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_account, account, config['log_dir'], defaults): account['name']
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'account': name, 'error': str(e)}
+            results.append(result)
+
+            if result.get('error') or result.get('errors'):
+                print(f"   ❌ {name}: {result.get('error') or '; '.join(result['errors'])}")
+            else:
+                print(f"   ✅ {name}: deleted {result.get('deleted', 0)} of {result.get('listed', 0)} listed")
+
+    totals = {'listed': 0, 'approved': 0, 'deleted': 0, 'failed': 0}
+    for result in results:
+        for key in totals:
+            totals[key] += result.get(key, 0) or 0
+    totals['accounts'] = len(results)
+    totals['accounts_failed'] = sum(1 for result in results if result.get('error') or result.get('errors'))
+    totals['elapsed'] = time.time() - started
+
+    results.sort(key=lambda result: result['account'])
+    print(f"\n🎉 ALL ACCOUNTS COMPLETED in {totals['elapsed']:.1f}s!")
+    print(f"   👥 Accounts: {totals['accounts']} ({totals['accounts_failed']} failed)")
+    print(f"   ✅ Successfully deleted: {totals['deleted']} emails")
+    print(f"   ❌ Failed to delete: {totals['failed']} emails")
+    return {'accounts': results, 'totals': totals}
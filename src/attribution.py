@@ -0,0 +1,67 @@
+"""
+Detail-free match attribution
+
+Instead of fetching every matched message to guess why it matched, each
+deletion criterion is run as its own id-only Gmail query. A message's delete
+reason then follows from which result sets contain its id, so a cleanup can
+be planned without a single messages.get call.
+"""
+
+from message_ids import IdList, IdMatches
+from rules import compile_rules
+
+CRITERION_REASONS = {
+    'senders': "Sender in delete list",
+    'promotional': "Gmail Promotional folder",
+    'spam': "Spam keyword in subject",
+    'newsletters': "Newsletter pattern",
+    'social': "Gmail Social folder",
+}
+
+# Only the ids are needed, so ask Gmail to leave everything else out
+ID_FIELDS = 'messages/id,nextPageToken'
+ID_PAGE_SIZE = 500
+
+
+def list_ids(gmail_client, query, max_results=None):
+    """
+    List message ids for a query using id-only partial responses, as an
+    IdList. A listing that fails part way raises ListingIncomplete rather
+    than returning the ids seen so far as if they were all the matches.
+    """
+    ids = IdList()
+    for page in gmail_client.iter_email_pages(query=query, max_results=max_results,
+                                              fields=ID_FIELDS, page_size=ID_PAGE_SIZE):
+        ids.extend(message['id'] for message in page)
+    return ids
+
+
+def attribute_matches(gmail_client, search_queries, preferences, max_results=None, per_sender_limit=25):
+    """
+    Run each criterion as its own id query and attribute every id to the
+    criteria whose result sets contain it.
+
+    When the delete list has at most per_sender_limit entries each sender is
+    queried separately so the reason can name the sender; longer lists are
+    queried as one combined sender criterion to keep list calls down.
+
+    Returns an IdMatches (message id -> list of reasons), newest first.
+    """
+    matches = IdMatches()
+    to_delete_senders = preferences.get('to_delete_senders', [])
+    units = compile_rules(preferences).units() if to_delete_senders else {}
+
+    for criterion, query in search_queries:
+        if criterion == 'senders' and len(to_delete_senders) <= per_sender_limit:
+            sub_queries = [
+                (units[('sender', sender)]['query'], f"Sender '{sender}' in delete list")
+                for sender in to_delete_senders
+            ]
+        else:
+            sub_queries = [(query, CRITERION_REASONS.get(criterion, "Matched Gmail search filters"))]
+
+        for sub_query, reason in sub_queries:
+            print(f"🏷️  Attributing: {reason}")
+            matches.add(reason, list_ids(gmail_client, sub_query, max_results=max_results))
+
+    return matches.limit(max_results)
@@ -0,0 +1,116 @@
+"""
+Vectorized scoring of large email batches
+
+Scores a whole chunk of emails at once instead of one email at a time:
+
+    fallback rules  the rule table in rules (what EmailFilter._fallback_filter
+                    applies per email), evaluated column-wise by
+                    CompiledRules.batch_codes: each keyword is one str.find
+                    scan over the joined chunk and the first matching rule
+                    per email is picked with np.select.
+    local model     the chunk is hashed into one sparse feature matrix
+                    (local_model.feature_rows) and scored with one gather and
+                    one bincount.
+
+Corpora large enough to give each of at least two processes
+PARALLEL_THRESHOLD emails are split into CHUNK_SIZE chunks and scored on a
+process pool; each worker loads the model once. On a single CPU the pool
+only adds startup and pickling cost, so the default is one process per CPU.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from local_model import LocalModel
+from rules import rules_for
+
+CHUNK_SIZE = 5000
+# Emails per process below which starting it and pickling its chunks costs more than it saves
+PARALLEL_THRESHOLD = 20000
+
+
+def fallback_codes(contents, preferences):
+    """
+    The rule each email falls under, as an int16 array of positions in the
+    rules compiled from these preferences (-1 when none matches)
+    """
+    return rules_for(preferences).batch_codes(contents)
+
+
+def fallback_decision(code, email_content, preferences):
+    """Expand a rule code into the decision dict _fallback_filter returns"""
+    return rules_for(preferences).decision_for(int(code), email_content)
+
+
+def fallback_decisions(contents, preferences):
+    codes = fallback_codes(contents, preferences)
+    return [fallback_decision(code, content, preferences) for code, content in zip(codes, contents)]
+
+
+def score_chunk(contents, preferences=None, model=None):
+    """
+    Score one chunk. Returns (rule codes or None, delete probabilities or None);
+    pass preferences for the fallback rules and/or a model for probabilities.
+    """
+    codes = fallback_codes(contents, preferences) if preferences is not None else None
+    probabilities = model.predict_proba(contents) if model is not None else None
+    return codes, probabilities
+
+
+_worker_state = {}
+
+
+def _init_worker(preferences, model_path):
+    _worker_state['preferences'] = preferences
+    _worker_state['model'] = LocalModel.load(model_path) if model_path else None
+
+
+def _score_in_worker(contents):
+    return score_chunk(contents, _worker_state['preferences'], _worker_state['model'])
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pool_size(count, workers=None, model=None, model_path=None, chunk_size=CHUNK_SIZE):
+    """
+    How many processes score_corpus uses for count emails: at most workers
+    (default: one per available CPU), each with at least PARALLEL_THRESHOLD
+    emails; 1 means scoring in this process
+    """
+    if model is not None and not model_path:
+        # Workers can only load a saved model
+        return 1
+    chunks = -(-count // chunk_size)
+    return max(1, min(workers or available_cpus(), chunks, count // PARALLEL_THRESHOLD))
+
+
+def score_corpus(contents, preferences=None, model=None, model_path=None, chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Score any number of emails, in input order. Large corpora are scored on
+    a process pool of pool_size() processes, which load the model from
+    model_path; smaller ones use `model` in this process.
+    Returns (rule codes or None, delete probabilities or None).
+    """
+    chunks = [contents[start:start + chunk_size] for start in range(0, len(contents), chunk_size)]
+    processes = pool_size(len(contents), workers, model, model_path, chunk_size)
+    if processes == 1:
+        if model is None and model_path:
+            model = LocalModel.load(model_path)
+        results = [score_chunk(chunk, preferences, model) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(preferences, model_path)) as executor:
+            results = list(executor.map(_score_in_worker, chunks))
+
+    def join(position):
+        parts = [result[position] for result in results]
+        if not parts or parts[0] is None:
+            return None
+        return np.concatenate(parts)
+
+    return join(0), join(1)
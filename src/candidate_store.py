@@ -0,0 +1,218 @@
+"""
+Compact storage for the emails (or threads) a cleanup is about to delete
+
+A run used to keep one dict per candidate, each repeating the full sender
+and reason strings. CandidateStore keeps columns instead:
+
+    id             packed uint64 (see message_ids)
+    sender         code into an interned sender table
+    subject        the only per-row string
+    reason         code into an interned reason table
+    category       code into an interned category table
+    confidence     float32
+    message_count  uint32 (threads; 1 for single emails)
+
+Rows are appended to in-memory columns. Past spill_threshold rows they are
+moved to a temporary SQLite database (deleted when the store is closed), so
+the memory used by a very large cleanup stays flat; only the interned
+tables, which grow with distinct senders and reasons, stay in memory.
+
+Reading a row gives a Candidate, a __slots__ record that also supports
+candidate['field'] and .get(), so code written against the old dicts keeps
+working.
+"""
+
+import collections
+import collections.abc
+import sqlite3
+from array import array
+from message_ids import IdList, decode, encode
+
+# Rows kept in memory before the store starts writing them to disk
+SPILL_THRESHOLD = 100_000
+
+FIELDS = ('id', 'sender', 'subject', 'reason', 'category', 'confidence', 'message_count')
+
+SPILL_SCHEMA = '''
+CREATE TABLE rows (
+    id TEXT NOT NULL,
+    sender INTEGER NOT NULL,
+    subject TEXT,
+    reason INTEGER NOT NULL,
+    category INTEGER NOT NULL,
+    confidence REAL,
+    message_count INTEGER NOT NULL
+)
+'''
+
+
+class Candidate:
+    __slots__ = FIELDS
+
+    def __init__(self, id, sender='', subject='', reason='', category=None, confidence=None, message_count=1):
+        self.id = id
+        self.sender = sender
+        self.subject = subject
+        self.reason = reason
+        self.category = category
+        self.confidence = confidence
+        self.message_count = message_count
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        """Only the fields that are set, like the dicts the store replaces"""
+        return {field: getattr(self, field) for field in FIELDS
+                if getattr(self, field) is not None and not (field == 'message_count' and self.message_count == 1)}
+
+    def __repr__(self):
+        return f"Candidate({self.to_dict()!r})"
+
+
+class _Interned:
+    """Strings stored once; rows refer to them by code"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class CandidateStore(collections.abc.Sequence):
+    def __init__(self, spill_threshold=SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self.senders = _Interned()
+        self.reasons = _Interned()
+        self.categories = _Interned()
+        self.spilled = 0
+        self.db = None
+        self._clear_buffer()
+
+    def _clear_buffer(self):
+        self.ids = array('Q')
+        self.sender_codes = array('I')
+        self.subjects = []
+        self.reason_codes = array('I')
+        self.category_codes = array('H')
+        self.confidences = array('f')
+        self.message_counts = array('I')
+
+    def append(self, email_info):
+        """Add a candidate (a dict with the FIELDS keys, or a Candidate)"""
+        get = email_info.get
+        confidence = get('confidence')
+        self.ids.append(encode(email_info['id']))
+        self.sender_codes.append(self.senders.code(get('sender') or ''))
+        self.subjects.append(get('subject') or '')
+        self.reason_codes.append(self.reasons.code(get('reason') or ''))
+        self.category_codes.append(self.categories.code(get('category')))
+        self.confidences.append(float('nan') if confidence is None else confidence)
+        self.message_counts.append(get('message_count') or 1)
+        if self.spill_threshold and len(self.ids) >= self.spill_threshold:
+            self._spill()
+
+    def _spill(self):
+        if self.db is None:
+            # An empty name gives a private on-disk database that SQLite deletes on close
+            self.db = sqlite3.connect('', check_same_thread=False)
+            self.db.execute(SPILL_SCHEMA)
+        with self.db:
+            self.db.executemany('INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)', zip(
+                map(decode, self.ids), self.sender_codes, self.subjects, self.reason_codes,
+                self.category_codes, self.confidences, self.message_counts))
+        self.spilled += len(self.ids)
+        self._clear_buffer()
+
+    def _candidate(self, row):
+        msg_id, sender, subject, reason, category, confidence, message_count = row
+        return Candidate(
+            msg_id if isinstance(msg_id, str) else decode(msg_id),
+            self.senders.values[sender],
+            subject,
+            self.reasons.values[reason],
+            self.categories.values[category],
+            None if confidence is None or confidence != confidence else round(confidence, 3),
+            message_count,
+        )
+
+    def _buffered(self, index):
+        return (self.ids[index], self.sender_codes[index], self.subjects[index], self.reason_codes[index],
+                self.category_codes[index], self.confidences[index], self.message_counts[index])
+
+    def _disk_rows(self, start, stop):
+        return self.db.execute('SELECT * FROM rows WHERE rowid > ? AND rowid <= ? ORDER BY rowid',
+                               (start, stop)).fetchall()
+
+    def __len__(self):
+        return self.spilled + len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = self._disk_rows(start, min(stop, self.spilled)) if start < self.spilled else []
+            rows += [self._buffered(i - self.spilled) for i in range(max(start, self.spilled), stop)]
+            return [self._candidate(row) for row in rows]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('CandidateStore index out of range')
+        if index >= self.spilled:
+            return self._candidate(self._buffered(index - self.spilled))
+        return self._candidate(self._disk_rows(index, index + 1)[0])
+
+    def __iter__(self):
+        if self.spilled:
+            for row in self.db.execute('SELECT * FROM rows ORDER BY rowid'):
+                yield self._candidate(row)
+        for index in range(len(self.ids)):
+            yield self._candidate(self._buffered(index))
+
+    def ids_list(self):
+        """All candidate ids, in order, as an IdList"""
+        ids = IdList()
+        if self.spilled:
+            ids.extend(row[0] for row in self.db.execute('SELECT id FROM rows ORDER BY rowid'))
+        ids.extend(map(decode, self.ids))
+        return ids
+
+    def message_total(self, ids=None):
+        """Sum of message_count, over all rows or only those whose id is in ids (an IdSet)"""
+        total = 0
+        if self.spilled:
+            for msg_id, count in self.db.execute('SELECT id, message_count FROM rows'):
+                if ids is None or msg_id in ids:
+                    total += count
+        if ids is None:
+            return total + sum(self.message_counts)
+        hits = ids.contains_values(self.ids)
+        return total + sum(count for count, hit in zip(self.message_counts, hits) if hit)
+
+    def reason_counts(self):
+        counts = collections.Counter()
+        if self.spilled:
+            counts.update(dict(self.db.execute('SELECT reason, COUNT(*) FROM rows GROUP BY reason')))
+        counts.update(self.reason_codes)
+        return {self.reasons.values[code]: count for code, count in counts.most_common()}
+
+    def to_dicts(self):
+        return [candidate.to_dict() for candidate in self]
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,144 @@
+"""
+Tiered email classification
+
+Each email is decided by the cheapest tier that is sure about it:
+
+    rules        the exact rules of the shared rule table: delete-list
+                 senders (an address/domain index), the user's own and
+                 starred mail, and Gmail's spam, promotions and social
+                 labels for the categories the user deletes
+    local model  the hashed-feature logistic regression in local_model,
+                 trained from earlier Gemini verdicts, when it is confident
+    Gemini       everything else, through the concurrent ClassificationEngine
+
+New Gemini verdicts are stored in the verdict cache and the local model is
+retrained after a run once enough new ones have come in, so the middle
+tier takes over more of the work over time.
+"""
+
+import collections
+from batch_scoring import fallback_decisions, score_corpus
+from local_model import CONFIDENT_PROBABILITY, DEFAULT_MODEL_PATH, LocalModel, train_model
+from rules import rules_for
+from verdict_cache import preferences_fingerprint
+
+TIERS = {
+    'rules': 'rules',
+    'local': 'local model',
+    'gemini': 'Gemini',
+}
+
+LABEL_CATEGORIES = {
+    'CATEGORY_PROMOTIONS': 'promotional',
+    'CATEGORY_SOCIAL': 'social',
+    'CATEGORY_UPDATES': 'other',
+    'CATEGORY_FORUMS': 'other',
+    'CATEGORY_PERSONAL': 'personal',
+    'SPAM': 'spam',
+}
+
+# Retrain once this many verdicts have been added since the model was built
+RETRAIN_AFTER = 100
+
+
+def local_decision(email_content, probability):
+    category = next((LABEL_CATEGORIES[label] for label in email_content.get('labels', [])
+                     if label in LABEL_CATEGORIES), 'other')
+    delete = probability >= 0.5
+    return {
+        "delete": bool(delete),
+        "reason": f"Local model: {probability if delete else 1 - probability:.0%} sure it should be "
+                  f"{'deleted' if delete else 'kept'}",
+        "category": category,
+        "confidence": round(float(probability if delete else 1 - probability), 3),
+    }
+
+
+class ClassificationCascade:
+    def __init__(self, engine, verdict_cache=None, model_path=None, threshold=CONFIDENT_PROBABILITY):
+        self.engine = engine
+        self.verdict_cache = verdict_cache
+        self.model_path = model_path or DEFAULT_MODEL_PATH
+        self.threshold = threshold
+        self.tiers = collections.Counter()
+
+    def _model(self, fingerprint):
+        model = LocalModel.load(self.model_path)
+        if model is not None and model.fingerprint == fingerprint and model.usable:
+            return model
+        return None
+
+    def classify(self, email_contents, user_preferences):
+        """Decisions in input order, each tagged with the 'source' that made it"""
+        fingerprint = preferences_fingerprint(user_preferences)
+        rules = rules_for(user_preferences)
+        decisions = [None] * len(email_contents)
+
+        remaining = []
+        for i, email_content in enumerate(email_contents):
+            decision = rules.decide(email_content, exact_only=True)
+            if decision is None:
+                remaining.append(i)
+            else:
+                decision['source'] = 'rules'
+                decisions[i] = decision
+                self.tiers['rules'] += 1
+
+        model = self._model(fingerprint) if remaining else None
+        if model is not None:
+            _, probabilities = score_corpus([email_contents[i] for i in remaining], model=model,
+                                            model_path=self.model_path)
+            undecided = []
+            for i, probability in zip(remaining, probabilities):
+                if probability >= self.threshold or probability <= 1 - self.threshold:
+                    decisions[i] = local_decision(email_contents[i], probability)
+                    decisions[i]['source'] = 'local'
+                    self.tiers['local'] += 1
+                else:
+                    undecided.append(i)
+            remaining = undecided
+
+        email_filter = self.engine.email_filter
+        if remaining and email_filter.breaker.blocked():
+            # Gemini is unavailable: apply the fallback rules to the whole batch at once
+            results = fallback_decisions([email_contents[i] for i in remaining], user_preferences)
+            email_filter.count_path('circuit_open', len(results))
+            for i, decision in zip(remaining, results):
+                decision['source'] = 'circuit_open'
+                decisions[i] = decision
+                self.tiers['gemini'] += 1
+            remaining = []
+
+        if remaining:
+            results = self.engine.classify([email_contents[i] for i in remaining], user_preferences)
+            for i, decision in zip(remaining, results):
+                decisions[i] = decision
+                self.tiers['gemini'] += 1
+            if self.verdict_cache is not None:
+                verdicts = [(email_contents[i], decisions[i]) for i in remaining
+                            if decisions[i].get('source') == 'gemini']
+                self.verdict_cache.add(verdicts, fingerprint)
+                self._maybe_retrain(fingerprint, model)
+
+        return decisions
+
+    def _maybe_retrain(self, fingerprint, model):
+        known = self.verdict_cache.count(fingerprint)
+        if model is None:
+            model = LocalModel.load(self.model_path)
+            if model is not None and model.fingerprint != fingerprint:
+                model = None
+        if model is not None and known - model.trained_on < RETRAIN_AFTER:
+            return
+        model = train_model(self.verdict_cache, fingerprint)
+        if model is None:
+            return
+        model.save(self.model_path)
+        print(f"🧠 Local model retrained on {known} Gemini verdicts: {model.accuracy:.1%} agreement on "
+              f"{model.coverage:.0%} of held-out emails{'' if model.usable else ' (not accurate enough to use yet)'}")
+
+    def summary(self):
+        """e.g. 'rules 120 (40%), local model 100 (33%), Gemini 80 (27%)'"""
+        total = sum(self.tiers.values()) or 1
+        return ', '.join(f"{label} {self.tiers[tier]} ({self.tiers[tier] / total:.0%})"
+                         for tier, label in TIERS.items())
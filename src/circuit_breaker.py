@@ -0,0 +1,91 @@
+"""
+Circuit breaker for a flaky remote backend
+
+Tracks the outcome of the last `window` calls. Once at least `min_calls`
+have been seen and the share of failures reaches `failure_rate`, the
+breaker opens and callers are told to skip the backend entirely. After
+`cooldown` seconds one probe call is let through (half-open): success
+closes the breaker, failure opens it for another cooldown.
+"""
+
+import collections
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Thread-safe; shared by the sync and asyncio classification paths"""
+
+    def __init__(self, name='backend', failure_rate=0.5, min_calls=5, window=20, cooldown=30.0):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.results = collections.deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+
+    def allow(self):
+        """Whether the next call may go to the backend"""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                # Exactly one probe at a time; everyone else keeps using the fallback
+                self.probing = True
+                return True
+            return False
+
+    def blocked(self):
+        """Whether calls are currently being refused; unlike allow() this never starts a probe"""
+        with self.lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at < self.cooldown
+            return self.state == HALF_OPEN and self.probing
+
+    def record_success(self):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                print(f"✅ {self.name} is responding again, resuming calls")
+                self.state = CLOSED
+                self.probing = False
+                self.results.clear()
+            self.results.append(True)
+
+    def record_failure(self):
+        with self.lock:
+            self.results.append(False)
+            if self.state == HALF_OPEN:
+                self._open(f"{self.name} probe failed")
+            elif self.state == CLOSED and len(self.results) >= self.min_calls:
+                failures = self.results.count(False)
+                if failures / len(self.results) >= self.failure_rate:
+                    self._open(f"{failures} of the last {len(self.results)} {self.name} calls failed")
+
+    def release(self):
+        """Hand back a half-open probe that ended without an outcome (failed before the call, or cancelled)"""
+        with self.lock:
+            if self.state == HALF_OPEN:
+                self.probing = False
+
+    def trip(self, reason):
+        """Open the breaker immediately, e.g. when the backend is known to be unusable"""
+        with self.lock:
+            self._open(reason)
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+        self.trips += 1
+        print(f"⚡ {reason}; skipping {self.name} for {self.cooldown:.0f}s")
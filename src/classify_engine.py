@@ -0,0 +1,105 @@
+"""
+Concurrent Gemini classification under rate budgets
+
+One EmailFilter (and so one model client) is shared by every request, and
+up to `concurrency` requests are kept in flight on an asyncio loop. Before
+each request a RateBudget makes sure the last 60 seconds stay under the
+requests-per-minute and tokens-per-minute limits; the token estimate is
+replaced by the real count once the response arrives. Results come back
+in input order, so callers can zip them with their emails.
+
+Limits default to the GEMINI_RPM / GEMINI_TPM environment variables.
+"""
+
+import asyncio
+import collections
+import os
+import time
+from prompt_builder import SYSTEM_INSTRUCTION, build_prompt, estimate_tokens
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RPM = int(os.getenv('GEMINI_RPM', '1000'))
+DEFAULT_TPM = int(os.getenv('GEMINI_TPM', '1000000'))
+WINDOW_SECONDS = 60
+
+
+class RateBudget:
+    """Sliding-window requests-per-minute and tokens-per-minute limiter for one event loop"""
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        # [timestamp, tokens] per request in the current window
+        self.window = collections.deque()
+        self.tokens = 0
+        self.lock = asyncio.Lock()
+
+    def _expire(self, now):
+        while self.window and now - self.window[0][0] >= WINDOW_SECONDS:
+            self.tokens -= self.window.popleft()[1]
+
+    async def acquire(self, tokens):
+        """Wait until one more request of about `tokens` fits; returns a handle for settle()"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                fits_rpm = len(self.window) < self.rpm
+                # A single request larger than the whole budget is let through on an empty window
+                fits_tpm = self.tokens + tokens <= self.tpm or not self.window
+                if fits_rpm and fits_tpm:
+                    entry = [now, tokens]
+                    self.window.append(entry)
+                    self.tokens += tokens
+                    return entry
+                # Holding the lock while sleeping keeps waiters in arrival order
+                await asyncio.sleep(max(self.window[0][0] + WINDOW_SECONDS - now, 0.01))
+
+    def settle(self, entry, actual_tokens):
+        """Replace a request's estimate with the tokens it really used"""
+        if entry in self.window:
+            self.tokens += actual_tokens - entry[1]
+        entry[1] = actual_tokens
+
+
+class ClassificationEngine:
+    def __init__(self, email_filter, concurrency=DEFAULT_CONCURRENCY, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.email_filter = email_filter
+        self.concurrency = concurrency
+        self.rpm = rpm
+        self.tpm = tpm
+        self.system_tokens = estimate_tokens(SYSTEM_INSTRUCTION)
+
+    async def _classify_one(self, semaphore, budget, email_content, user_preferences):
+        email_filter = self.email_filter
+        # An open breaker skips both the queue and the rate budget
+        if email_filter.breaker.blocked():
+            return email_filter.fallback_decision(email_content, user_preferences, 'circuit_open')
+        async with semaphore:
+            prompt = build_prompt(email_content, user_preferences, email_filter.body_tokens)
+            estimate = self.system_tokens + estimate_tokens(prompt) + email_filter.MAX_OUTPUT_TOKENS
+            entry = await budget.acquire(estimate)
+            # The breaker may have opened while this request was waiting
+            if not email_filter.breaker.allow():
+                budget.settle(entry, 0)
+                return email_filter.fallback_decision(email_content, user_preferences, 'circuit_open')
+            try:
+                decision, tokens = await email_filter.classify_async(email_content, user_preferences)
+                budget.settle(entry, tokens)
+                return decision
+            except Exception as e:
+                print(f"Error with Gemini AI analysis: {e}")
+                return email_filter.fallback_decision(email_content, user_preferences, 'gemini_error')
+
+    async def classify_async(self, email_contents, user_preferences):
+        """Classify every email with bounded concurrency; decisions are returned in input order"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        budget = RateBudget(self.rpm, self.tpm)
+        return await asyncio.gather(*(
+            self._classify_one(semaphore, budget, email_content, user_preferences)
+            for email_content in email_contents
+        ))
+
+    def classify(self, email_contents, user_preferences):
+        """Blocking entry point for synchronous callers"""
+        return asyncio.run(self.classify_async(email_contents, user_preferences))
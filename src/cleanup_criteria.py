@@ -0,0 +1,116 @@
+"""
+Gmail search criteria and delete-reason helpers shared by the cleanup paths
+"""
+
+import csv
+import io
+import re
+
+# Delete-list entries are either an address or a bare domain
+_DOMAIN = r'(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63}'
+SENDER_LIST_HEADERS = {'email', 'sender', 'address', 'domain', 'from'}
+DELETE_ENTRY_PATTERN = re.compile(rf"^(?:[a-z0-9!#$%&'*+/=?^_`{{|}}~.-]+@)?{_DOMAIN}$")
+
+
+def clean_sender_address(sender):
+    """Extract the bare address from a "Name <email>" From header"""
+    if '<' in sender and '>' in sender:
+        return sender.split('<')[1].split('>')[0].strip()
+    return sender.strip()
+
+
+def normalize_delete_entry(value):
+    """Return the canonical delete-list form of an address, "Name <email>" or domain, or None if invalid"""
+    entry = clean_sender_address(value or '').strip().strip('"\'').lower()
+    if entry.startswith('@'):
+        entry = entry[1:]
+    if len(entry) > 254 or not DELETE_ENTRY_PATTERN.match(entry):
+        return None
+    return entry
+
+
+def parse_sender_list(text):
+    """
+    Parse a CSV or newline-delimited sender list.
+    
+    The first valid address or domain on each row is taken, so both plain
+    lists and exported spreadsheets (with a header row or extra columns)
+    work. Returns (entries, invalid) in file order; duplicates within the
+    file are kept for the caller's index to resolve.
+    """
+    entries = []
+    invalid = []
+    for line_number, row in enumerate(csv.reader(io.StringIO(text))):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if not cells or cells[0].startswith('#'):
+            continue
+        entry = next((e for e in map(normalize_delete_entry, cells) if e), None)
+        if entry:
+            entries.append(entry)
+        elif line_number == 0 and any(cell.lower() in SENDER_LIST_HEADERS for cell in cells):
+            continue
+        else:
+            invalid.append(','.join(cells))
+    return entries, invalid
+
+
+def get_header(message, name, default=''):
+    """Return the value of a header from a Gmail message resource"""
+    headers = message.get('payload', {}).get('headers', [])
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+
+def sender_query(sender):
+    """Gmail search fragment for one delete-list entry (address or bare domain)"""
+    if '@' in sender:
+        return f'from:"{sender}"'
+    # If it's just a domain, search for emails from that domain
+    return f'from:"@{sender}"'
+
+
+def build_search_queries(preferences, verbose=True):
+    """
+    Build one Gmail search query per enabled deletion criterion
+    Returns a list of (criterion, query) tuples
+    """
+    from rules import compile_rules
+    return compile_rules(preferences).search_queries(verbose)
+
+
+# A thread with any of these is a conversation the user took part in or marked, so it is never trashed whole
+THREAD_KEEP_LABELS = ('SENT', 'DRAFT', 'STARRED')
+
+
+def classify_thread(thread, preferences, rules=None):
+    """
+    Decide once for a whole thread (threads.get in metadata format).
+    Returns an email_info dict for the thread, with 'keep' set to a reason
+    when the thread must be left alone. Pass compiled rules when
+    classifying many threads.
+    """
+    messages = thread.get('messages', [])
+    first = messages[0] if messages else {}
+    clean_sender = clean_sender_address(get_header(first, 'From'))
+    subject = get_header(first, 'Subject', 'No Subject')
+    info = {
+        'id': thread['id'],
+        'sender': clean_sender,
+        'subject': subject,
+        'message_count': len(messages),
+        'reason': (rules.delete_reason(clean_sender, subject) if rules is not None
+                   else get_delete_reason(clean_sender, subject, preferences)),
+        'keep': None,
+    }
+    for message in messages:
+        labels = set(message.get('labelIds', []))
+        kept = [label for label in THREAD_KEEP_LABELS if label in labels]
+        if kept:
+            info['keep'] = f"thread contains a {kept[0].lower()} message"
+            break
+    return info
+
+
+def get_delete_reason(clean_sender, subject, preferences):
+    """Determine why an email was matched by the Gmail search (for display purposes)"""
+    from rules import rules_for
+    return rules_for(preferences).delete_reason(clean_sender, subject)
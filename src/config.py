@@ -1,5 +1,8 @@
 import os
 import json
+import tempfile
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,10 +11,11 @@ load_dotenv()
 Configuration settings for email filtering
 """
 
-def load_user_preferences():
-    """Load user preferences from JSON file"""
-    config_dir = os.path.dirname(__file__)
-    preferences_file = os.path.join(config_dir, 'user_preferences.json')
+def load_user_preferences(preferences_file=None):
+    """Load user preferences from JSON file (defaults to src/user_preferences.json)"""
+    if preferences_file is None:
+        config_dir = os.path.dirname(__file__)
+        preferences_file = os.path.join(config_dir, 'user_preferences.json')
     
     try:
         with open(preferences_file, 'r') as f:
@@ -25,6 +29,7 @@ def load_user_preferences():
             'delete_promotional': False,
             'delete_spam': True,
             'delete_newsletters': True,
+            'protect_personal_mail': False,
             'keep_categories': [
                 'personal',
                 'work', 
@@ -38,19 +43,80 @@ def load_user_preferences():
             'max_emails_per_run': None
         }
 
-def save_user_preferences(preferences):
-    """Save user preferences to JSON file"""
-    config_dir = os.path.dirname(__file__)
-    preferences_file = os.path.join(config_dir, 'user_preferences.json')
+def save_user_preferences(preferences, preferences_file=None):
+    """Save user preferences to JSON file (defaults to src/user_preferences.json)"""
+    if preferences_file is None:
+        config_dir = os.path.dirname(__file__)
+        preferences_file = os.path.join(config_dir, 'user_preferences.json')
     
+    # Write to a temp file and rename it over the old one so a crash never leaves half a file
+    temp_path = None
     try:
-        with open(preferences_file, 'w') as f:
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.user_preferences.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(preferences_file))
+        )
+        with os.fdopen(fd, 'w') as f:
             json.dump(preferences, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, preferences_file)
         return True
     except Exception as e:
         print(f"Error saving user preferences: {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
         return False
 
+class PreferencesWriter:
+    """
+    Write-behind saver for preferences that change many times in a row.
+    
+    schedule() only marks the preferences dirty; a single write happens once
+    no further changes arrive for `delay` seconds (and at most every
+    `max_delay` seconds under constant churn). The dict is copied under
+    `lock` at write time, so scheduling stays O(1) however long the sender
+    list grows.
+    """
+    
+    def __init__(self, preferences, lock, preferences_file=None, delay=1.0, max_delay=5.0):
+        self.preferences = preferences
+        self.lock = lock
+        self.preferences_file = preferences_file
+        self.delay = delay
+        self.max_delay = max_delay
+        self._timer_lock = threading.Lock()
+        self._timer = None
+        self._first_change = None
+        self.writes = 0
+    
+    def schedule(self):
+        with self._timer_lock:
+            now = time.monotonic()
+            if self._first_change is None:
+                self._first_change = now
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = max(0.0, min(self.delay, self._first_change + self.max_delay - now))
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def flush(self):
+        """Write pending changes now; returns False only if a write failed"""
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._first_change is None:
+                return True
+            self._first_change = None
+            with self.lock:
+                snapshot = dict(self.preferences)
+                snapshot['to_delete_senders'] = list(snapshot.get('to_delete_senders', []))
+            self.writes += 1
+            # Written while holding the timer lock so an older snapshot can never land after a newer one
+            return save_user_preferences(snapshot, self.preferences_file)
+
 # Load user preferences from JSON file
 USER_PREFERENCES = load_user_preferences()
 
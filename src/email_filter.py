@@ -1,18 +1,65 @@
 import google.generativeai as genai
+import asyncio
+import collections
 import os
+import threading
 from dotenv import load_dotenv
 import json
-import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from candidate_store import CandidateStore
+from circuit_breaker import CircuitBreaker
+from mime_body import extract_body
+from near_duplicates import ClusteredClassifier
+from rules import rules_for
+from prompt_builder import SYSTEM_INSTRUCTION, DEFAULT_BODY_TOKENS, TokenUsage, build_prompt, estimate_tokens
+from verdict_cache import VerdictCache
+from cascade import ClassificationCascade
+from classify_engine import DEFAULT_CONCURRENCY, DEFAULT_RPM, DEFAULT_TPM, ClassificationEngine
 
 # Load environment variables
 load_dotenv()
 
 class EmailFilter:
-    def __init__(self):
+    # Only this much of the body is ever used, so no more than this is decoded
+    BODY_CHAR_LIMIT = 1000
+    
+    # The JSON verdict is a few dozen tokens; cap it so a rambling reply cannot cost more
+    MAX_OUTPUT_TOKENS = 96
+    
+    # A healthy call takes a second or two; waiting longer only stalls the run
+    REQUEST_TIMEOUT = 20
+    
+    # How each decision was made, for the run summary
+    DECISION_PATHS = {
+        'gemini': 'Gemini',
+        'gemini_error': 'fallback after a Gemini error',
+        'circuit_open': 'fallback while Gemini was unavailable',
+    }
+    
+    def __init__(self, body_tokens=DEFAULT_BODY_TOKENS, timeout=REQUEST_TIMEOUT, breaker=None):
         # Configure Gemini AI
-        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        api_key = os.getenv('GEMINI_API_KEY')
+        genai.configure(api_key=api_key)
         # Updated model name - use gemini-1.5-flash or gemini-1.5-pro
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        # The instructions are sent once as a shared system instruction, not repeated in every prompt
+        self.model = genai.GenerativeModel(
+            'gemini-1.5-flash',
+            system_instruction=SYSTEM_INSTRUCTION,
+            generation_config={
+                'temperature': 0,
+                'max_output_tokens': self.MAX_OUTPUT_TOKENS,
+                'response_mime_type': 'application/json',
+            }
+        )
+        self.body_tokens = body_tokens
+        self.usage = TokenUsage()
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker('Gemini')
+        if not api_key:
+            self.breaker.trip("GEMINI_API_KEY is not set")
+        self.paths_lock = threading.Lock()
+        self.paths = collections.Counter()
         
     def extract_email_content(self, gmail_client, message_id):
         """Extract readable content from Gmail message"""
@@ -33,7 +80,7 @@ class EmailFilter:
             return {
                 'sender': sender,
                 'subject': subject,
-                'body': body[:1000] if body else '',  # Limit body to 1000 chars
+                'body': body or '',  # Already limited to BODY_CHAR_LIMIT chars
                 'message_id': message_id,
                 'labels': labels  # Include Gmail labels
             }
@@ -42,217 +89,199 @@ class EmailFilter:
             return None
     
     def _extract_body(self, payload):
-        """Extract text body from email payload"""
-        body = ""
-        
+        """Extract text body from email payload (first BODY_CHAR_LIMIT characters)"""
         try:
-            if 'parts' in payload:
-                for part in payload['parts']:
-                    if part['mimeType'] == 'text/plain':
-                        data = part['body'].get('data', '')
-                        if data:
-                            body = base64.urlsafe_b64decode(data).decode('utf-8')
-                            break
-                    elif part['mimeType'] == 'text/html' and not body:
-                        data = part['body'].get('data', '')
-                        if data:
-                            body = base64.urlsafe_b64decode(data).decode('utf-8')
-            elif payload['mimeType'] == 'text/plain':
-                data = payload['body'].get('data', '')
-                if data:
-                    body = base64.urlsafe_b64decode(data).decode('utf-8')
+            return extract_body(payload, max_chars=self.BODY_CHAR_LIMIT)
         except Exception as e:
             print(f"Error extracting body: {e}")
             return ""
-        
-        return body
     
     def should_delete_email(self, email_content, user_preferences):
         """Use Gemini AI to determine if email should be deleted"""
         
-        prompt = f"""
-        You are an email filtering assistant. Analyze the following email and determine if it should be DELETED based on the user's preferences.
-
-        USER PREFERENCES:
-        - Senders to always delete: {user_preferences.get('blocked_senders', [])}
-        - Delete promotional emails: {user_preferences.get('delete_promotional', True)}
-        - Delete spam emails: {user_preferences.get('delete_spam', True)}
-        - Delete newsletters: {user_preferences.get('delete_newsletters', False)}
-        - Keep important categories: {user_preferences.get('keep_categories', ['personal', 'work', 'financial', 'travel'])}
-
-        EMAIL TO ANALYZE:
-        From: {email_content['sender']}
-        Subject: {email_content['subject']}
-        Body Preview: {email_content['body'][:500]}...
-        Gmail Labels: {email_content.get('labels', [])}
-
-        INSTRUCTIONS:
-        1. Check if sender is in blocked list
-        2. Determine email category (promotional, spam, newsletter, personal, work, financial, travel, etc.)
-        3. Assess importance and relevance
-        4. Consider if this looks like automated marketing, spam, or unwanted content
-
-        Respond with ONLY a JSON object in this exact format:
-        {{
-            "delete": true,
-            "reason": "Brief explanation of why this email should or shouldn't be deleted",
-            "category": "email category (promotional, spam, personal, work, etc.)",
-            "confidence": 0.9
-        }}
-        """
+        # While Gemini is failing, go straight to the rules instead of waiting for every call to time out
+        if not self.breaker.allow():
+            return self.fallback_decision(email_content, user_preferences, 'circuit_open')
         
         try:
-            response = self.model.generate_content(prompt)
-            # Clean the response text
-            response_text = response.text.strip()
-            
-            # Remove any markdown formatting if present
-            if response_text.startswith('```json'):
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            result = json.loads(response_text)
-            return result
+            prompt = build_prompt(email_content, user_preferences, self.body_tokens)
+        except BaseException:
+            # Nothing reached Gemini; don't leave a half-open probe taken forever
+            self.breaker.release()
+            raise
+        
+        try:
+            started = time.monotonic()
+            response = self.model.generate_content(prompt, request_options={'timeout': self.timeout})
+        except Exception as e:
+            self.breaker.record_failure()
+            print(f"Error with Gemini AI analysis: {e}")
+            # Fallback to basic keyword filtering
+            return self.fallback_decision(email_content, user_preferences, 'gemini_error')
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        
+        try:
+            self._record_usage(prompt, response, time.monotonic() - started)
+            decision = self._parse_response(response)
         except json.JSONDecodeError as e:
             print(f"Error parsing AI response: {e}")
-            print(f"Raw response: {response.text if 'response' in locals() else 'No response'}")
-            return self._fallback_filter(email_content, user_preferences)
+            print(f"Raw response: {response.text}")
+            return self.fallback_decision(email_content, user_preferences, 'gemini_error')
         except Exception as e:
             print(f"Error with Gemini AI analysis: {e}")
-            # Fallback to basic keyword filtering
-            return self._fallback_filter(email_content, user_preferences)
+            return self.fallback_decision(email_content, user_preferences, 'gemini_error')
+        self.count_path('gemini')
+        decision['source'] = 'gemini'
+        return decision
     
-    def _fallback_filter(self, email_content, user_preferences):
-        """Fallback filtering logic if AI fails - now uses Gmail labels"""
-        sender = email_content['sender'].lower()
-        subject = email_content['subject'].lower()
-        body = email_content['body'].lower()
-        labels = email_content.get('labels', [])
-        
-        # Check blocked senders
-        for blocked_sender in user_preferences.get('blocked_senders', []):
-            if blocked_sender.lower() in sender:
-                return {
-                    "delete": True,
-                    "reason": f"Sender {blocked_sender} is in blocked list",
-                    "category": "blocked",
-                    "confidence": 1.0
-                }
-        
-        # Check Gmail promotional category using labels
-        if user_preferences.get('delete_promotional', False):
-            promotional_labels = ['CATEGORY_PROMOTIONS', 'PROMOTIONS']
-            if any(label in labels for label in promotional_labels):
-                return {
-                    "delete": True,
-                    "reason": "Email is in Gmail Promotional category",
-                    "category": "promotional",
-                    "confidence": 0.95
-                }
-        
-        # Check Gmail social category using labels
-        if user_preferences.get('delete_social', False):
-            social_labels = ['CATEGORY_SOCIAL', 'SOCIAL']
-            if any(label in labels for label in social_labels):
-                return {
-                    "delete": True,
-                    "reason": "Email is in Gmail Social category",
-                    "category": "social",
-                    "confidence": 0.95
-                }
-        
-        # Check for spam keywords
-        spam_keywords = [
-            'viagra', 'casino', 'lottery', 'winner', 'congratulations',
-            'free money', 'click here', 'act now', 'limited time'
-        ]
-        
-        content = f"{subject} {body}"
-        
-        if any(keyword in content for keyword in spam_keywords):
-            return {
-                "delete": True,
-                "reason": "Contains spam keywords",
-                "category": "spam",
-                "confidence": 0.9
-            }
-        
-        # Newsletter detection - more specific patterns
-        newsletter_keywords = ['unsubscribe', 'newsletter', 'weekly digest', 'monthly update']
-        newsletter_senders = ['newsletter@', 'noreply@', 'no-reply@', 'updates@', 'news@']
+    async def classify_async(self, email_content, user_preferences):
+        """
+        One Gemini classification without blocking the event loop.
+        Returns (decision, tokens used); errors are raised for the caller to handle.
+        The caller checks self.breaker.allow() first; the outcome is recorded here,
+        and a probe that ends without one (a prompt error, cancellation) is released.
+        """
+        try:
+            prompt = build_prompt(email_content, user_preferences, self.body_tokens)
+        except BaseException:
+            self.breaker.release()
+            raise
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                self.model.generate_content_async(prompt, request_options={'timeout': self.timeout}),
+                self.timeout
+            )
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled: the call has no outcome, so let the next request probe instead
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        tokens = self._record_usage(prompt, response, time.monotonic() - started)
+        decision = self._parse_response(response)
+        self.count_path('gemini')
+        decision['source'] = 'gemini'
+        return decision, tokens
+    
+    def _parse_response(self, response):
+        # Clean the response text
+        response_text = response.text.strip()
         
-        if user_preferences.get('delete_newsletters', False):
-            if any(keyword in content for keyword in newsletter_keywords):
-                return {
-                    "delete": True,
-                    "reason": "Newsletter content detected",
-                    "category": "newsletter",
-                    "confidence": 0.8
-                }
-            
-            if any(pattern in sender for pattern in newsletter_senders):
-                return {
-                    "delete": True,
-                    "reason": "Newsletter sender pattern detected",
-                    "category": "newsletter",
-                    "confidence": 0.8
-                }
+        # Remove any markdown formatting if present
+        if response_text.startswith('```json'):
+            response_text = response_text.replace('```json', '').replace('```', '').strip()
         
-        # Job-related emails - be more conservative
-        job_keywords = ['job', 'career', 'position', 'hiring', 'interview', 'resume']
-        if any(keyword in content for keyword in job_keywords):
-            return {
-                "delete": False,
-                "reason": "Job-related email - keeping for review",
-                "category": "career",
-                "confidence": 0.8
-            }
-        
-        return {
-            "delete": False,
-            "reason": "No deletion criteria met",
-            "category": "unknown",
-            "confidence": 0.5
-        }
+        return json.loads(response_text)
+    
+    def _record_usage(self, prompt, response, latency):
+        """Record a call's tokens and latency; returns the total tokens it used"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and usage.prompt_token_count:
+            input_tokens, output_tokens, estimated = usage.prompt_token_count, usage.candidates_token_count, False
+        else:
+            # Older API responses carry no usage data; fall back to a character-based estimate
+            input_tokens = estimate_tokens(SYSTEM_INSTRUCTION) + estimate_tokens(prompt)
+            output_tokens, estimated = estimate_tokens(response.text), True
+        self.usage.record(input_tokens, output_tokens, latency, estimated=estimated)
+        return input_tokens + output_tokens
+    
+    def count_path(self, path, count=1):
+        with self.paths_lock:
+            self.paths[path] += count
+    
+    def fallback_decision(self, email_content, user_preferences, path):
+        """Decide with the local rules, noting why Gemini was not used"""
+        self.count_path(path)
+        decision = self._fallback_filter(email_content, user_preferences)
+        decision['source'] = path
+        return decision
+    
+    def path_summary(self):
+        """e.g. '37 by Gemini, 3 by fallback after a Gemini error'"""
+        with self.paths_lock:
+            return ', '.join(f"{self.paths[path]} by {label}"
+                             for path, label in self.DECISION_PATHS.items() if self.paths[path])
+    
+    def _fallback_filter(self, email_content, user_preferences):
+        """Fallback filtering logic if AI fails - the shared rule table, including its keyword heuristics"""
+        return rules_for(user_preferences).decide(email_content)
 
 
-def filter_emails(gmail_client, emails, user_preferences):
+def filter_emails(gmail_client, emails, user_preferences, email_filter=None, concurrency=DEFAULT_CONCURRENCY,
+                  rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, cascade=True, dedupe=True):
     """
-    Filter emails using AI to determine which should be deleted
+    Filter emails using AI to determine which should be deleted.
+    With dedupe, near-duplicate emails are clustered and one per cluster is
+    classified. With cascade, exact rules and the local model decide what
+    they can and only the rest goes to Gemini. Up to `concurrency` Gemini requests run at
+    once on one shared model client, within the rpm/tpm budgets; results are
+    reported in input order, as a CandidateStore.
     """
-    email_filter = EmailFilter()
-    emails_to_delete = []
+    email_filter = email_filter or EmailFilter()
+    emails_to_delete = CandidateStore()
     
     print(f"Analyzing {len(emails)} emails...")
     
-    for i, email in enumerate(emails):
+    # Fetching is I/O bound too; get_email_details uses a per-thread Gmail service
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='extract') as executor:
+        contents = list(executor.map(lambda email: email_filter.extract_email_content(gmail_client, email['id']), emails))
+    
+    pending = [(email, content) for email, content in zip(emails, contents) if content]
+    rules = rules_for(user_preferences)
+    rules.reset_stats()
+    engine = ClassificationEngine(email_filter, concurrency=concurrency, rpm=rpm, tpm=tpm)
+    verdict_cache = VerdictCache() if cascade else None
+    try:
+        classifier = ClassificationCascade(engine, verdict_cache) if cascade else engine
+        clustered = ClusteredClassifier(classifier) if dedupe else None
+        decisions = (clustered or classifier).classify([content for _, content in pending], user_preferences)
+    finally:
+        if verdict_cache is not None:
+            verdict_cache.close()
+    
+    for i, ((email, email_content), decision) in enumerate(zip(pending, decisions)):
         try:
-            # Extract email content
-            email_content = email_filter.extract_email_content(gmail_client, email['id'])
-            
-            if email_content:
-                # Use AI to determine if email should be deleted
-                decision = email_filter.should_delete_email(email_content, user_preferences)
+            if decision['delete'] and decision['confidence'] > 0.6:
+                emails_to_delete.append({
+                    'id': email['id'],
+                    'sender': email_content['sender'],
+                    'subject': email_content['subject'],
+                    'reason': decision['reason'],
+                    'category': decision['category'],
+                    'confidence': decision['confidence']
+                })
                 
-                if decision['delete'] and decision['confidence'] > 0.6:
-                    emails_to_delete.append({
-                        'id': email['id'],
-                        'sender': email_content['sender'],
-                        'subject': email_content['subject'],
-                        'reason': decision['reason'],
-                        'category': decision['category'],
-                        'confidence': decision['confidence']
-                    })
-                    
-                    print(f"✓ WILL DELETE: {email_content['subject'][:50]}... - {decision['reason']}")
-                else:
-                    print(f"✗ KEEPING: {email_content['subject'][:50]}... - {decision['reason']}")
+                print(f"✓ WILL DELETE: {email_content['subject'][:50]}... - {decision['reason']}")
+            else:
+                print(f"✗ KEEPING: {email_content['subject'][:50]}... - {decision['reason']}")
             
             # Progress indicator
             if (i + 1) % 10 == 0:
-                print(f"Processed {i + 1}/{len(emails)} emails...")
+                print(f"Processed {i + 1}/{len(pending)} emails...")
                 
         except Exception as e:
             print(f"Error processing email {email['id']}: {e}")
             continue
     
-    return emails_to_delete
\ No newline at end of file
+    usage = email_filter.usage.summary()
+    if usage['calls']:
+        print(f"Gemini usage: {usage['calls']} calls, {usage['input_tokens']} input / {usage['output_tokens']} output tokens "
+              f"({usage['input_tokens_per_email']} / {usage['output_tokens_per_email']} per email, "
+              f"{usage['latency_per_email']}s per email)")
+    if dedupe:
+        print(f"Near-duplicates: {clustered.summary()}")
+    if cascade:
+        print(f"Decided by tier: {classifier.summary()}")
+    paths = email_filter.path_summary()
+    if paths:
+        print(f"Decided: {paths}")
+    if rules.summary():
+        print(f"Rules: {rules.summary()}")
+    
+    return emails_to_delete
@@ -1,15 +1,75 @@
 import os
 import pickle
+import threading
+import time
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+# Gmail API quota cost per call, in quota units
+QUOTA_COSTS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.trash': 5,
+    'messages.delete': 10,
+    'messages.batchDelete': 50,
+    'messages.batchModify': 50,
+    'threads.list': 10,
+    'threads.get': 10,
+    'threads.trash': 10,
+    'history.list': 2,
+    'getProfile': 1,
+}
+
+
+class ListingIncomplete(Exception):
+    """A listing stopped early on an error, so the pages yielded so far are not all matches"""
+
+
+class QuotaLimiter:
+    """Token bucket over Gmail quota units (Gmail allows 250 units per user per second)"""
+
+    def __init__(self, units_per_second):
+        self.rate = float(units_per_second)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, units):
+        """Block until the bucket has room, then spend units (a large batch may overdraw it)"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens > 0:
+                    self.tokens -= units
+                    return
+                wait = -self.tokens / self.rate
+            time.sleep(wait)
+
+
 class GmailClient:
-    def __init__(self):
+    # Calls per batched HTTP request (Gmail allows 100 but throttles above ~50)
+    BATCH_SIZE = 50
+    # messages.batchModify accepts up to 1000 ids per call
+    BULK_MODIFY_SIZE = 1000
+
+    def __init__(self, token_path=None, quota_units_per_second=None):
+        """
+        token_path: where OAuth credentials are stored (defaults to token.pickle
+            in the project root)
+        quota_units_per_second: optional cap on Gmail quota spend for this account
+        """
+        self.token_path = token_path
+        self.quota = QuotaLimiter(quota_units_per_second) if quota_units_per_second else None
         self.service = None
         # Use the most comprehensive Gmail scope to avoid permission issues
         self.scopes = ['https://mail.google.com/']
         self.creds = None
+        # googleapiclient service objects are not thread-safe, so worker
+        # threads each get their own (see get_service)
+        self._local = threading.local()
         
         # Embedded OAuth2 credentials - users don't need to create their own
         self.client_config = {
@@ -24,11 +84,17 @@ class GmailClient:
             }
         }
 
-    def authenticate(self):
-        """Authenticate user using OAuth2 flow"""
-        # Get the project root directory (one level up from src/)
-        project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        token_path = os.path.join(project_root, 'token.pickle')
+    def authenticate(self, interactive=True):
+        """Authenticate user using OAuth2 flow
+        
+        With interactive=False a missing or unrefreshable token fails
+        instead of prompting and opening a browser.
+        """
+        token_path = self.token_path
+        if token_path is None:
+            # Get the project root directory (one level up from src/)
+            project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            token_path = os.path.join(project_root, 'token.pickle')
         
         # Check if we have saved credentials
         if os.path.exists(token_path):
@@ -39,6 +105,9 @@ class GmailClient:
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 self.creds.refresh(Request())
+            elif not interactive:
+                print(f"❌ No valid Gmail token at {token_path} - run the app interactively once to sign in")
+                return False
             else:
                 print("🔐 Gmail authentication required...")
                 print("A browser window will open for you to sign in to your Gmail account.")
@@ -56,58 +125,112 @@ class GmailClient:
                 self.creds = flow.run_local_server(port=0)
             
             # Save the credentials for the next run
+            token_dir = os.path.dirname(token_path)
+            if token_dir:
+                os.makedirs(token_dir, exist_ok=True)
             with open(token_path, 'wb') as token:
                 pickle.dump(self.creds, token)
 
         self.service = build('gmail', 'v1', credentials=self.creds)
         return True
 
+    def spend_quota(self, method, calls=1):
+        """Wait for quota before making calls (no-op without a quota limit)"""
+        if self.quota is not None:
+            self.quota.acquire(QUOTA_COSTS.get(method, 5) * calls)
+
+    def get_service(self):
+        """Return a Gmail service object that is safe to use from the calling thread"""
+        if threading.current_thread() is threading.main_thread():
+            return self.service
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = build('gmail', 'v1', credentials=self.creds, cache_discovery=False)
+            self._local.service = service
+        return service
+
     def get_emails(self, user_id='me', query='', max_results=None):
         """Get emails based on query with pagination support and retry logic"""
-        import time
+        emails = []
+        try:
+            for batch in self.iter_email_pages(user_id=user_id, query=query, max_results=max_results):
+                emails.extend(batch)
+        except ListingIncomplete:
+            # Callers only show these, so what was listed before the error is enough
+            pass
+        print(f"📊 Total emails retrieved: {len(emails)}")
+        return emails
+
+    def iter_email_pages(self, user_id='me', query='', max_results=None, fields=None, page_size=100):
+        """Yield pages of message stubs for a query as soon as each page arrives
+        
+        fields is an optional partial-response selector, e.g.
+        'messages/id,nextPageToken' when only ids are needed. Gmail accepts
+        a page_size of up to 500. Raises ListingIncomplete when an error
+        ends the listing before the last page.
+        """
+        return self._iter_list_pages('messages', user_id, query, max_results, fields, page_size)
+
+    def iter_thread_pages(self, user_id='me', query='', max_results=None, fields=None, page_size=100):
+        """Yield pages of thread stubs (id, snippet, historyId) for a query
+        
+        A thread is listed when any of its messages matches the query.
+        Raises ListingIncomplete like iter_email_pages.
+        """
+        return self._iter_list_pages('threads', user_id, query, max_results, fields, page_size)
+
+    def _iter_list_pages(self, resource, user_id, query, max_results, fields, page_size):
         from googleapiclient.errors import HttpError
         
-        emails = []
+        service = self.get_service()
+        collection = getattr(service.users(), resource)()
+        noun = 'emails' if resource == 'messages' else resource
         next_page_token = None
         total_fetched = 0
         retry_count = 0
         max_retries = 3
         
-        print(f"🔍 Searching for emails with query: '{query}'")
+        print(f"🔍 Searching for {noun} with query: '{query}'")
         
         while True:
             try:
                 # Use smaller batch size to avoid server overload
-                batch_size = min(100, max_results - total_fetched if max_results else 100)
+                batch_size = min(page_size, max_results - total_fetched if max_results else page_size)
                 
                 # Request a batch of messages
-                results = self.service.users().messages().list(
-                    userId=user_id, 
-                    q=query, 
-                    pageToken=next_page_token,
-                    maxResults=batch_size
-                ).execute()
+                request_args = {
+                    'userId': user_id,
+                    'q': query,
+                    'pageToken': next_page_token,
+                    'maxResults': batch_size
+                }
+                if fields:
+                    request_args['fields'] = fields
+                self.spend_quota(f'{resource}.list')
+                results = collection.list(**request_args).execute()
                 
-                batch = results.get('messages', [])
+                batch = results.get(resource, [])
                 if not batch:
-                    print("📭 No more emails found")
+                    print(f"📭 No more {noun} found")
                     break
-                    
-                emails.extend(batch)
+                
+                # Trim to max requested
+                if max_results and total_fetched + len(batch) > max_results:
+                    batch = batch[:max_results - total_fetched]
                 total_fetched += len(batch)
                 
                 # Print progress
-                print(f"📨 Fetched {total_fetched} emails so far...")
+                print(f"📨 Fetched {total_fetched} {noun} so far...")
+                yield batch
                 
                 # Check if we've reached the maximum requested
                 if max_results and total_fetched >= max_results:
-                    emails = emails[:max_results]  # Trim to max requested
                     break
                     
                 # Get next page token
                 next_page_token = results.get('nextPageToken')
                 if not next_page_token:
-                    print("✅ Reached end of emails")
+                    print(f"✅ Reached end of {noun}")
                     break
                 
                 # Reset retry count on successful request
@@ -135,7 +258,7 @@ class GmailClient:
                         print("   4. Clear your token.pickle file and re-authenticate")
                     elif error.resp.status >= 500:
                         print("🔧 Gmail servers are experiencing issues. Try again later.")
-                    break
+                    raise ListingIncomplete(f"listing {noun} stopped after {total_fetched}: {error}") from error
                 
                 # Exponential backoff
                 wait_time = 2 ** retry_count
@@ -145,23 +268,189 @@ class GmailClient:
                 
             except Exception as error:
                 print(f"❌ Unexpected error: {error}")
+                raise ListingIncomplete(f"listing {noun} stopped after {total_fetched}: {error}") from error
+
+    def count_emails(self, query='', user_id='me'):
+        """Cheap match count for a query using Gmail's resultSizeEstimate (one list call)"""
+        self.spend_quota('messages.list')
+        results = self.get_service().users().messages().list(
+            userId=user_id,
+            q=query,
+            maxResults=1,
+            fields='resultSizeEstimate'
+        ).execute()
+        return results.get('resultSizeEstimate', 0)
+
+    def get_profile(self, user_id='me'):
+        """Return the mailbox profile (emailAddress, messagesTotal, historyId)"""
+        self.spend_quota('getProfile')
+        return self.get_service().users().getProfile(userId=user_id).execute()
+
+    def iter_history(self, start_history_id, user_id='me'):
+        """
+        Yield history records since start_history_id, page by page.
+        Raises googleapiclient HttpError 404 when the start id is too old.
+        """
+        service = self.get_service()
+        next_page_token = None
+        while True:
+            self.spend_quota('history.list')
+            results = service.users().history().list(
+                userId=user_id,
+                startHistoryId=start_history_id,
+                pageToken=next_page_token,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                maxResults=500
+            ).execute()
+            for record in results.get('history', []):
+                yield record
+            next_page_token = results.get('nextPageToken')
+            if not next_page_token:
                 break
-                    
-        print(f"📊 Total emails retrieved: {len(emails)}")
-        return emails
 
     def get_email_details(self, user_id='me', msg_id=''):
         """Get detailed information about a specific email"""
         try:
-            message = self.service.users().messages().get(userId=user_id, id=msg_id).execute()
+            self.spend_quota('messages.get')
+            message = self.get_service().users().messages().get(userId=user_id, id=msg_id).execute()
             return message
         except Exception as error:
             print(f'An error occurred: {error}')
             return None
 
+    def get_emails_metadata(self, msg_ids, user_id='me', headers=('From', 'Subject')):
+        """Fetch header metadata for many messages using batched HTTP requests
+        
+        Returns a dict of message id -> message resource. Messages that could
+        not be fetched are left out.
+        """
+        return self._batch_get_metadata('messages', msg_ids, user_id, headers)
+
+    def get_threads_metadata(self, thread_ids, user_id='me', headers=('From', 'Subject')):
+        """Fetch header metadata for every message of many threads in batched requests
+        
+        One threads.get covers the whole thread. Returns a dict of thread id
+        -> thread resource (with a 'messages' list); failed threads are left out.
+        """
+        return self._batch_get_metadata('threads', thread_ids, user_id, headers)
+
+    def _batch_get_metadata(self, resource, ids, user_id, headers):
+        service = self.get_service()
+        collection = getattr(service.users(), resource)()
+        results = {}
+        # A batch rejects a repeated request_id, so each id is requested once
+        pending = list(dict.fromkeys(ids))
+        
+        for attempt in range(3):
+            failed = []
+            
+            def on_response(request_id, response, exception):
+                if exception is not None:
+                    failed.append(request_id)
+                else:
+                    results[request_id] = response
+            
+            # Gmail throttles large batches, so stay well under the 100 call limit
+            for start in range(0, len(pending), self.BATCH_SIZE):
+                self.spend_quota(f'{resource}.get', len(pending[start:start + self.BATCH_SIZE]))
+                batch = service.new_batch_http_request(callback=on_response)
+                for item_id in pending[start:start + self.BATCH_SIZE]:
+                    batch.add(
+                        collection.get(
+                            userId=user_id,
+                            id=item_id,
+                            format='metadata',
+                            metadataHeaders=list(headers)
+                        ),
+                        request_id=item_id
+                    )
+                try:
+                    batch.execute()
+                except Exception as error:
+                    print(f"⚠️ Batch metadata request failed: {error}")
+                    # Callbacks that already ran have put their ids in results or failed
+                    failed.extend(i for i in pending[start:start + self.BATCH_SIZE]
+                                  if i not in results and i not in failed)
+            
+            if not failed:
+                break
+            pending = failed
+            time.sleep(2 ** attempt)
+        
+        return results
+
+    def batch_trash_emails(self, msg_ids, user_id='me'):
+        """Move many messages to trash using batched HTTP requests
+        
+        Returns (trashed_ids, failed_ids).
+        """
+        return self._batch_trash('messages', msg_ids, user_id)
+
+    def batch_trash_threads(self, thread_ids, user_id='me'):
+        """Move whole threads to trash (one call per thread) using batched HTTP requests
+        
+        Returns (trashed_ids, failed_ids).
+        """
+        return self._batch_trash('threads', thread_ids, user_id)
+
+    def _batch_trash(self, resource, ids, user_id):
+        service = self.get_service()
+        collection = getattr(service.users(), resource)()
+        trashed = []
+        failed = []
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                failed.append(request_id)
+            else:
+                trashed.append(request_id)
+        
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            chunk = ids[start:start + self.BATCH_SIZE]
+            self.spend_quota(f'{resource}.trash', len(chunk))
+            batch = service.new_batch_http_request(callback=on_response)
+            for item_id in chunk:
+                batch.add(collection.trash(userId=user_id, id=item_id), request_id=item_id)
+            try:
+                batch.execute()
+            except Exception as error:
+                print(f"⚠️ Batch trash request failed: {error}")
+                failed.extend(i for i in chunk if i not in trashed and i not in failed)
+        
+        return trashed, failed
+
+    def bulk_trash_emails(self, msg_ids, user_id='me'):
+        """Move many messages to trash with batchModify, 1000 ids per call
+        
+        Far fewer calls (and quota units) than per-message trash requests for
+        large id sets. A chunk whose call fails falls back to batch_trash_emails.
+        Returns (trashed_ids, failed_ids).
+        """
+        service = self.get_service()
+        trashed = []
+        failed = []
+        
+        for start in range(0, len(msg_ids), self.BULK_MODIFY_SIZE):
+            chunk = msg_ids[start:start + self.BULK_MODIFY_SIZE]
+            self.spend_quota('messages.batchModify')
+            try:
+                service.users().messages().batchModify(
+                    userId=user_id,
+                    body={'ids': chunk, 'addLabelIds': ['TRASH']}
+                ).execute()
+                trashed.extend(chunk)
+            except Exception as error:
+                print(f"⚠️ Bulk trash request failed, retrying one by one: {error}")
+                chunk_trashed, chunk_failed = self.batch_trash_emails(chunk, user_id=user_id)
+                trashed.extend(chunk_trashed)
+                failed.extend(chunk_failed)
+        
+        return trashed, failed
+
     def delete_email(self, user_id='me', msg_id=''):
         """Delete a specific email"""
         try:
+            self.spend_quota('messages.delete')
             self.service.users().messages().delete(userId=user_id, id=msg_id).execute()
             return True
         except Exception as error:
@@ -169,6 +458,7 @@ class GmailClient:
             
             # Try trash instead of delete
             try:
+                self.spend_quota('messages.trash')
                 self.service.users().messages().trash(userId=user_id, id=msg_id).execute()
                 print(f"Message {msg_id} moved to trash instead.")
                 return True
@@ -183,6 +473,7 @@ class GmailClient:
         
         try:
             body = {'ids': msg_ids}
+            self.spend_quota('messages.batchDelete')
             self.service.users().messages().batchDelete(userId=user_id, body=body).execute()
             print(f'Successfully deleted {len(msg_ids)} messages.')
             return True
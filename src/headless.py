@@ -0,0 +1,173 @@
+"""
+Non-interactive batch runner for scheduled cleanups
+
+Runs the same cleanup as the web GUI flow without opening a browser or
+prompting, so it can be driven from cron:
+
+    python src/headless.py --dry-run --json
+    python src/headless.py --yes --auto-confirm-max 500 --abort-above 5000
+    python src/headless.py --yes --query 'from:"deals@shop.example" older_than:30d'
+    python src/headless.py --yes --accounts accounts.json --max-workers 8 --json
+    python src/headless.py --dry-run --reclaim 5GB --older-than 365
+
+Progress goes to stderr; with --json only the run summary is written to
+stdout. Exit codes: 0 success, 1 authentication or run error, 3 aborted
+because the match estimate exceeded --abort-above.
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+from gmail_client import GmailClient
+from config import load_user_preferences
+from cleanup_criteria import build_search_queries
+from pipeline import ConfirmationPolicy
+from candidate_store import CandidateStore
+from main import start_email_cleanup
+from accounts import run_accounts
+from metadata_cache import MetadataCache
+from reclaim import parse_size, plan_reclaim, print_plan, run_reclaim
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a Gmail cleanup without the GUI or prompts")
+    parser.add_argument('--query', help="Gmail search query to use instead of the saved preferences")
+    parser.add_argument('--max', type=int, dest='max_emails',
+                        help="Maximum number of emails to list (overrides max_emails_per_run)")
+    parser.add_argument('--dry-run', action='store_true', help="List and classify but do not delete")
+    parser.add_argument('--yes', action='store_true', help="Pre-approve deletion (required unless --dry-run)")
+    parser.add_argument('--auto-confirm-max', type=int,
+                        help="Delete at most this many emails; only the first N matches are listed and fetched")
+    parser.add_argument('--abort-above', type=int,
+                        help="Abort before deleting anything if Gmail estimates more matches than this")
+    parser.add_argument('--attribution', action='store_true',
+                        help="Attribute reasons from per-criterion id queries (no message detail fetches)")
+    parser.add_argument('--threads', action='store_true',
+                        help="Decide and trash per conversation thread instead of per email")
+    parser.add_argument('--reclaim', type=parse_size, metavar='SIZE',
+                        help="Trash the fewest emails that free SIZE (e.g. 5GB), ranked by cached sizeEstimate")
+    parser.add_argument('--reclaim-strategy', choices=('largest', 'senders'), default='largest',
+                        help="Pick the largest emails, or whole bulk senders by bytes per email")
+    parser.add_argument('--older-than', type=int, metavar='DAYS',
+                        help="Only reclaim emails older than DAYS days")
+    parser.add_argument('--accounts', help="Accounts JSON file; runs every account in a process pool")
+    parser.add_argument('--max-workers', type=int,
+                        help="Global cap on accounts cleaned concurrently (with --accounts)")
+    parser.add_argument('--json', action='store_true', help="Write the run summary as JSON to stdout")
+    parser.add_argument('--list', action='store_true', help="Include the affected emails in the JSON summary")
+    return parser
+
+
+def run(args, gmail_client=None):
+    """Run one headless cleanup and return (exit_code, summary)"""
+    if gmail_client is None:
+        gmail_client = GmailClient()
+        print("🔐 Authenticating with Gmail...")
+        if not gmail_client.authenticate(interactive=False):
+            return 1, {'error': 'authentication failed'}
+
+    if args.reclaim:
+        return run_storage_reclaim(args, gmail_client)
+    
+    preferences = load_user_preferences()
+    if args.max_emails is not None:
+        preferences['max_emails_per_run'] = args.max_emails
+
+    if args.abort_above is not None:
+        query = args.query or " OR ".join(q for _, q in build_search_queries(preferences))
+        estimate = gmail_client.count_emails(query) if query else 0
+        print(f"📊 Gmail estimates {estimate} matching emails")
+        if estimate > args.abort_above:
+            print(f"⛔ Estimate exceeds --abort-above {args.abort_above} - aborting without deleting")
+            return 3, {'aborted': True, 'estimate': estimate, 'abort_above': args.abort_above}
+
+    policy = ConfirmationPolicy(max_deletions=args.auto_confirm_max, dry_run=args.dry_run)
+    summary = start_email_cleanup(
+        gmail_client,
+        policy=policy,
+        attribution=args.attribution,
+        preferences=preferences,
+        query=args.query,
+        threads=args.threads
+    )
+    if summary is None:
+        summary = {'listed': 0, 'approved': 0, 'deleted': 0, 'failed': 0, 'emails_to_delete': []}
+    if args.auto_confirm_max is not None and summary['approved'] >= args.auto_confirm_max:
+        # Listing stopped at the cap, so any further matches were never looked at
+        summary['considered_first'] = args.auto_confirm_max
+        print(f"ℹ️  Only the first {args.auto_confirm_max} matches were considered (--auto-confirm-max)")
+
+    exit_code = 1 if summary.get('errors') else 0
+    return exit_code, summary
+
+
+def run_storage_reclaim(args, gmail_client):
+    """Plan (and unless --dry-run, execute) a byte-budget cleanup from the metadata cache"""
+    metadata_cache = MetadataCache()
+    try:
+        print("🔄 Syncing metadata cache...")
+        metadata_cache.sync(gmail_client)
+        plan = plan_reclaim(metadata_cache, args.reclaim, strategy=args.reclaim_strategy,
+                            older_than_days=args.older_than)
+        print_plan(plan)
+        
+        summary = {key: value for key, value in plan.items() if key not in ('ids', 'sizes')}
+        if args.dry_run:
+            print("\n🧪 Dry run - nothing was deleted")
+            summary['emails_to_delete'] = [{'id': msg_id, 'size': plan['sizes'][msg_id]} for msg_id in plan['ids']]
+            return 0, summary
+        
+        summary.update(run_reclaim(gmail_client, metadata_cache, plan))
+        return (1 if summary['failed'] else 0), summary
+    finally:
+        metadata_cache.close()
+
+
+def run_multi_account(args):
+    """Run every configured account and return (exit_code, aggregated summary)"""
+    defaults = {
+        'dry_run': args.dry_run,
+        'max_deletions': args.auto_confirm_max,
+        'max_emails': args.max_emails,
+        'attribution': args.attribution,
+        'threads': args.threads,
+        'query': args.query,
+    }
+    summary = run_accounts(args.accounts, max_workers=args.max_workers,
+                           defaults={key: value for key, value in defaults.items() if value is not None})
+    exit_code = 1 if summary['totals'].get('accounts_failed') else 0
+    return exit_code, summary
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.yes and not args.dry_run:
+        parser.error("refusing to delete without --yes (use --dry-run to preview)")
+
+    # Keep stdout clean for the JSON summary
+    progress_stream = sys.stderr if args.json else sys.stdout
+    try:
+        with contextlib.redirect_stdout(progress_stream):
+            if args.accounts:
+                exit_code, summary = run_multi_account(args)
+            else:
+                exit_code, summary = run(args)
+    except Exception as e:
+        exit_code, summary = 1, {'error': str(e)}
+        print(f"❌ Headless cleanup failed: {e}", file=sys.stderr)
+
+    emails = summary.pop('emails_to_delete', [])
+    if args.list:
+        summary['emails'] = emails.to_dicts() if isinstance(emails, CandidateStore) else emails
+    if isinstance(emails, CandidateStore):
+        emails.close()
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2, default=str)
+        sys.stdout.write("\n")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
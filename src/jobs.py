@@ -0,0 +1,64 @@
+"""
+Background jobs for the web GUI
+
+Long-running Gmail work is submitted here instead of running inside the
+request handler. The handler returns a job id straight away and the page
+polls /jobs/<id> until the result is ready, so the UI stays responsive no
+matter how slow Gmail is.
+"""
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobManager:
+    def __init__(self, max_workers=4, keep_seconds=600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-job')
+        self.keep_seconds = keep_seconds
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Run fn in the background and return its job id"""
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'name': name,
+            'status': 'pending',
+            'result': None,
+            'error': None,
+            'created': time.time(),
+            'finished': None,
+        }
+        with self.lock:
+            self._prune()
+            self.jobs[job_id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job, fn, args, kwargs):
+        job['status'] = 'running'
+        try:
+            job['result'] = fn(*args, **kwargs)
+            job['status'] = 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'error'
+        finally:
+            job['finished'] = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        for job_id in [j for j, job in self.jobs.items() if job['finished'] and job['finished'] < cutoff]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        """Return a snapshot of a job's state, or None if it is unknown"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,220 @@
+"""
+Small local classifier trained from Gemini verdicts
+
+A logistic regression over hashed features: sender address and domain,
+Gmail labels, subject words and the first words of the body, each hashed
+into 2**18 buckets. Training is full-batch Adagrad with NumPy, so a few
+tens of thousands of verdicts train in a second or two and the model file
+is a single .npz of about 1 MB.
+
+The model is only trusted where it is confident. Before it is used, a
+held-out fifth of the verdicts checks how often its confident answers
+agree with Gemini; below MIN_ACCURACY the model is kept but not used.
+"""
+
+import collections
+import os
+import re
+import zlib
+import numpy as np
+from cleanup_criteria import clean_sender_address
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'local_model.npz')
+
+FEATURE_BITS = 18
+BODY_FEATURE_CHARS = 300
+
+# Only probabilities this far from 0.5 are acted on; the rest go to Gemini
+CONFIDENT_PROBABILITY = 0.9
+MIN_SAMPLES = 200
+MIN_ACCURACY = 0.97
+
+_WORD = re.compile(r'[a-z0-9][a-z0-9\'-]{1,30}')
+# Batch tokenizing: the separator between emails comes back as a token of its own
+_ROW_SEPARATOR = '\x00'
+_WORD_OR_ROW = re.compile(_WORD.pattern + '|' + _ROW_SEPARATOR)
+_LABEL_TOKEN = re.compile(r'[^ \x00]+|\x00')
+
+
+def feature_tokens(email_content):
+    """The strings hashed into features, each prefixed with the field it came from"""
+    sender = clean_sender_address(email_content.get('sender', '')).lower()
+    local, _, domain = sender.rpartition('@')
+    tokens = [f's:{sender}', f'd:{domain}', f'u:{local}']
+    tokens.extend(f'l:{label}' for label in email_content.get('labels', []))
+    tokens.extend(f'w:{word}' for word in _WORD.findall(email_content.get('subject', '').lower()))
+    body = (email_content.get('body') or '')[:BODY_FEATURE_CHARS].lower()
+    tokens.extend(f'b:{word}' for word in _WORD.findall(body))
+    return tokens
+
+
+def hash_features(email_content, bits=FEATURE_BITS):
+    """Sorted, de-duplicated feature indices for one email"""
+    return feature_rows([email_content], bits)[0]
+
+
+def _field_ids(prefix, tokens, mask):
+    """Hash ids for a stream of tokens; each distinct token is hashed once"""
+    vocabulary = collections.defaultdict()
+    # Unseen tokens get the next id on first lookup, without leaving C
+    vocabulary.default_factory = vocabulary.__len__
+    token_ids = np.fromiter(map(vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    table = np.fromiter((zlib.crc32(f'{prefix}{token}'.encode()) & mask for token in vocabulary),
+                        dtype=np.int64, count=len(vocabulary))
+    return table[token_ids]
+
+
+def _split_rows(prefix, texts, pattern, mask):
+    """
+    Tokenize and hash many strings with one regex pass over their
+    concatenation. Returns (indices, row_ids); no token can span the separator.
+    """
+    tokens = pattern.findall(_ROW_SEPARATOR.join(texts))
+    boundaries = np.fromiter(map(_ROW_SEPARATOR.__eq__, tokens), dtype=bool, count=len(tokens))
+    keep = ~boundaries
+    return _field_ids(prefix, tokens, mask)[keep], np.cumsum(boundaries)[keep]
+
+
+def feature_rows(contents, bits=FEATURE_BITS):
+    """
+    Hash a list of emails into a sparse binary matrix in CSR form, giving
+    the same features as feature_tokens/hash_features per email.
+    Returns (indices, row_ids) where row_ids[i] is the email indices[i] belongs to.
+
+    Each text field is tokenized with one regex pass over the whole batch,
+    and the remaining per-token work is array indexing.
+    """
+    mask = (1 << bits) - 1
+    count = len(contents)
+    senders = [clean_sender_address(content.get('sender', '')).lower() for content in contents]
+    parts = [sender.rpartition('@') for sender in senders]
+    every_row = np.arange(count, dtype=np.int64)
+
+    indices = [
+        _field_ids('s:', senders, mask),
+        _field_ids('d:', [part[2] for part in parts], mask),
+        _field_ids('u:', [part[0] for part in parts], mask),
+    ]
+    row_ids = [every_row, every_row, every_row]
+    streams = (
+        ('l:', [' '.join(content.get('labels', [])) for content in contents], _LABEL_TOKEN),
+        ('w:', [content.get('subject', '').lower() for content in contents], _WORD_OR_ROW),
+        ('b:', [(content.get('body') or '')[:BODY_FEATURE_CHARS].lower() for content in contents], _WORD_OR_ROW),
+    )
+    for prefix, texts, pattern in streams:
+        field_indices, rows = _split_rows(prefix, texts, pattern, mask)
+        indices.append(field_indices)
+        row_ids.append(rows)
+
+    # Binary features: one sort puts rows in order and repeats within a row next to each other
+    keys = (np.concatenate(row_ids) << bits) | np.concatenate(indices)
+    keys.sort()
+    if len(keys):
+        keys = keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+    return keys & mask, keys >> bits
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class LocalModel:
+    def __init__(self, bits=FEATURE_BITS, fingerprint=None):
+        self.bits = bits
+        self.weights = np.zeros(1 << bits, dtype=np.float32)
+        self.bias = 0.0
+        self.fingerprint = fingerprint
+        self.trained_on = 0
+        self.accuracy = 0.0
+        self.coverage = 0.0
+
+    @property
+    def usable(self):
+        return self.trained_on > 0 and self.accuracy >= MIN_ACCURACY
+
+    def score_rows(self, indices, row_ids, count):
+        """Delete probability for each of `count` hashed rows"""
+        logits = np.bincount(row_ids, weights=self.weights[indices], minlength=count) + self.bias
+        return _sigmoid(logits)
+
+    def predict_proba(self, contents):
+        indices, row_ids = feature_rows(contents, self.bits)
+        return self.score_rows(indices, row_ids, len(contents))
+
+    def fit(self, contents, labels, iterations=150, learning_rate=0.5, l2=1e-4):
+        indices, row_ids = feature_rows(contents, self.bits)
+        y = np.asarray(labels, dtype=np.float64)
+        count = len(y)
+        weights = np.zeros(1 << self.bits, dtype=np.float64)
+        squared = np.zeros_like(weights)
+        bias, bias_squared = 0.0, 0.0
+        for _ in range(iterations):
+            logits = np.bincount(row_ids, weights=weights[indices], minlength=count) + bias
+            error = (_sigmoid(logits) - y) / count
+            gradient = np.bincount(indices, weights=error[row_ids], minlength=len(weights)) + l2 * weights
+            squared += gradient ** 2
+            weights -= learning_rate * gradient / (np.sqrt(squared) + 1e-8)
+            bias_gradient = error.sum()
+            bias_squared += bias_gradient ** 2
+            bias -= learning_rate * bias_gradient / (np.sqrt(bias_squared) + 1e-8)
+        self.weights = weights.astype(np.float32)
+        self.bias = float(bias)
+        self.trained_on = count
+        return self
+
+    def evaluate(self, contents, labels, threshold=CONFIDENT_PROBABILITY):
+        """Agreement with the labels on confident predictions, and the share that was confident"""
+        probabilities = self.predict_proba(contents)
+        confident = (probabilities >= threshold) | (probabilities <= 1 - threshold)
+        self.coverage = float(confident.mean()) if len(probabilities) else 0.0
+        if not confident.any():
+            self.accuracy = 0.0
+        else:
+            predicted = probabilities[confident] >= 0.5
+            self.accuracy = float((predicted == np.asarray(labels, dtype=bool)[confident]).mean())
+        return self.accuracy, self.coverage
+
+    def save(self, path=None):
+        path = path or DEFAULT_MODEL_PATH
+        temp_file = f"{path}.tmp.npz"
+        np.savez_compressed(temp_file, weights=self.weights, bias=self.bias, bits=self.bits,
+                            fingerprint=self.fingerprint or '', trained_on=self.trained_on,
+                            accuracy=self.accuracy, coverage=self.coverage)
+        os.replace(temp_file, path)
+
+    @classmethod
+    def load(cls, path=None):
+        """Return the saved model, or None if there is none (or it cannot be read)"""
+        path = path or DEFAULT_MODEL_PATH
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                model = cls(bits=int(data['bits']), fingerprint=str(data['fingerprint']) or None)
+                model.weights = data['weights']
+                model.bias = float(data['bias'])
+                model.trained_on = int(data['trained_on'])
+                model.accuracy = float(data['accuracy'])
+                model.coverage = float(data['coverage'])
+            return model
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Error loading local model: {e}")
+            return None
+
+
+def train_model(verdict_cache, fingerprint, bits=FEATURE_BITS):
+    """
+    Train on the cached verdicts for these settings, holding out every fifth
+    one to measure accuracy. Returns the model, or None with too few verdicts.
+    """
+    samples = verdict_cache.samples(fingerprint)
+    if len(samples) < MIN_SAMPLES:
+        return None
+    train = [sample for i, sample in enumerate(samples) if i % 5]
+    holdout = samples[::5]
+    model = LocalModel(bits=bits, fingerprint=fingerprint)
+    model.fit([content for content, _ in train], [label for _, label in train])
+    model.evaluate([content for content, _ in holdout], [label for _, label in holdout])
+    # Counted as trained on all of them, so retraining waits for genuinely new verdicts
+    model.trained_on = len(samples)
+    return model
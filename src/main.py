@@ -1,83 +1,18 @@
-import os
-import re
-import requests
 from gmail_client import GmailClient
 from config import load_user_preferences
+from cleanup_criteria import build_search_queries, classify_thread
+from rules import compile_rules
+from pipeline import CleanupPipeline
+from attribution import attribute_matches, list_ids
+from message_ids import IdList, IdSet
+from candidate_store import CandidateStore
+from preview import LazyPreview
+from progress import ProgressTracker
 from dotenv import load_dotenv
-import base64
-from email.mime.text import MIMEText
-import time
-from urllib.parse import urlparse, parse_qs
 
 # Load environment variables
 load_dotenv()
 
-def check_content_filtering(gmail_client, email_id, subject, sender, clean_sender, delete_promotional, delete_spam, delete_newsletters):
-    """
-    Check if email should be deleted based on content filtering criteria
-    Returns (should_delete: bool, reason: str)
-    """
-    subject_lower = subject.lower()
-    sender_lower = sender.lower()
-    
-    # Check if email is in Promotional folder/label
-    if delete_promotional:
-        try:
-            # Get email details to check labels (using minimal format for efficiency)
-            message = gmail_client.service.users().messages().get(
-                userId='me', 
-                id=email_id, 
-                format='minimal'
-            ).execute()
-            labels = message.get('labelIds', [])
-            
-            # Check for promotional labels
-            promotional_labels = ['CATEGORY_PROMOTIONS', 'PROMOTIONS']
-            for label in labels:
-                if label in promotional_labels:
-                    return True, "Gmail Promotional folder"
-        except Exception as e:
-            print(f"   ⚠️  Warning: Could not check promotional folder for email {email_id}: {e}")
-    
-    # Spam keywords  
-    spam_keywords = [
-        'viagra', 'casino', 'lottery', 'winner', 'congratulations', 'prize',
-        'free money', 'click here', 'act now', 'urgent', 'limited time only',
-        'no obligation', 'risk free', 'guarantee', 'make money fast'
-    ]
-    
-    # Newsletter indicators
-    newsletter_keywords = [
-        'newsletter', 'weekly update', 'monthly digest', 'subscribe', 'unsubscribe',
-        'mailing list', 'email list', 'bulletin', 'digest', 'update'
-    ]
-    
-    # Newsletter sender patterns
-    newsletter_senders = [
-        'newsletter@', 'noreply@', 'no-reply@', 'updates@', 'news@', 
-        'marketing@', 'promo@', 'offers@', 'notifications@'
-    ]
-    
-    # Check for spam content
-    if delete_spam:
-        for keyword in spam_keywords:
-            if keyword in subject_lower or keyword in sender_lower:
-                return True, f"Spam content detected: '{keyword}'"
-    
-    # Check for newsletters
-    if delete_newsletters:
-        # Check newsletter keywords in subject/sender
-        for keyword in newsletter_keywords:
-            if keyword in subject_lower or keyword in sender_lower:
-                return True, f"Newsletter content detected: '{keyword}'"
-        
-        # Check newsletter sender patterns
-        for pattern in newsletter_senders:
-            if pattern in clean_sender.lower():
-                return True, f"Newsletter sender pattern: '{pattern}'"
-    
-    return False, ""
-
 def main():
     print("🚀 Starting Gmail Cleanup App...")
     
@@ -121,7 +56,13 @@ def main():
     # Check if user wants to start cleanup
     if should_start_cleanup:
         print("✅ Starting email cleanup process...")
-        start_email_cleanup(gmail_client)
+        print(f"📺 Live progress: http://localhost:{web_gui.port}")
+        try:
+            # Reuse whatever the GUI already listed while the settings were being edited
+            prefetched = web_gui.prefetched_candidates(load_user_preferences())
+            start_email_cleanup(gmail_client, progress=web_gui.progress, prefetched=prefetched)
+        finally:
+            web_gui.shutdown()
     else:
         print("❌ Cleanup cancelled by user")
         print("Goodbye!")
@@ -129,207 +70,168 @@ def main():
 
 
 
-def start_email_cleanup(gmail_client):
-    print("📧 Loading user preferences from JSON...")
-    # Load fresh preferences from JSON file
-    USER_PREFERENCES = load_user_preferences()
+def start_email_cleanup(gmail_client, policy=None, attribution=False, preferences=None, query=None, progress=None,
+                        prefetched=None, threads=False):
+    """
+    Find and trash emails matching the saved preferences.
+    With a pre-approved ConfirmationPolicy the run is pipelined and skips the
+    interactive confirmation prompt. With attribution, delete reasons come from
+    per-criterion id queries and no message details are fetched at all.
+    preferences and query override the saved preferences and the query built
+    from them. progress is an optional ProgressTracker updated as the run goes.
+    prefetched is an optional (id -> reasons, id -> metadata) pair listed
+    speculatively for the same preferences; the interactive run then skips
+    listing. With threads, matches are listed, classified and trashed a
+    whole thread at a time.
+    """
+    progress = progress or ProgressTracker()
+    progress.start('listing')
+    try:
+        return run_cleanup(gmail_client, policy, attribution, preferences, query, progress, prefetched, threads)
+    except Exception as e:
+        progress.error(str(e))
+        raise
+    finally:
+        if not progress.is_finished:
+            progress.finish()
+
+def run_cleanup(gmail_client, policy, attribution, preferences, query, progress, prefetched=None, threads=False):
+    if preferences is None:
+        print("📧 Loading user preferences from JSON...")
+        # Load fresh preferences from JSON file
+        USER_PREFERENCES = load_user_preferences()
+    else:
+        USER_PREFERENCES = preferences
     print(f"📋 Loaded preferences: {len(USER_PREFERENCES.get('to_delete_senders', []))} senders to delete")
     
-    # Build Gmail search queries based on user preferences
-    print("📬 Building Gmail search queries based on user preferences...")
-    
-    search_queries = []
-    
-    # 1. Search for emails from specific senders to delete
-    to_delete_senders = USER_PREFERENCES.get('to_delete_senders', [])
-    if to_delete_senders:
-        # Build query for specific senders
-        sender_queries = []
-        for sender in to_delete_senders:
-            if '@' in sender:
-                sender_queries.append(f'from:"{sender}"')
-            else:
-                # If it's just a domain, search for emails from that domain
-                sender_queries.append(f'from:"@{sender}"')
-        
-        if sender_queries:
-            sender_query = "(" + " OR ".join(sender_queries) + ")"
-            search_queries.append(sender_query)
-            print(f"🎯 Added sender filter: {len(to_delete_senders)} senders")
-    
-    # 2. Search promotional emails if enabled
-    if USER_PREFERENCES.get('delete_promotional', False):
-        search_queries.append("category:promotions")
-        print("🛍️  Added promotional folder filter")
-    
-    # 3. Search for spam-like emails if enabled
-    if USER_PREFERENCES.get('delete_spam', False):
-        spam_keywords = ['viagra', 'casino', 'lottery', 'winner', 'congratulations', 'prize', 'free money']
-        spam_query = "(" + " OR ".join([f'subject:"{keyword}"' for keyword in spam_keywords]) + ")"
-        search_queries.append(spam_query)
-        print("� Added spam keyword filter")
-    
-    # 4. Search for newsletter emails if enabled  
-    if USER_PREFERENCES.get('delete_newsletters', False):
-        # More specific newsletter patterns to avoid false positives
-        newsletter_query = '(from:"newsletter@" OR from:"unsubscribe@" OR from:"mailings@" OR from:"digest@" OR subject:"newsletter" OR subject:"unsubscribe" OR subject:"weekly digest" OR subject:"monthly update")'
-        search_queries.append(newsletter_query)
-        print("📰 Added newsletter pattern filter (conservative)")
-    
-    # 5. Search for social emails if enabled
-    if USER_PREFERENCES.get('delete_social', False):
-        search_queries.append("category:social")
-        print("👥 Added social folder filter")
+    if query:
+        print(f"📬 Using custom Gmail search query")
+        search_queries = [('query', query)]
+    else:
+        # Build Gmail search queries based on user preferences
+        print("📬 Building Gmail search queries based on user preferences...")
+        search_queries = build_search_queries(USER_PREFERENCES)
     
     if not search_queries:
         print("❌ No filtering criteria enabled - nothing to delete")
         return
     
     # Combine all queries with OR
-    final_query = " OR ".join(search_queries)
+    final_query = " OR ".join(query for _, query in search_queries)
     print(f"🔍 Final Gmail search query: {final_query}")
     
     max_emails = USER_PREFERENCES.get('max_emails_per_run')
+    threads = threads or USER_PREFERENCES.get('thread_mode', False)
+    if policy is not None and policy.max_deletions == 0:
+        print("❌ Deletion cap is 0 - nothing to delete")
+        return
+    if policy is not None and policy.max_deletions is not None and not threads:
+        # Every listed email is a deletion candidate, so nothing past the cap needs listing
+        max_emails = min(max_emails or policy.max_deletions, policy.max_deletions)
     if max_emails:
         print(f"📈 Limiting to {max_emails} emails per run")
     else:
         print("📈 No limit set - will process all matching emails")
     
-    # Get emails using Gmail's native filtering
-    print("📨 Searching emails using Gmail's native filters...")
-    emails = gmail_client.get_emails(query=final_query, max_results=max_emails)
+    if threads:
+        return run_thread_cleanup(gmail_client, final_query, USER_PREFERENCES, policy, max_emails, progress)
+    
+    if attribution or USER_PREFERENCES.get('attribution_mode', False):
+        return run_attributed_cleanup(gmail_client, search_queries, USER_PREFERENCES, policy, max_emails, progress)
+    
+    if policy is not None:
+        return run_pipelined_cleanup(gmail_client, final_query, USER_PREFERENCES, policy, max_emails, progress)
+    
+    reasons = metadata = None
+    if prefetched is not None and prefetched[0] is not None and not query:
+        reasons, metadata = prefetched
+        print(f"⚡ Using {len(reasons)} emails already listed while the settings were being edited")
+        msg_ids = IdList(reasons)
+    else:
+        # Get emails using Gmail's native filtering; only ids are needed, kept as packed integers
+        print("📨 Searching emails using Gmail's native filters...")
+        msg_ids = list_ids(gmail_client, final_query, max_results=max_emails)
     
-    if not emails:
+    if not msg_ids:
         print("✨ No emails found matching the filter criteria!")
         return
     
-    print(f"📊 Found {len(emails)} emails matching filter criteria")
-
-    if not emails:
-        print("📭 No emails found in inbox.")
-        print("💡 This could be because:")
-        print("   - Your inbox is empty")
-        print("   - There was an API error (check above for error messages)")
-        print("   - Your Gmail account has no emails matching the query")
-        return
+    print(f"📊 Found {len(msg_ids)} emails matching filter criteria")
 
     # Since Gmail has already filtered emails based on our search criteria,
-    # all returned emails match our deletion criteria
-    print(f"\n🔄 Analyzing {len(emails)} pre-filtered emails for deletion...")
-    print("💡 All these emails already match your deletion criteria via Gmail search")
-
-    emails_to_delete = []
+    # all returned emails match our deletion criteria. Headers are only
+    # fetched for the preview page being shown, not for every match.
+    progress.increment('listed', len(msg_ids))
+    progress.set_total(len(msg_ids))
+    progress.set_phase('confirm')
+    preview = LazyPreview(gmail_client, msg_ids, USER_PREFERENCES, reasons=reasons, metadata=metadata)
+    print(f"\n📋 FILTERING COMPLETE:")
+    print(f"   📧 Total emails found by Gmail search: {len(msg_ids)}")
+    print(f"   🗑️  Emails queued for deletion: {len(msg_ids)}")
+    print(f"   ✅ All emails matched deletion criteria (Gmail pre-filtered)")
     
-    for i, email in enumerate(emails):
-        try:
-            # Get email details
-            details = gmail_client.get_email_details(msg_id=email['id'])
-            headers = details['payload'].get('headers', [])
-            
-            # Extract sender and subject
-            sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
-            subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-            
-            # Clean up sender (extract email from "Name <email>" format)
-            if '<' in sender and '>' in sender:
-                clean_sender = sender.split('<')[1].split('>')[0].strip()
-            else:
-                clean_sender = sender.strip()
-            
-            # Determine why this email was matched (for display purposes)
-            delete_reason = "Matched Gmail search filters"
-            to_delete_senders = USER_PREFERENCES.get('to_delete_senders', [])
-            
-            if clean_sender in to_delete_senders:
-                delete_reason = f"Sender '{clean_sender}' in delete list"
-            elif '@' in clean_sender:
-                domain = clean_sender.split('@')[1] if '@' in clean_sender else ''
-                if any(clean_sender.endswith(f"@{ds}") or domain == ds for ds in to_delete_senders):
-                    delete_reason = f"Domain '{domain}' in delete list"
-                elif clean_sender.startswith('noreply@') or clean_sender.startswith('no-reply@'):
-                    delete_reason = "Newsletter sender pattern (noreply)"
-                elif clean_sender.startswith('newsletter@') or clean_sender.startswith('unsubscribe@'):
-                    delete_reason = "Newsletter sender pattern"
-                elif clean_sender.startswith('mailings@') or clean_sender.startswith('digest@'):
-                    delete_reason = "Newsletter/Digest sender"
-                elif USER_PREFERENCES.get('delete_promotional', False) and ('promotional' in subject.lower() or 'unsubscribe' in subject.lower()):
-                    delete_reason = "Promotional content in subject"
-                elif USER_PREFERENCES.get('delete_social', False):
-                    # Check if this appears to be a social media notification
-                    social_keywords = ['facebook', 'twitter', 'instagram', 'linkedin', 'snapchat', 'tiktok', 'youtube']
-                    if any(keyword in clean_sender.lower() or keyword in subject.lower() for keyword in social_keywords):
-                        delete_reason = "Social media notification"
+    # Show preview of emails to be deleted, one page at a time
+    page = 0
+    try:
+        while True:
+            print(f"\n📝 EMAILS TO BE DELETED (page {page + 1}/{preview.page_count}):")
+            for i, email_info in enumerate(preview.get_page(page)):
+                number = page * preview.page_size + i + 1
+                print(f"   {number:2d}. {email_info['subject'][:50]}... (from {email_info['sender']}) - {email_info['reason']}")
             
-            # Add to deletion list
-            emails_to_delete.append({
-                'id': email['id'],
-                'sender': clean_sender,
-                'subject': subject,
-                'reason': delete_reason
-            })
+            remaining = len(msg_ids) - (page + 1) * preview.page_size
+            if remaining > 0:
+                print(f"   ... and {remaining} more emails")
             
-            print(f"🗑️  MARKED FOR DELETION: {subject[:60]}... - {delete_reason}")
+            # Confirmation prompt
+            print(f"\n⚠️  WARNING: This will permanently move {len(msg_ids)} emails to trash!")
+            print("   (You can restore them from Gmail's Trash folder if needed)")
             
-            # Progress indicator
-            if (i + 1) % 25 == 0:
-                print(f"--- Processed {i + 1}/{len(emails)} emails ---")
-                
-        except Exception as e:
-            print(f"✗ ERROR processing email {email['id']}: {e}")
-            continue
-
-    # Show filtering results
-    print(f"\n📋 FILTERING COMPLETE:")
-    print(f"   📧 Total emails found by Gmail search: {len(emails)}")
-    print(f"   🗑️  Emails queued for deletion: {len(emails_to_delete)}")
-    print(f"   ✅ All emails matched deletion criteria (Gmail pre-filtered)")
-    
-    if not emails_to_delete:
-        print("\n🎉 No emails match your deletion criteria. Nothing to delete!")
-        return
-    
-    # Show preview of emails to be deleted
-    print(f"\n📝 EMAILS TO BE DELETED:")
-    for i, email_info in enumerate(emails_to_delete[:10]):  # Show first 10
-        print(f"   {i+1:2d}. {email_info['subject'][:50]}... (from {email_info['sender']}) - {email_info['reason']}")
-    
-    if len(emails_to_delete) > 10:
-        print(f"   ... and {len(emails_to_delete) - 10} more emails")
-    
-    # Confirmation prompt
-    print(f"\n⚠️  WARNING: This will permanently move {len(emails_to_delete)} emails to trash!")
-    print("   (You can restore them from Gmail's Trash folder if needed)")
+            if remaining > 0:
+                confirm = input("\n❓ Proceed with deletion? (yes/no/more): ").strip().lower()
+            else:
+                confirm = input("\n❓ Proceed with deletion? (yes/no): ").strip().lower()
+            if confirm in ['more', 'm'] and remaining > 0:
+                page += 1
+                continue
+            break
+    finally:
+        preview.close()
     
-    confirm = input("\n❓ Proceed with deletion? (yes/no): ").strip().lower()
     if confirm not in ['yes', 'y']:
         print("❌ Deletion cancelled by user.")
+        progress.finish('cancelled')
         return
     
     # PHASE 2: Delete all marked emails
-    print(f"\n🗑️  Phase 2: Deleting {len(emails_to_delete)} emails...")
+    print(f"\n🗑️  Phase 2: Deleting {len(msg_ids)} emails...")
+    progress.set_phase('deleting')
     
     deleted_count = 0
     failed_count = 0
     
-    for i, email_info in enumerate(emails_to_delete):
+    for msg_id in msg_ids:
         try:
             # Move to trash
-            gmail_client.service.users().messages().trash(userId='me', id=email_info['id']).execute()
+            gmail_client.service.users().messages().trash(userId='me', id=msg_id).execute()
             deleted_count += 1
+            progress.increment('deleted')
             
             # Show progress every 10 deletions
             if deleted_count % 10 == 0:
-                print(f"   ✓ Deleted {deleted_count}/{len(emails_to_delete)} emails...")
+                print(f"   ✓ Deleted {deleted_count}/{len(msg_ids)} emails...")
                 
         except Exception as delete_error:
             failed_count += 1
-            print(f"   ✗ FAILED to delete: {email_info['subject'][:30]}... - {delete_error}")
+            progress.increment('failed')
+            progress.error(f"{preview.describe(msg_id)}: {delete_error}")
+            print(f"   ✗ FAILED to delete: {preview.describe(msg_id)}... - {delete_error}")
 
     # Final results
     print(f"\n🎉 CLEANUP COMPLETED!")
     print(f"   ✅ Successfully deleted: {deleted_count} emails")
     print(f"   ❌ Failed to delete: {failed_count} emails")
-    print(f"   � Gmail search targeted only matching emails")
+    print(f"   🔍 Gmail search targeted only matching emails")
     
     if deleted_count > 0:
         print(f"\n📧 {deleted_count} emails have been moved to trash.")
@@ -337,5 +239,220 @@ def start_email_cleanup(gmail_client):
     
     print("\n✅ Email cleanup completed!")
 
+def run_pipelined_cleanup(gmail_client, query, preferences, policy, max_emails=None, progress=None):
+    """Run listing, hydration, classification and deletion concurrently"""
+    progress = progress or ProgressTracker()
+    if policy.dry_run:
+        print("🧪 Dry run - emails will be listed and classified but not deleted")
+    elif policy.max_deletions is not None:
+        print(f"✅ Pre-approved deletion of up to {policy.max_deletions} emails")
+    else:
+        print("✅ Pre-approved deletion of all matching emails")
+    
+    # One cheap estimate call gives the progress stream something to compute an ETA from
+    try:
+        estimate = gmail_client.count_emails(query)
+        if policy.max_deletions is not None:
+            estimate = min(estimate, policy.max_deletions)
+        progress.set_total(min(estimate, max_emails) if max_emails else estimate)
+    except Exception as e:
+        print(f"⚠️ Could not estimate match count: {e}")
+    
+    print("🚰 Starting pipelined cleanup (list → hydrate → classify → delete)...")
+    progress.set_phase('running')
+    pipeline = CleanupPipeline(gmail_client, query, preferences, policy, max_results=max_emails,
+                               on_progress=progress.increment)
+    summary = pipeline.run()
+    for error in summary['errors']:
+        progress.error(error)
+    
+    print(f"\n🎉 CLEANUP COMPLETED in {summary['elapsed']:.1f}s!")
+    print(f"   📧 Listed: {summary['listed']} emails")
+    print(f"   🗑️  Approved for deletion: {summary['approved']} emails")
+    print(f"   ✅ Successfully deleted: {summary['deleted']} emails")
+    print(f"   ❌ Failed to delete: {summary['failed']} emails")
+    busy = ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in summary['stage_busy'].items())
+    print(f"   ⏱️  Stage busy time: {busy}")
+    for error in summary['errors']:
+        print(f"   ⚠️  {error}")
+    if summary['listing_incomplete']:
+        print("   ⚠️  Listing failed part way - only the emails listed before the error were processed")
+    
+    summary['emails_to_delete'] = pipeline.emails_to_delete
+    return summary
+
+def run_attributed_cleanup(gmail_client, search_queries, preferences, policy=None, max_emails=None, progress=None):
+    """Plan and run a cleanup from id set membership alone (zero messages.get calls)"""
+    progress = progress or ProgressTracker()
+    print("🏷️  Attribution mode - running each criterion as its own id query...")
+    matches = attribute_matches(gmail_client, search_queries, preferences, max_results=max_emails)
+    
+    if not matches:
+        print("✨ No emails found matching the filter criteria!")
+        return {'listed': 0, 'approved': 0, 'deleted': 0, 'failed': 0, 'emails_to_delete': []}
+    
+    progress.increment('listed', len(matches))
+    emails_to_delete = CandidateStore()
+    for msg_id, reasons in matches.items():
+        email_info = {'id': msg_id, 'sender': '', 'subject': '', 'reason': "; ".join(reasons)}
+        if policy is not None and not policy.approve(email_info, len(emails_to_delete)):
+            continue
+        emails_to_delete.append(email_info)
+    
+    print(f"\n📋 ATTRIBUTION COMPLETE:")
+    print(f"   📧 Total emails matched: {len(matches)}")
+    print(f"   🗑️  Emails queued for deletion: {len(emails_to_delete)}")
+    
+    for reason, count in sorted(matches.reason_counts().items(), key=lambda item: -item[1]):
+        print(f"   • {reason}: {count}")
+    
+    print(f"\n📝 EMAILS TO BE DELETED:")
+    for i, email_info in enumerate(emails_to_delete[:10]):
+        print(f"   {i+1:2d}. message {email_info['id']} - {email_info['reason']}")
+    if len(emails_to_delete) > 10:
+        print(f"   ... and {len(emails_to_delete) - 10} more emails")
+    
+    summary = {
+        'listed': len(matches),
+        'approved': len(emails_to_delete),
+        'deleted': 0,
+        'failed': 0,
+        'emails_to_delete': emails_to_delete,
+    }
+    
+    progress.increment('approved', len(emails_to_delete))
+    progress.set_total(len(emails_to_delete))
+    
+    if policy is None:
+        progress.set_phase('confirm')
+        print(f"\n⚠️  WARNING: This will permanently move {len(emails_to_delete)} emails to trash!")
+        print("   (You can restore them from Gmail's Trash folder if needed)")
+        confirm = input("\n❓ Proceed with deletion? (yes/no): ").strip().lower()
+        if confirm not in ['yes', 'y']:
+            print("❌ Deletion cancelled by user.")
+            progress.finish('cancelled')
+            return summary
+    elif policy.dry_run:
+        print("\n🧪 Dry run - nothing was deleted")
+        return summary
+    
+    print(f"\n🗑️  Deleting {len(emails_to_delete)} emails...")
+    progress.set_phase('deleting')
+    ids = emails_to_delete.ids_list()
+    for start in range(0, len(ids), 500):
+        trashed, failed = gmail_client.batch_trash_emails(ids[start:start + 500])
+        summary['deleted'] += len(trashed)
+        summary['failed'] += len(failed)
+        progress.increment('deleted', len(trashed))
+        if failed:
+            progress.increment('failed', len(failed))
+        print(f"   ✓ Deleted {summary['deleted']}/{len(ids)} emails...")
+    
+    print(f"\n🎉 CLEANUP COMPLETED!")
+    print(f"   ✅ Successfully deleted: {summary['deleted']} emails")
+    print(f"   ❌ Failed to delete: {summary['failed']} emails")
+    print(f"   📡 Message detail requests: 0")
+    return summary
+
+def run_thread_cleanup(gmail_client, query, preferences, policy=None, max_threads=None, progress=None):
+    """List, classify and trash whole threads: one get and one trash call per thread instead of per message"""
+    progress = progress or ProgressTracker()
+    print("🧵 Thread mode - deciding once per conversation...")
+    
+    threads_to_delete = CandidateStore()
+    kept = 0
+    listed = 0
+    messages_listed = 0
+    rules = compile_rules(preferences)
+    for page in gmail_client.iter_thread_pages(query=query, max_results=max_threads,
+                                               fields='threads/id,nextPageToken'):
+        listed += len(page)
+        progress.increment('listed', len(page))
+        details = gmail_client.get_threads_metadata([thread['id'] for thread in page])
+        progress.increment('hydrated', len(details))
+        
+        for thread in page:
+            detail = details.get(thread['id'])
+            if detail is None:
+                progress.error(f"Could not load thread {thread['id']}")
+                continue
+            thread_info = classify_thread(detail, preferences, rules)
+            messages_listed += thread_info['message_count']
+            progress.increment('classified')
+            if thread_info['keep']:
+                kept += 1
+                progress.increment('skipped')
+                continue
+            if policy is not None and not policy.approve(thread_info, len(threads_to_delete)):
+                progress.increment('skipped')
+                continue
+            threads_to_delete.append(thread_info)
+            progress.increment('approved')
+        
+        # Threads can be kept, so the cap can't limit listing up front; stop paging once it's reached
+        if policy is not None and policy.max_deletions is not None and len(threads_to_delete) >= policy.max_deletions:
+            break
+    
+    messages_to_delete = threads_to_delete.message_total()
+    summary = {
+        'listed': listed,
+        'approved': len(threads_to_delete),
+        'deleted': 0,
+        'failed': 0,
+        'kept': kept,
+        'messages_listed': messages_listed,
+        'messages_to_delete': messages_to_delete,
+        'messages_deleted': 0,
+        'emails_to_delete': threads_to_delete,
+    }
+    
+    if not threads_to_delete:
+        print("✨ No threads to delete!")
+        return summary
+    
+    print(f"\n📋 THREAD CLASSIFICATION COMPLETE:")
+    print(f"   🧵 Threads matched: {listed} ({messages_listed} emails, "
+          f"{messages_listed / listed:.1f} per thread)")
+    print(f"   🛡️  Threads kept (sent, draft or starred messages): {kept}")
+    print(f"   🗑️  Threads queued for deletion: {len(threads_to_delete)} ({messages_to_delete} emails)")
+    
+    print(f"\n📝 THREADS TO BE DELETED:")
+    for i, thread_info in enumerate(threads_to_delete[:10]):
+        print(f"   {i+1:2d}. {thread_info['subject'][:50]}... (from {thread_info['sender']}, "
+              f"{thread_info['message_count']} emails) - {thread_info['reason']}")
+    if len(threads_to_delete) > 10:
+        print(f"   ... and {len(threads_to_delete) - 10} more threads")
+    
+    progress.set_total(len(threads_to_delete))
+    if policy is None:
+        progress.set_phase('confirm')
+        print(f"\n⚠️  WARNING: This will move {len(threads_to_delete)} threads ({messages_to_delete} emails) to trash!")
+        print("   (You can restore them from Gmail's Trash folder if needed)")
+        confirm = input("\n❓ Proceed with deletion? (yes/no): ").strip().lower()
+        if confirm not in ['yes', 'y']:
+            print("❌ Deletion cancelled by user.")
+            progress.finish('cancelled')
+            return summary
+    elif policy.dry_run:
+        print("\n🧪 Dry run - nothing was deleted")
+        return summary
+    
+    print(f"\n🗑️  Deleting {len(threads_to_delete)} threads...")
+    progress.set_phase('deleting')
+    trashed, failed = gmail_client.batch_trash_threads(list(threads_to_delete.ids_list()))
+    summary['deleted'] = len(trashed)
+    summary['failed'] = len(failed)
+    summary['messages_deleted'] = threads_to_delete.message_total(IdSet(trashed))
+    progress.increment('deleted', len(trashed))
+    if failed:
+        progress.increment('failed', len(failed))
+    
+    print(f"\n🎉 CLEANUP COMPLETED!")
+    print(f"   ✅ Successfully deleted: {summary['deleted']} threads ({summary['messages_deleted']} emails)")
+    print(f"   ❌ Failed to delete: {summary['failed']} threads")
+    print(f"   📡 Detail and trash calls: {listed + len(threads_to_delete)} "
+          f"(per-message mode would need about {messages_listed + messages_to_delete})")
+    return summary
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,254 @@
+"""
+Compact containers for large sets of Gmail message ids
+
+A Gmail message id is a 64-bit number written in hex without leading zeros
+('18c2f0a9b4e3d1a7'), so it fits in 8 bytes as a uint64 instead of a ~65
+byte str plus a pointer in a list (and ~200 bytes more as a dict).
+
+    IdList     ids in listing order, appended page by page to an array('Q')
+    IdSet      sorted unique ids in a NumPy uint64 array; union is a
+               concatenate + stable sort (timsort merges the two sorted
+               runs in linear time), intersection and difference are
+               searchsorted membership tests against the sorted array
+    IdMatches  id -> reasons for ids matched by several queries, kept as one
+               IdSet per reason; a read-only mapping, so it stands in for
+               the dicts attribution and speculative listing used to build
+
+IdList spills to a temporary file past spill_threshold ids and reads it
+back memory-mapped, so listing millions of messages keeps a flat memory
+profile; IdSet.spill() does the same for a finished set.
+"""
+
+import collections.abc
+import os
+import tempfile
+from array import array
+import numpy as np
+
+# Ids kept in memory before an IdList starts writing them to disk (8 MB)
+SPILL_THRESHOLD = 1_000_000
+# Ids decoded per step when iterating a spilled list
+ITER_CHUNK = 65536
+
+
+def encode(msg_id):
+    """uint64 value of a message id; raises ValueError for an id that is not hex"""
+    return int(msg_id, 16)
+
+
+def decode(value):
+    return format(int(value), 'x')
+
+
+def _sorted_unique(values):
+    values = np.sort(np.asarray(values, dtype=np.uint64), kind='stable')
+    if len(values) > 1:
+        values = values[np.concatenate(([True], values[1:] != values[:-1]))]
+    return values
+
+
+def _member(values, sorted_values):
+    """Which of values occur in sorted_values, as a bool array"""
+    if not len(sorted_values):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_values, values)
+    positions[positions == len(sorted_values)] = 0
+    return sorted_values[positions] == values
+
+
+class IdList(collections.abc.Sequence):
+    """Message ids in the order they were added; indexing and iteration give hex strings"""
+
+    def __init__(self, ids=(), spill_threshold=SPILL_THRESHOLD):
+        self.spill_threshold = spill_threshold
+        self.buffer = array('Q')
+        self.spill_file = None
+        self.spilled = 0
+        self._mapped = None
+        self.extend(ids)
+
+    def append(self, msg_id):
+        self.extend((msg_id,))
+
+    def extend(self, ids):
+        self.buffer.extend(map(encode, ids))
+        if self.spill_threshold and len(self.buffer) >= self.spill_threshold:
+            self._spill()
+
+    def _spill(self):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix='message_ids_')
+        self.spill_file.seek(0, 2)
+        self.buffer.tofile(self.spill_file)
+        self.spill_file.flush()
+        self.spilled += len(self.buffer)
+        self.buffer = array('Q')
+        self._mapped = None
+
+    def _disk(self):
+        if self._mapped is None:
+            self._mapped = np.memmap(self.spill_file, dtype=np.uint64, mode='r', shape=(self.spilled,))
+        return self._mapped
+
+    def values(self):
+        """All ids as one uint64 array (a memory-mapped view when nothing is buffered)"""
+        memory = np.frombuffer(self.buffer, dtype=np.uint64) if self.buffer else np.zeros(0, dtype=np.uint64)
+        if not self.spilled:
+            return memory.copy()
+        return np.concatenate((self._disk(), memory)) if len(memory) else self._disk()
+
+    def __len__(self):
+        return self.spilled + len(self.buffer)
+
+    def _value(self, index):
+        return self._disk()[index] if index < self.spilled else self.buffer[index - self.spilled]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [decode(self._value(i)) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('IdList index out of range')
+        return decode(self._value(index))
+
+    def __iter__(self):
+        for start in range(0, self.spilled, ITER_CHUNK):
+            yield from map(decode, self._disk()[start:start + ITER_CHUNK].tolist())
+        yield from map(decode, self.buffer)
+
+    def to_set(self):
+        return IdSet.from_values(self.values())
+
+    def close(self):
+        self._mapped = None
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+
+class IdSet(collections.abc.Set):
+    """Unique message ids, sorted; iteration runs oldest to newest (Gmail ids grow over time)"""
+
+    def __init__(self, ids=()):
+        self.values = _sorted_unique(np.fromiter(map(encode, ids), dtype=np.uint64))
+
+    @classmethod
+    def from_values(cls, values):
+        return cls._wrap(_sorted_unique(values))
+
+    @classmethod
+    def _wrap(cls, sorted_values):
+        id_set = cls.__new__(cls)
+        id_set.values = sorted_values
+        return id_set
+
+    @classmethod
+    def _from_iterable(cls, ids):
+        return cls(ids)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, msg_id):
+        try:
+            value = np.uint64(encode(msg_id))
+        except (TypeError, ValueError, OverflowError):
+            return False
+        position = np.searchsorted(self.values, value)
+        return position < len(self.values) and self.values[position] == value
+
+    def __iter__(self):
+        for start in range(0, len(self.values), ITER_CHUNK):
+            yield from map(decode, self.values[start:start + ITER_CHUNK].tolist())
+
+    def newest_first(self, limit=None):
+        """Ids from newest to oldest, at most limit of them"""
+        values = self.values[::-1][:limit] if limit else self.values[::-1]
+        return map(decode, values.tolist())
+
+    def newest(self, count):
+        """The count newest ids, as an IdSet"""
+        return IdSet._wrap(self.values[-count:] if count < len(self.values) else self.values)
+
+    def contains_values(self, values):
+        return _member(np.asarray(values, dtype=np.uint64), self.values)
+
+    def union(self, other):
+        return IdSet.from_values(np.concatenate((self.values, other.values)))
+
+    def intersection(self, other):
+        small, large = sorted((self.values, other.values), key=len)
+        return IdSet._wrap(small[_member(small, large)])
+
+    def difference(self, other):
+        return IdSet._wrap(self.values[~_member(self.values, other.values)])
+
+    def __or__(self, other):
+        return self.union(other if isinstance(other, IdSet) else IdSet(other))
+
+    def __and__(self, other):
+        return self.intersection(other if isinstance(other, IdSet) else IdSet(other))
+
+    def __sub__(self, other):
+        return self.difference(other if isinstance(other, IdSet) else IdSet(other))
+
+    def spill(self, directory=None):
+        """Move the ids to a temporary file and memory-map them; returns self"""
+        with tempfile.NamedTemporaryFile(prefix='message_ids_', suffix='.npy', dir=directory,
+                                         delete=False) as handle:
+            np.save(handle, self.values)
+        self.values = np.load(handle.name, mmap_mode='r')
+        try:
+            # The mapping outlives the name on POSIX; elsewhere the file stays until exit
+            os.unlink(handle.name)
+        except OSError:
+            pass
+        return self
+
+
+class IdMatches(collections.abc.Mapping):
+    """
+    Message id -> list of reasons it matched, for the union of several id
+    queries. Iteration runs newest first, like a Gmail listing.
+    """
+
+    def __init__(self):
+        self.by_reason = {}
+        self.ids = IdSet()
+
+    def add(self, reason, ids):
+        ids = ids if isinstance(ids, IdSet) else (ids.to_set() if isinstance(ids, IdList) else IdSet(ids))
+        known = self.by_reason.get(reason)
+        self.by_reason[reason] = ids if known is None else known | ids
+        self.ids = self.ids | ids
+
+    def __getitem__(self, msg_id):
+        if msg_id not in self.ids:
+            raise KeyError(msg_id)
+        return [reason for reason, ids in self.by_reason.items() if msg_id in ids]
+
+    def __contains__(self, msg_id):
+        return msg_id in self.ids
+
+    def __iter__(self):
+        return self.ids.newest_first()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def limit(self, count):
+        """The count newest matches"""
+        if not count or len(self) <= count:
+            return self
+        limited = IdMatches()
+        kept = self.ids.newest(count)
+        for reason, ids in self.by_reason.items():
+            ids = ids & kept
+            if ids:
+                limited.add(reason, ids)
+        return limited
+
+    def reason_counts(self):
+        """Matches per reason (an id matched for two reasons counts for both)"""
+        return {reason: len(ids) for reason, ids in self.by_reason.items()}
@@ -0,0 +1,452 @@
+"""
+Local cache of Gmail message metadata
+
+Sender, subject, labels, date and sizeEstimate for every message are kept in
+a SQLite database next to the token, together with per-sender and per-domain
+aggregates that are updated incrementally as messages are added or removed.
+The first sync lists the whole mailbox; later syncs replay the Gmail history
+since the last one, so keeping 500k messages current costs a few calls
+instead of a full re-scan.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from cleanup_criteria import clean_sender_address, get_header
+from message_ids import IdList, IdSet, decode
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'metadata_cache.db')
+
+# Messages with these labels are not part of the mailbox for cleanup purposes
+EXCLUDED_LABELS = ('TRASH', 'SPAM')
+
+SORT_COLUMNS = {
+    'count': 'count',
+    'size': 'total_size',
+    'newest': 'newest',
+    'oldest': 'oldest',
+    'name': 'key',
+}
+
+HYDRATE_CHUNK = 500
+# SQLite limits bound parameters per statement
+SQL_CHUNK = 900
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    thread_id TEXT,
+    sender TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    subject TEXT,
+    labels TEXT,
+    internal_date INTEGER,
+    size_estimate INTEGER
+);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages(sender);
+CREATE INDEX IF NOT EXISTS messages_domain ON messages(domain);
+CREATE INDEX IF NOT EXISTS messages_size ON messages(size_estimate);
+CREATE TABLE IF NOT EXISTS sender_stats (
+    key TEXT PRIMARY KEY,
+    domain TEXT,
+    count INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    newest INTEGER,
+    oldest INTEGER
+);
+CREATE INDEX IF NOT EXISTS sender_stats_count ON sender_stats(count);
+CREATE INDEX IF NOT EXISTS sender_stats_size ON sender_stats(total_size);
+CREATE TABLE IF NOT EXISTS domain_stats (
+    key TEXT PRIMARY KEY,
+    domain TEXT,
+    count INTEGER NOT NULL,
+    total_size INTEGER NOT NULL,
+    newest INTEGER,
+    oldest INTEGER
+);
+CREATE INDEX IF NOT EXISTS domain_stats_count ON domain_stats(count);
+CREATE INDEX IF NOT EXISTS domain_stats_size ON domain_stats(total_size);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def message_row(message):
+    """Flatten a Gmail message resource (metadata format) into a cache row"""
+    sender = clean_sender_address(get_header(message, 'From')).lower()
+    domain = sender.split('@')[-1] if '@' in sender else ''
+    labels = message.get('labelIds', [])
+    return (
+        message['id'],
+        message.get('threadId'),
+        sender,
+        domain,
+        get_header(message, 'Subject', ''),
+        ',' + ','.join(labels) + ',',
+        int(message.get('internalDate', 0)),
+        int(message.get('sizeEstimate', 0)),
+    )
+
+
+def row_to_dict(row):
+    return {
+        'id': row[0],
+        'threadId': row[1],
+        'sender': row[2],
+        'domain': row[3],
+        'subject': row[4],
+        'labels': [label for label in (row[5] or '').split(',') if label],
+        'internal_date': row[6],
+        'size_estimate': row[7],
+    }
+
+
+class MetadataCache:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_CACHE_PATH
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # ----- state -----
+
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+    # ----- reads -----
+
+    def missing(self, msg_ids):
+        """Return the ids (in input order) that are not cached yet"""
+        cached = set()
+        with self.lock:
+            for chunk in _chunks(list(msg_ids), SQL_CHUNK):
+                placeholders = ','.join('?' * len(chunk))
+                cached.update(row[0] for row in self.conn.execute(
+                    f'SELECT id FROM messages WHERE id IN ({placeholders})', chunk))
+        return [msg_id for msg_id in msg_ids if msg_id not in cached]
+
+    def get(self, msg_ids):
+        """Return a dict of id -> cached metadata for the ids that are cached"""
+        found = {}
+        with self.lock:
+            for chunk in _chunks(list(msg_ids), SQL_CHUNK):
+                placeholders = ','.join('?' * len(chunk))
+                for row in self.conn.execute(f'SELECT * FROM messages WHERE id IN ({placeholders})', chunk):
+                    found[row[0]] = row_to_dict(row)
+        return found
+
+    def hydrate(self, gmail_client, msg_ids):
+        """Read-through lookup: fetch uncached ids from Gmail, cache them and return all"""
+        missing = self.missing(msg_ids)
+        for chunk in _chunks(missing, HYDRATE_CHUNK):
+            messages = gmail_client.get_emails_metadata(chunk, headers=('From', 'Subject'))
+            self.add_messages(messages.values())
+        return self.get(msg_ids)
+
+    def sender_stats(self, group='sender', sort='count', order='desc', offset=0, limit=50, search=''):
+        """
+        Page through per-sender or per-domain aggregates.
+        Returns (total matching rows, list of stat dicts).
+        """
+        table = 'domain_stats' if group == 'domain' else 'sender_stats'
+        column = SORT_COLUMNS.get(sort, 'count')
+        direction = 'ASC' if order == 'asc' else 'DESC'
+        where, params = '', []
+        if search:
+            where = 'WHERE key LIKE ?'
+            params.append(f'%{search.lower()}%')
+
+        with self.lock:
+            total = self.conn.execute(f'SELECT COUNT(*) FROM {table} {where}', params).fetchone()[0]
+            rows = self.conn.execute(
+                f'SELECT key, domain, count, total_size, newest, oldest FROM {table} {where} '
+                f'ORDER BY {column} {direction}, key ASC LIMIT ? OFFSET ?',
+                params + [int(limit), int(offset)]
+            ).fetchall()
+
+        return total, [
+            {'key': r[0], 'domain': r[1], 'count': r[2], 'total_size': r[3], 'newest': r[4], 'oldest': r[5]}
+            for r in rows
+        ]
+
+    def entry_stats(self, entries):
+        """
+        Cached count and total size for delete-list entries (an address or a
+        bare domain). Returns a dict of entry -> {'count', 'total_size'} for
+        the entries the cache knows about.
+        """
+        addresses = [entry for entry in entries if '@' in entry]
+        domains = [entry for entry in entries if '@' not in entry]
+        found = {}
+        with self.lock:
+            for table, keys in (('sender_stats', addresses), ('domain_stats', domains)):
+                for chunk in _chunks(keys, SQL_CHUNK):
+                    placeholders = ','.join('?' * len(chunk))
+                    for key, count, total_size in self.conn.execute(
+                            f'SELECT key, count, total_size FROM {table} WHERE key IN ({placeholders})', chunk):
+                        found[key] = {'count': count, 'total_size': total_size}
+        return found
+
+    def label_stats(self, label):
+        """Cached count and total size of messages carrying a label"""
+        with self.lock:
+            count, total_size = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_estimate), 0) FROM messages WHERE labels LIKE ?',
+                (f'%,{label},%',)
+            ).fetchone()
+        return {'count': count, 'total_size': total_size}
+
+    def matching_ids(self, senders=(), labels=(), limit=None, exclude_labels=()):
+        """
+        Ids of cached messages from any of the delete-list entries (an
+        address or a bare domain) or carrying any of the labels, and none
+        of exclude_labels, newest first - the local answer to the Gmail
+        query for those entries or labels.
+        """
+        where, params = [], []
+        for column, keys in (('sender', [s.lower() for s in senders if '@' in s]),
+                             ('domain', [s.lower() for s in senders if '@' not in s])):
+            for chunk in _chunks(keys, SQL_CHUNK):
+                where.append(f'{column} IN ({",".join("?" * len(chunk))})')
+                params.extend(chunk)
+        for label in labels:
+            where.append('labels LIKE ?')
+            params.append(f'%,{label},%')
+        if not where:
+            return []
+        where = [f'({" OR ".join(where)})']
+        for label in exclude_labels:
+            where.append('labels NOT LIKE ?')
+            params.append(f'%,{label},%')
+        sql = f'SELECT id FROM messages WHERE {" AND ".join(where)} ORDER BY internal_date DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self.lock:
+            return [row[0] for row in self.conn.execute(sql, params)]
+
+    def reclaim_candidates(self, min_size=0, older_than=None, exclude_labels=(), page_size=1000):
+        """
+        Yield (id, sender, size_estimate) largest first, skipping messages
+        newer than older_than (epoch ms) or carrying an excluded label. Rows
+        are read a page at a time, so a planner that stops early never reads
+        the rest.
+        """
+        where, params = ['size_estimate >= ?'], [int(min_size)]
+        if older_than is not None:
+            where.append('internal_date <= ?')
+            params.append(int(older_than))
+        for label in exclude_labels:
+            where.append('labels NOT LIKE ?')
+            params.append(f'%,{label},%')
+
+        last = None
+        while True:
+            page_where, page_params = list(where), list(params)
+            if last is not None:
+                # Keyset pagination on (size, id) keeps each page an index range scan
+                page_where.append('(size_estimate, id) < (?, ?)')
+                page_params.extend(last)
+            with self.lock:
+                rows = self.conn.execute(
+                    f'SELECT id, sender, size_estimate FROM messages WHERE {" AND ".join(page_where)} '
+                    f'ORDER BY size_estimate DESC, id DESC LIMIT ?',
+                    page_params + [page_size]
+                ).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][2], rows[-1][0])
+
+    # ----- writes -----
+
+    def add_messages(self, messages):
+        """Cache new messages and fold them into the sender/domain aggregates"""
+        rows = [message_row(m) for m in messages
+                if not any(label in m.get('labelIds', []) for label in EXCLUDED_LABELS)]
+        if not rows:
+            return 0
+
+        with self.lock, self.conn:
+            new_ids = set(self.missing([row[0] for row in rows]))
+            rows = [row for row in rows if row[0] in new_ids]
+            self.conn.executemany('INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+            for table, key_index in (('sender_stats', 2), ('domain_stats', 3)):
+                deltas = {}
+                for row in rows:
+                    key = row[key_index]
+                    count, size, newest, oldest = deltas.get(key, (0, 0, row[6], row[6]))
+                    deltas[key] = (count + 1, size + row[7], max(newest, row[6]), min(oldest, row[6]))
+                self.conn.executemany(
+                    f'INSERT INTO {table} (key, domain, count, total_size, newest, oldest) '
+                    f'VALUES (?, ?, ?, ?, ?, ?) '
+                    f'ON CONFLICT(key) DO UPDATE SET '
+                    f'count = count + excluded.count, '
+                    f'total_size = total_size + excluded.total_size, '
+                    f'newest = max(newest, excluded.newest), '
+                    f'oldest = min(oldest, excluded.oldest)',
+                    [(key, key.split('@')[-1], *delta) for key, delta in deltas.items()]
+                )
+        return len(rows)
+
+    def remove_messages(self, msg_ids):
+        """Drop messages (trashed, deleted or spammed) and refresh the affected aggregates"""
+        msg_ids = list(msg_ids)
+        if not msg_ids:
+            return 0
+
+        with self.lock, self.conn:
+            senders, domains = set(), set()
+            removed = 0
+            for chunk in _chunks(msg_ids, SQL_CHUNK):
+                placeholders = ','.join('?' * len(chunk))
+                for sender, domain in self.conn.execute(
+                        f'SELECT sender, domain FROM messages WHERE id IN ({placeholders})', chunk):
+                    senders.add(sender)
+                    domains.add(domain)
+                removed += self.conn.execute(f'DELETE FROM messages WHERE id IN ({placeholders})', chunk).rowcount
+
+            # newest/oldest cannot be decremented, so recompute only the touched keys
+            for table, column, keys in (('sender_stats', 'sender', senders), ('domain_stats', 'domain', domains)):
+                for chunk in _chunks(list(keys), SQL_CHUNK):
+                    placeholders = ','.join('?' * len(chunk))
+                    self.conn.execute(f'DELETE FROM {table} WHERE key IN ({placeholders})', chunk)
+                    self.conn.execute(
+                        f'INSERT INTO {table} (key, domain, count, total_size, newest, oldest) '
+                        f'SELECT {column}, domain, COUNT(*), SUM(size_estimate), MAX(internal_date), MIN(internal_date) '
+                        f'FROM messages WHERE {column} IN ({placeholders}) GROUP BY {column}',
+                        chunk
+                    )
+        return removed
+
+    def set_labels(self, msg_id, labels):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE messages SET labels = ? WHERE id = ?', (',' + ','.join(labels) + ',', msg_id))
+
+    # ----- sync -----
+
+    def sync(self, gmail_client, progress=None):
+        """
+        Bring the cache up to date with the mailbox.
+        Replays Gmail history when possible and falls back to a full listing.
+        Returns a dict with added/removed counts and the sync mode used.
+        """
+        from googleapiclient.errors import HttpError
+
+        history_id = self.get_state('history_id')
+        if history_id:
+            try:
+                return self._sync_history(gmail_client, history_id, progress)
+            except HttpError as error:
+                if error.resp.status != 404:
+                    raise
+                print("⚠️ Cached history is too old - doing a full metadata sync")
+        return self._sync_full(gmail_client, progress)
+
+    def _sync_full(self, gmail_client, progress=None):
+        from gmail_client import ListingIncomplete
+
+        started = time.time()
+        profile = gmail_client.get_profile()
+
+        print("🗂️  Listing all messages for the metadata cache...")
+        listed = IdList()
+        incomplete = None
+        try:
+            for page in gmail_client.iter_email_pages(query='', fields='messages/id,nextPageToken', page_size=500):
+                listed.extend(message['id'] for message in page)
+                if progress:
+                    progress.increment('listed', len(page))
+        except ListingIncomplete as error:
+            incomplete = error
+
+        # Set arithmetic on packed ids instead of per-id SQL lookups and Python sets
+        with self.lock:
+            cached = IdSet(row[0] for row in self.conn.execute('SELECT id FROM messages'))
+        listed_values = listed.values()
+        missing = listed_values[~cached.contains_values(listed_values)]
+        print(f"🗂️  {len(listed)} messages listed, {len(missing)} not cached yet")
+        added = 0
+        for start in range(0, len(missing), HYDRATE_CHUNK):
+            chunk = [decode(value) for value in missing[start:start + HYDRATE_CHUNK].tolist()]
+            messages = gmail_client.get_emails_metadata(chunk, headers=('From', 'Subject'))
+            added += self.add_messages(messages.values())
+            if progress:
+                progress.increment('hydrated', len(messages))
+
+        if incomplete is not None:
+            # What was listed is cached, but a partial listing can't tell what left the
+            # mailbox; history_id stays put so the next sync lists everything again
+            listed.close()
+            print(f"⚠️ Listing stopped early - nothing removed from the cache: {incomplete}")
+            raise incomplete
+
+        # Anything cached but no longer listed has left the mailbox
+        removed = self.remove_messages(list(cached - IdSet.from_values(listed_values)))
+        listed.close()
+
+        self.set_state('history_id', profile['historyId'])
+        self.set_state('synced_at', int(time.time()))
+        return {'mode': 'full', 'added': added, 'removed': removed, 'elapsed': time.time() - started}
+
+    def _sync_history(self, gmail_client, history_id, progress=None):
+        started = time.time()
+        profile = gmail_client.get_profile()
+
+        # Replayed in order, keeping only each message's final state: a message
+        # trashed and restored within the window ends up present, not removed
+        present = {}
+        for record in gmail_client.iter_history(history_id):
+            for item in record.get('messagesAdded', []):
+                message = item['message']
+                present[message['id']] = not any(label in message.get('labelIds', []) for label in EXCLUDED_LABELS)
+            for item in record.get('messagesDeleted', []):
+                present[item['message']['id']] = False
+            for key in ('labelsAdded', 'labelsRemoved'):
+                for item in record.get(key, []):
+                    message = item['message']
+                    if any(label in item.get('labelIds', []) for label in EXCLUDED_LABELS):
+                        # Moved to or restored from trash or spam; the message's labels tell which
+                        present[message['id']] = not any(label in message.get('labelIds', [])
+                                                         for label in EXCLUDED_LABELS)
+                    else:
+                        self.set_labels(message['id'], message.get('labelIds', []))
+
+        added_ids = [msg_id for msg_id, is_present in present.items() if is_present]
+        removed = self.remove_messages([msg_id for msg_id, is_present in present.items() if not is_present])
+
+        added = 0
+        for chunk in _chunks(self.missing(added_ids), HYDRATE_CHUNK):
+            messages = gmail_client.get_emails_metadata(chunk, headers=('From', 'Subject'))
+            added += self.add_messages(messages.values())
+            if progress:
+                progress.increment('hydrated', len(messages))
+
+        self.set_state('history_id', profile['historyId'])
+        self.set_state('synced_at', int(time.time()))
+        return {'mode': 'history', 'added': added, 'removed': removed, 'elapsed': time.time() - started}
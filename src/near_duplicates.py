@@ -0,0 +1,202 @@
+"""
+Near-duplicate clustering of templated bulk mail
+
+Promotions and notifications from one sender are mostly the same template
+with a different name, date or price. Each email gets a 64-bit SimHash of
+its normalized subject and body prefix (word bigrams, numbers and links
+masked). Emails from the same sender whose hashes differ in at most
+MAX_DISTANCE bits form a cluster.
+
+Candidates are found with an LSH index: the hash is cut into 4 bands of 16
+bits, and two hashes within 3 bits of each other must agree on at least
+one whole band. Each email is only compared with the cluster leaders that
+share one of its bands.
+
+ClusteredClassifier classifies one representative per cluster and copies
+its verdict to the rest, except for:
+
+    outliers     members whose decision-relevant labels (starred, important,
+                 spam, Gmail category) differ from the representative's
+    spot checks  every SPOT_CHECK_EVERY-th member, classified on its own;
+                 if one disagrees with the representative, the whole
+                 cluster is classified email by email
+"""
+
+import collections
+import hashlib
+import re
+import numpy as np
+from cleanup_criteria import THREAD_KEEP_LABELS, clean_sender_address
+
+MAX_DISTANCE = 3
+BANDS = 4
+BAND_BITS = 64 // BANDS
+BODY_PREFIX_CHARS = 400
+# Below this many words a SimHash says little, so only identical hashes are grouped
+MIN_WORDS = 6
+SPOT_CHECK_EVERY = 20
+CHUNK_SIZE = 5000
+
+OUTLIER_LABELS = THREAD_KEEP_LABELS + ('IMPORTANT', 'SPAM')
+
+_MASKS = [
+    (re.compile(r'(?:https?://|www\.)\S+'), ' '),
+    (re.compile(r'\S+@\S+'), ' '),
+    (re.compile(r'\d+(?:[.,:/-]\d+)*'), ' 0 '),
+]
+_WORD = re.compile(r'\w+')
+
+
+def normalize(email_content):
+    """Lowercased subject and body prefix with links, addresses and numbers masked"""
+    text = f"{email_content.get('subject', '')}\n{(email_content.get('body') or '')[:BODY_PREFIX_CHARS]}".lower()
+    for pattern, replacement in _MASKS:
+        text = pattern.sub(replacement, text)
+    return _WORD.findall(text)
+
+
+def _shingles(words):
+    if len(words) < 2:
+        return words
+    return list(map('{} {}'.format, words, words[1:]))
+
+
+def simhashes(contents):
+    """64-bit SimHash per email as a uint64 array, plus each email's word count"""
+    hashes = np.zeros(len(contents), dtype=np.uint64)
+    word_counts = np.zeros(len(contents), dtype=np.int64)
+    shifts = np.arange(64, dtype=np.uint64)
+    for start in range(0, len(contents), CHUNK_SIZE):
+        vocabulary = collections.defaultdict()
+        vocabulary.default_factory = vocabulary.__len__
+        token_ids, lengths = [], []
+        for i, content in enumerate(contents[start:start + CHUNK_SIZE]):
+            words = normalize(content)
+            word_counts[start + i] = len(words)
+            shingles = _shingles(words)
+            token_ids.extend(map(vocabulary.__getitem__, shingles))
+            lengths.append(len(shingles))
+        count = len(lengths)
+        table = np.frombuffer(b''.join(hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+                                       for shingle in vocabulary), dtype='<u8')
+        token_hashes = table[np.asarray(token_ids, dtype=np.int64)] if token_ids else np.zeros(0, dtype=np.uint64)
+        row_ids = np.repeat(np.arange(count), lengths)
+        # Each bit is set when most of the email's shingles have it set
+        votes = np.stack([np.bincount(row_ids, weights=(token_hashes >> shift) & np.uint64(1), minlength=count)
+                          for shift in shifts], axis=1)
+        bits = (votes * 2 > np.asarray(lengths)[:, None]).astype(np.uint64)
+        hashes[start:start + count] = (bits << shifts).sum(axis=1, dtype=np.uint64)
+    return hashes, word_counts
+
+
+def cluster_emails(contents, max_distance=MAX_DISTANCE):
+    """
+    Group near-duplicate emails from the same sender. Returns a list of
+    clusters (lists of indices into contents), each led by its first email.
+    """
+    hashes, word_counts = simhashes(contents)
+    band_mask = (1 << BAND_BITS) - 1
+    index = collections.defaultdict(list)
+    clusters = []
+    for i, content in enumerate(contents):
+        value = int(hashes[i])
+        limit = max_distance if word_counts[i] >= MIN_WORDS else 0
+        sender = clean_sender_address(content.get('sender', '')).lower()
+        keys = [(sender, band, (value >> (band * BAND_BITS)) & band_mask) for band in range(BANDS)]
+
+        leader = None
+        for key in keys:
+            for cluster_id, leader_value in index[key]:
+                if bin(value ^ leader_value).count('1') <= limit:
+                    leader = cluster_id
+                    break
+            if leader is not None:
+                break
+
+        if leader is None:
+            clusters.append([i])
+            for key in keys:
+                index[key].append((len(clusters) - 1, value))
+        else:
+            clusters[leader].append(i)
+    return clusters
+
+
+def _label_signature(email_content):
+    labels = email_content.get('labels', [])
+    return frozenset(label for label in labels if label in OUTLIER_LABELS or label.startswith('CATEGORY_'))
+
+
+def _deletes(decision):
+    return bool(decision['delete']) and decision['confidence'] > 0.6
+
+
+class ClusteredClassifier:
+    """Wraps a classifier (cascade or engine) so each cluster of near-duplicates costs one classification"""
+
+    def __init__(self, classifier, max_distance=MAX_DISTANCE, spot_check_every=SPOT_CHECK_EVERY):
+        self.classifier = classifier
+        self.max_distance = max_distance
+        self.spot_check_every = spot_check_every
+        self.stats = collections.Counter()
+
+    def classify(self, email_contents, user_preferences):
+        """Decisions in input order"""
+        clusters = cluster_emails(email_contents, self.max_distance)
+        decisions = [None] * len(email_contents)
+
+        # First pass: representatives, outliers and spot checks
+        chosen = []
+        spot_checks = {}
+        for cluster in clusters:
+            leader = cluster[0]
+            chosen.append(leader)
+            signature = _label_signature(email_contents[leader])
+            for position, member in enumerate(cluster[1:], 1):
+                if _label_signature(email_contents[member]) != signature:
+                    chosen.append(member)
+                    self.stats['outliers'] += 1
+                elif position % self.spot_check_every == 0:
+                    chosen.append(member)
+                    spot_checks[member] = leader
+                    self.stats['spot_checks'] += 1
+        self._classify_into(decisions, chosen, email_contents, user_preferences)
+
+        # Clusters whose spot checks disagree with the representative are not trusted
+        distrusted = {leader for member, leader in spot_checks.items()
+                      if _deletes(decisions[member]) != _deletes(decisions[leader])}
+        second_pass = []
+        for cluster in clusters:
+            if len(cluster) > 1:
+                self.stats['clusters'] += 1
+            leader = cluster[0]
+            for member in cluster[1:]:
+                if decisions[member] is not None:
+                    continue
+                if leader in distrusted:
+                    second_pass.append(member)
+                    continue
+                decision = dict(decisions[leader])
+                decision['reason'] = f"{decision['reason']} (near-duplicate of an email already classified)"
+                decision['near_duplicate'] = True
+                decisions[member] = decision
+                self.stats['propagated'] += 1
+        self.stats['distrusted'] += len(distrusted)
+        self._classify_into(decisions, second_pass, email_contents, user_preferences)
+        return decisions
+
+    def _classify_into(self, decisions, indices, email_contents, user_preferences):
+        if not indices:
+            return
+        results = self.classifier.classify([email_contents[i] for i in indices], user_preferences)
+        for i, decision in zip(indices, results):
+            decisions[i] = decision
+        self.stats['classified'] += len(indices)
+
+    def summary(self):
+        stats = self.stats
+        text = (f"{stats['classified']} classified, {stats['propagated']} copied from {stats['clusters']} "
+                f"near-duplicate clusters ({stats['outliers']} outliers, {stats['spot_checks']} spot checks")
+        if stats['distrusted']:
+            text += f", {stats['distrusted']} clusters re-checked email by email"
+        return text + ")"
@@ -0,0 +1,262 @@
+"""
+Pipelined cleanup engine
+
+Listing, hydration, classification and deletion run as concurrent stages
+connected by bounded queues. A full queue blocks the stage feeding it, so a
+slow stage throttles the ones upstream instead of letting work pile up in
+memory. With a pre-approved ConfirmationPolicy deletions start while listing
+is still paging through results, so a run takes roughly as long as its
+slowest stage rather than the sum of all of them.
+"""
+
+import queue
+import threading
+import time
+from candidate_store import CandidateStore
+from cleanup_criteria import clean_sender_address, get_header
+from gmail_client import ListingIncomplete
+from rules import compile_rules
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class ConfirmationPolicy:
+    """
+    Explicit, non-interactive approval for a pipelined cleanup
+
+    max_deletions caps how many emails may be trashed in one run; anything
+    beyond the cap is left alone. With dry_run nothing is trashed at all.
+    """
+
+    def __init__(self, max_deletions=None, dry_run=False):
+        self.max_deletions = max_deletions
+        self.dry_run = dry_run
+
+    def approve(self, email_info, approved_so_far):
+        """Return True if this email may be queued for deletion"""
+        if self.max_deletions is not None and approved_so_far >= self.max_deletions:
+            return False
+        return True
+
+
+class CleanupPipeline:
+    def __init__(self, gmail_client, query, preferences, policy, max_results=None,
+                 queue_size=4, hydrate_workers=2, delete_batch_size=50, on_progress=None):
+        self.gmail_client = gmail_client
+        self.query = query
+        self.preferences = preferences
+        self.rules = compile_rules(preferences)
+        self.policy = policy
+        self.max_results = max_results
+        # Every listed match is a deletion candidate, so nothing past the cap needs listing
+        limits = [limit for limit in (max_results, policy.max_deletions) if limit is not None]
+        self.list_limit = min(limits) if limits else None
+        self.hydrate_workers = hydrate_workers
+        self.delete_batch_size = delete_batch_size
+        self.on_progress = on_progress
+
+        # Each queue holds batches, so queue_size bounds in-flight batches per stage
+        self.hydrate_queue = queue.Queue(maxsize=queue_size)
+        self.classify_queue = queue.Queue(maxsize=queue_size)
+        self.delete_queue = queue.Queue(maxsize=queue_size)
+
+        self.stop_event = threading.Event()
+        # Set once max_deletions emails are approved; listing and hydration stop, deletion drains
+        self.cap_reached = threading.Event()
+        self.lock = threading.Lock()
+        self.emails_to_delete = CandidateStore()
+        self.errors = []
+        self.listing_incomplete = False
+        self.stats = {
+            'listed': 0,
+            'hydrated': 0,
+            'classified': 0,
+            'approved': 0,
+            'skipped': 0,
+            'deleted': 0,
+            'failed': 0,
+        }
+        self.stage_busy = {'list': 0.0, 'hydrate': 0.0, 'classify': 0.0, 'delete': 0.0}
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+        if self.on_progress:
+            self.on_progress(key, amount)
+
+    def _busy(self, stage, started):
+        with self.lock:
+            self.stage_busy[stage] += time.time() - started
+
+    def _put(self, q, item):
+        """Put with backpressure, giving up if the pipeline is stopping"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, stage, error):
+        print(f"❌ Pipeline {stage} stage failed: {error}")
+        with self.lock:
+            self.errors.append(f"{stage}: {error}")
+        self.stop_event.set()
+
+    def _list_stage(self):
+        try:
+            pages = self.gmail_client.iter_email_pages(query=self.query, max_results=self.list_limit)
+            while not self.cap_reached.is_set():
+                started = time.time()
+                page = next(pages, None)
+                self._busy('list', started)
+                if page is None or not self._put(self.hydrate_queue, [m['id'] for m in page]):
+                    break
+                self._count('listed', len(page))
+        except ListingIncomplete as e:
+            # What was listed is still processed; the run reports that it did not see every match
+            print(f"❌ Pipeline list stage stopped early: {e}")
+            with self.lock:
+                self.errors.append(f"list: {e}")
+                self.listing_incomplete = True
+        except Exception as e:
+            self._fail('list', e)
+        finally:
+            # One end marker per hydration worker
+            for _ in range(self.hydrate_workers):
+                self._put(self.hydrate_queue, _DONE)
+
+    def _hydrate_stage(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    ids = self.hydrate_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if ids is _DONE:
+                    break
+                if self.cap_reached.is_set():
+                    continue
+                started = time.time()
+                messages = self.gmail_client.get_emails_metadata(ids)
+                self._busy('hydrate', started)
+                # Keep listing order within the batch
+                batch = [messages[msg_id] for msg_id in ids if msg_id in messages]
+                for msg_id in ids:
+                    if msg_id not in messages:
+                        print(f"✗ ERROR processing email {msg_id}: could not fetch details")
+                if not self._put(self.classify_queue, batch):
+                    break
+                self._count('hydrated', len(batch))
+        except Exception as e:
+            self._fail('hydrate', e)
+        finally:
+            self._put(self.classify_queue, _DONE)
+
+    def _classify_stage(self):
+        pending = []
+        finished_workers = 0
+        try:
+            while finished_workers < self.hydrate_workers and not self.stop_event.is_set():
+                try:
+                    batch = self.classify_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if batch is _DONE:
+                    finished_workers += 1
+                    continue
+
+                started = time.time()
+                for message in batch:
+                    sender = get_header(message, 'From')
+                    subject = get_header(message, 'Subject', 'No Subject')
+                    clean_sender = clean_sender_address(sender)
+                    email_info = {
+                        'id': message['id'],
+                        'sender': clean_sender,
+                        'subject': subject,
+                        'reason': self.rules.delete_reason(clean_sender, subject, message.get('labelIds', []))
+                    }
+                    self._count('classified')
+
+                    if not self.policy.approve(email_info, self.stats['approved']):
+                        self._count('skipped')
+                        continue
+
+                    self.emails_to_delete.append(email_info)
+                    self._count('approved')
+                    if self.policy.max_deletions is not None and self.stats['approved'] >= self.policy.max_deletions:
+                        self.cap_reached.set()
+                    print(f"🗑️  MARKED FOR DELETION: {subject[:60]}... - {email_info['reason']}")
+                    pending.append(email_info['id'])
+
+                    if len(pending) >= self.delete_batch_size:
+                        if not self._put(self.delete_queue, pending):
+                            return
+                        pending = []
+                self._busy('classify', started)
+        except Exception as e:
+            self._fail('classify', e)
+        finally:
+            if pending:
+                self._put(self.delete_queue, pending)
+            self._put(self.delete_queue, _DONE)
+
+    def _delete_stage(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    ids = self.delete_queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if ids is _DONE:
+                    break
+                if self.policy.dry_run:
+                    continue
+
+                started = time.time()
+                trashed, failed = self.gmail_client.batch_trash_emails(ids)
+                self._busy('delete', started)
+                self._count('deleted', len(trashed))
+                if failed:
+                    self._count('failed', len(failed))
+                    print(f"   ✗ FAILED to delete {len(failed)} emails in batch")
+                print(f"   ✓ Deleted {self.stats['deleted']} emails so far...")
+        except Exception as e:
+            self._fail('delete', e)
+
+    def run(self):
+        """Run all stages to completion and return a summary dict"""
+        started = time.time()
+        threads = [threading.Thread(target=self._list_stage, name='cleanup-list')]
+        threads += [
+            threading.Thread(target=self._hydrate_stage, name=f'cleanup-hydrate-{i}')
+            for i in range(self.hydrate_workers)
+        ]
+        threads.append(threading.Thread(target=self._classify_stage, name='cleanup-classify'))
+        threads.append(threading.Thread(target=self._delete_stage, name='cleanup-delete'))
+
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            print("\n⛔ Interrupted - stopping pipeline...")
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        summary = dict(self.stats)
+        summary['elapsed'] = time.time() - started
+        summary['stage_busy'] = dict(self.stage_busy)
+        summary['errors'] = list(self.errors)
+        summary['dry_run'] = self.policy.dry_run
+        summary['capped'] = self.cap_reached.is_set()
+        summary['listing_incomplete'] = self.listing_incomplete
+        return summary
@@ -0,0 +1,109 @@
+"""
+Lazy preview hydration for the confirmation screen
+
+Only the page of candidates that is actually shown gets its headers fetched,
+and the following page is prefetched in the background while the user reads
+the current one. Time to the confirmation prompt no longer grows with the
+number of matched emails.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cleanup_criteria import clean_sender_address, get_header
+from message_ids import IdList
+from rules import compile_rules
+
+
+class LazyPreview:
+    def __init__(self, gmail_client, msg_ids, preferences, page_size=10, reasons=None, metadata=None):
+        self.gmail_client = gmail_client
+        # An IdList is kept as is (packed ids); anything else is copied
+        self.msg_ids = msg_ids if isinstance(msg_ids, IdList) else list(msg_ids)
+        self.preferences = preferences
+        self.rules = compile_rules(preferences)
+        self.page_size = page_size
+        # Optional id -> reason (or list of reasons, e.g. IdMatches from attribution) used instead of header heuristics
+        self.reasons = reasons or {}
+        # Optional id -> message metadata already fetched elsewhere (e.g. by speculative prefetch)
+        self.metadata = metadata or {}
+
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.loaded = {}
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview-prefetch')
+
+    def _reason(self, msg_id):
+        reason = self.reasons.get(msg_id)
+        return "; ".join(reason) if isinstance(reason, list) else reason
+
+    @property
+    def total(self):
+        return len(self.msg_ids)
+
+    @property
+    def page_count(self):
+        return (self.total + self.page_size - 1) // self.page_size
+
+    def _hydrate(self, page):
+        start = page * self.page_size
+        ids = self.msg_ids[start:start + self.page_size]
+        messages = {msg_id: self.metadata[msg_id] for msg_id in ids if msg_id in self.metadata}
+        missing = [msg_id for msg_id in ids if msg_id not in messages]
+        if missing:
+            messages.update(self.gmail_client.get_emails_metadata(missing))
+
+        emails = []
+        for msg_id in ids:
+            message = messages.get(msg_id)
+            if message is None:
+                emails.append({'id': msg_id, 'sender': '', 'subject': '(could not load)',
+                               'reason': self._reason(msg_id) or "Matched Gmail search filters"})
+                continue
+            clean_sender = clean_sender_address(get_header(message, 'From'))
+            subject = get_header(message, 'Subject', 'No Subject')
+            reason = self._reason(msg_id) or self.rules.delete_reason(clean_sender, subject, message.get('labelIds', []))
+            emails.append({'id': msg_id, 'sender': clean_sender, 'subject': subject, 'reason': reason})
+        return emails
+
+    def _future(self, page):
+        with self.lock:
+            if page in self.pages:
+                return None
+            future = self.pending.get(page)
+            if future is None:
+                future = self.executor.submit(self._hydrate, page)
+                self.pending[page] = future
+            return future
+
+    def prefetch(self, page):
+        """Start hydrating a page in the background if it is not loaded yet"""
+        if 0 <= page < self.page_count:
+            self._future(page)
+
+    def get_page(self, page):
+        """Return the hydrated emails for a page, prefetching the next one"""
+        if page < 0 or page >= self.page_count:
+            return []
+
+        future = self._future(page)
+        if future is not None:
+            emails = future.result()
+            with self.lock:
+                self.pages[page] = emails
+                self.pending.pop(page, None)
+                for email_info in emails:
+                    self.loaded[email_info['id']] = email_info
+
+        self.prefetch(page + 1)
+        return self.pages[page]
+
+    def describe(self, msg_id):
+        """Short label for an email, using loaded headers when available"""
+        email_info = self.loaded.get(msg_id)
+        if email_info is not None:
+            return email_info['subject'][:30]
+        return f"message {msg_id}"
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
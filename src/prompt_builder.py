@@ -0,0 +1,135 @@
+"""
+Compact prompts and token accounting for Gemini email classification
+
+The instructions and output format live in one fixed SYSTEM_INSTRUCTION
+shared by every request. Each request carries only what is specific to the
+email: headers, labels, a yes/no for the delete-list check (computed
+locally instead of pasting the whole list) and a body excerpt. The excerpt
+has URLs, quoted replies, signatures and footer boilerplate stripped, and
+is cut to a per-email token budget.
+"""
+
+import re
+import threading
+from rules import rules_for
+
+SYSTEM_INSTRUCTION = """You classify emails for a mailbox cleanup tool.
+Decide whether the email should be deleted given the user's settings.
+Delete: blocked senders, and (when enabled) promotional, spam and newsletter mail.
+Never delete categories the user keeps, or anything personal or transactional that looks important.
+Reply with JSON only: {"delete": bool, "reason": "<= 12 words", "category": "promotional|spam|newsletter|social|personal|work|financial|travel|other", "confidence": 0-1}"""
+
+# Rough size of a token for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+DEFAULT_BODY_TOKENS = 120
+
+_URL = re.compile(r'(?:https?://|www\.)\S+', re.IGNORECASE)
+_EMAIL_ADDRESS = re.compile(r'\S+@\S+\.\w+')
+_QUOTE_HEADER = re.compile(r'^(?:On .{0,200}wrote:|-{2,} ?(?:Original|Forwarded) Message ?-{2,})$',
+                           re.IGNORECASE | re.MULTILINE)
+_SIGNATURE = re.compile(r'^(?:-- ?|__+|Sent from my \w+.*)$', re.MULTILINE)
+_BOILERPLATE = re.compile(
+    r'unsubscribe|view (?:this email )?in (?:your )?browser|privacy policy|all rights reserved|©|'
+    r'manage (?:your )?(?:preferences|subscription)|you are receiving this|no longer wish to receive|'
+    r'update your preferences|terms of (?:use|service)',
+    re.IGNORECASE
+)
+_INVISIBLE = re.compile('[\u200b-\u200f\u2060\ufeff\u00ad\u034f]')
+_WHITESPACE = re.compile(r'[ \t]+')
+_BLANK_LINES = re.compile(r'\n{2,}')
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def compact_body(body, max_tokens=DEFAULT_BODY_TOKENS):
+    """Strip what carries no signal for classification and cut to max_tokens"""
+    text = _INVISIBLE.sub('', body or '')
+
+    # Everything after a quoted reply or signature marker is someone else's text or sign-off
+    for pattern in (_QUOTE_HEADER, _SIGNATURE):
+        match = pattern.search(text)
+        if match and match.start() > 0:
+            text = text[:match.start()]
+
+    text = _URL.sub('', text)
+    text = _EMAIL_ADDRESS.sub('', text)
+    lines = []
+    seen = set()
+    for line in text.splitlines():
+        line = _WHITESPACE.sub(' ', line).strip()
+        # Repeated lines (multi-product layouts, doubled footers) add tokens, not signal
+        if not line or line in seen or line.startswith('>') or _BOILERPLATE.search(line):
+            continue
+        seen.add(line)
+        lines.append(line)
+    text = _BLANK_LINES.sub('\n', '\n'.join(lines))
+
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) > max_chars:
+        # Cut at a word boundary so the model does not see half a word
+        text = text[:max_chars].rsplit(' ', 1)[0] + '…'
+    return text
+
+
+def sender_blocked(sender, preferences):
+    """The delete-list check done locally, so the list never goes into a prompt"""
+    return rules_for(preferences).sender_listed(sender)
+
+
+def build_prompt(email_content, preferences, body_tokens=DEFAULT_BODY_TOKENS):
+    """The per-email part of a classification request"""
+    enabled = [name for key, name in (('delete_promotional', 'promotional'), ('delete_spam', 'spam'),
+                                      ('delete_newsletters', 'newsletters'), ('delete_social', 'social'))
+               if preferences.get(key)]
+    keep = preferences.get('keep_categories', ['personal', 'work', 'financial', 'travel'])
+    lines = [
+        f"Delete: {', '.join(enabled) or 'blocked senders only'}. Keep: {', '.join(keep)}.",
+        f"Sender blocked: {'yes' if sender_blocked(email_content['sender'], preferences) else 'no'}",
+        f"From: {email_content['sender'][:120]}",
+        f"Subject: {email_content['subject'][:200]}",
+    ]
+    # Only labels that say something about the email's kind; INBOX, UNREAD etc. are noise
+    labels = [label for label in email_content.get('labels', [])
+              if label.startswith('CATEGORY_') or label in ('SPAM', 'IMPORTANT', 'STARRED')]
+    if labels:
+        lines.append(f"Labels: {' '.join(labels)}")
+    body = compact_body(email_content.get('body', ''), body_tokens)
+    if body:
+        lines.append(f"Body: {body}")
+    return '\n'.join(lines)
+
+
+class TokenUsage:
+    """Running totals of Gemini calls, tokens and latency (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency = 0.0
+        self.estimated = 0
+
+    def record(self, input_tokens, output_tokens, latency, estimated=False):
+        with self.lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.latency += latency
+            if estimated:
+                self.estimated += 1
+
+    def summary(self):
+        with self.lock:
+            calls = self.calls or 1
+            return {
+                'calls': self.calls,
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'input_tokens_per_email': round(self.input_tokens / calls, 1),
+                'output_tokens_per_email': round(self.output_tokens / calls, 1),
+                'latency_per_email': round(self.latency / calls, 3),
+                'estimated_calls': self.estimated,
+            }
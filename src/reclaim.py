@@ -0,0 +1,157 @@
+"""
+Storage-reclaim planner
+
+Picks messages to trash until a byte budget such as "free 5 GB" is met,
+using the sizeEstimate values already in the metadata cache, so planning
+costs no Gmail calls at all. Two strategies:
+
+    largest  take the biggest messages first. This reaches the target with
+             the fewest messages, and so the fewest trash operations.
+    senders  take whole bulk senders ranked by bytes per message. The
+             result is easier to review, at the cost of a few more
+             messages.
+
+Plans are executed with bulk batchModify trash calls (1000 ids each), so
+the API cost is ceil(messages / 1000) calls either way.
+"""
+
+import math
+import re
+import time
+from gmail_client import GmailClient
+
+# Never plan to trash messages the user marked as worth keeping
+DEFAULT_KEEP_LABELS = ('STARRED', 'IMPORTANT')
+
+SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def parse_size(text):
+    """Parse '5GB', '500 MB', '1.5g' or a plain byte count into bytes"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([kmgt]?)i?b?\s*', str(text).lower())
+    if not match:
+        raise ValueError(f"Invalid size: {text!r} (use e.g. 500MB or 5GB)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def _select_largest(candidates, target_bytes):
+    selected, planned = [], 0
+    for msg_id, sender, size in candidates:
+        if planned >= target_bytes:
+            break
+        selected.append((msg_id, sender, size))
+        planned += size
+    return selected
+
+
+def _select_senders(candidates, target_bytes, min_sender_messages):
+    by_sender = {}
+    for row in candidates:
+        by_sender.setdefault(row[1], []).append(row)
+
+    # Bulk senders only, heaviest per message first
+    groups = [rows for rows in by_sender.values() if len(rows) >= min_sender_messages]
+    groups.sort(key=lambda rows: sum(row[2] for row in rows) / len(rows), reverse=True)
+
+    selected, planned = [], 0
+    for rows in groups:
+        if planned >= target_bytes:
+            break
+        selected.extend(rows)
+        planned += sum(row[2] for row in rows)
+    return selected
+
+
+def plan_reclaim(metadata_cache, target_bytes, strategy='largest', min_size=0, older_than_days=None,
+                 keep_labels=DEFAULT_KEEP_LABELS, min_sender_messages=5):
+    """
+    Build a plan that frees at least target_bytes, or as much as the
+    candidates allow. Returns a dict with the chosen ids, the bytes they
+    free, the number of trash calls needed and the top senders involved.
+    """
+    older_than = None
+    if older_than_days:
+        older_than = int((time.time() - older_than_days * 86400) * 1000)
+    candidates = metadata_cache.reclaim_candidates(min_size=min_size, older_than=older_than,
+                                                   exclude_labels=keep_labels)
+
+    if strategy == 'largest':
+        selected = _select_largest(candidates, target_bytes)
+    elif strategy == 'senders':
+        selected = _select_senders(candidates, target_bytes, min_sender_messages)
+    else:
+        raise ValueError(f"Unknown reclaim strategy: {strategy}")
+
+    planned_bytes = sum(size for _, _, size in selected)
+    api_calls = math.ceil(len(selected) / GmailClient.BULK_MODIFY_SIZE)
+
+    senders = {}
+    for _, sender, size in selected:
+        count, total = senders.get(sender, (0, 0))
+        senders[sender] = (count + 1, total + size)
+    top_senders = sorted(senders.items(), key=lambda item: -item[1][1])[:10]
+
+    return {
+        'strategy': strategy,
+        'target_bytes': target_bytes,
+        'planned_bytes': planned_bytes,
+        'reached': planned_bytes >= target_bytes,
+        'message_count': len(selected),
+        'api_calls': api_calls,
+        'bytes_per_message': planned_bytes // len(selected) if selected else 0,
+        'bytes_per_call': planned_bytes // api_calls if api_calls else 0,
+        'top_senders': [
+            {'sender': sender, 'count': count, 'total_size': total}
+            for sender, (count, total) in top_senders
+        ],
+        'ids': [msg_id for msg_id, _, _ in selected],
+        'sizes': {msg_id: size for msg_id, _, size in selected},
+    }
+
+
+def print_plan(plan):
+    print(f"\n💾 RECLAIM PLAN ({plan['strategy']}):")
+    print(f"   🎯 Target: {format_size(plan['target_bytes'])}")
+    print(f"   📦 Planned: {format_size(plan['planned_bytes'])} from {plan['message_count']} emails "
+          f"({format_size(plan['bytes_per_message'])} per email)")
+    print(f"   📡 Trash calls needed: {plan['api_calls']}")
+    if not plan['reached']:
+        print("   ⚠️  Not enough matching emails in the cache to reach the target")
+    for entry in plan['top_senders']:
+        print(f"   • {entry['sender'] or '(unknown sender)'}: {entry['count']} emails, {format_size(entry['total_size'])}")
+
+
+def run_reclaim(gmail_client, metadata_cache, plan, progress=None):
+    """Trash the planned emails in bulk and drop them from the cache"""
+    ids = plan['ids']
+    print(f"\n🗑️  Trashing {len(ids)} emails in {plan['api_calls']} bulk calls...")
+    if progress is not None:
+        progress.set_total(len(ids))
+        progress.set_phase('deleting')
+
+    summary = {'listed': len(ids), 'approved': len(ids), 'deleted': 0, 'failed': 0, 'reclaimed_bytes': 0}
+    for start in range(0, len(ids), GmailClient.BULK_MODIFY_SIZE):
+        trashed, failed = gmail_client.bulk_trash_emails(ids[start:start + GmailClient.BULK_MODIFY_SIZE])
+        metadata_cache.remove_messages(trashed)
+        summary['deleted'] += len(trashed)
+        summary['failed'] += len(failed)
+        summary['reclaimed_bytes'] += sum(plan['sizes'][msg_id] for msg_id in trashed)
+        if progress is not None:
+            progress.increment('deleted', len(trashed))
+            if failed:
+                progress.increment('failed', len(failed))
+        print(f"   ✓ Trashed {summary['deleted']}/{len(ids)} emails ({format_size(summary['reclaimed_bytes'])})...")
+
+    print(f"\n🎉 RECLAIM COMPLETED!")
+    print(f"   ✅ Trashed: {summary['deleted']} emails ({format_size(summary['reclaimed_bytes'])})")
+    print(f"   ❌ Failed: {summary['failed']} emails")
+    print("   🗓️  Space is freed when the trash is emptied (Gmail does this after 30 days)")
+    return summary
@@ -0,0 +1,198 @@
+"""
+Speculative candidate listing while the user edits preferences
+
+The web GUI can sit open for minutes before Save is pressed. Meanwhile this
+module lists the message ids for the draft preferences in the background,
+one unit per delete-list sender or category toggle. Each edit is diffed
+against the previous units (rules.diff_units) and only the units that are
+new are resolved; units that were dropped are kept for a while so toggling
+something back on costs nothing. Sender and label units are answered from
+the metadata cache when it was synced recently, so those edits cost no
+Gmail calls at all; the cache may be behind the mailbox and matches
+senders a little differently than Gmail's from:, so those answers only
+feed the preview, and a run re-lists them from Gmail before anything is
+trashed. The first preview page is hydrated too, so when the
+user confirms, the candidate set is usually already resolved and the run
+goes straight to the confirmation prompt.
+"""
+
+import collections
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from attribution import CRITERION_REASONS, list_ids
+from cleanup_criteria import sender_query
+from message_ids import IdList, IdMatches, IdSet
+from rules import compile_rules, diff_units, scoped_query
+
+# Longer delete lists are grouped into hash buckets instead of one query per sender
+PER_SENDER_LIMIT = 100
+SENDER_BUCKETS = 64
+
+# A metadata cache synced longer ago than this is not trusted to answer units
+CACHE_MAX_AGE = 3600
+
+
+def speculative_units(preferences, per_sender_limit=PER_SENDER_LIMIT):
+    """
+    Split preferences into independently listable units, keyed by query.
+    Each unit is a dict with the Gmail 'query', the 'reason' shown for its
+    matches, the delete-list 'senders' or 'labels' it stands for (empty
+    when only Gmail can answer it) and the 'exclude_labels' its query leaves
+    out.
+
+    Senders stay in the same unit as the list grows (a bucket is picked by
+    a hash of the address), so adding or removing one sender only changes
+    the unit it lives in.
+    """
+    units = {}
+    rule_units = compile_rules(preferences).units()
+    sender_units = [unit for key, unit in rule_units.items() if key[0] == 'sender']
+    if len(sender_units) <= per_sender_limit:
+        for unit in sender_units:
+            sender = unit['senders'][0]
+            units[unit['query']] = {'reason': f"Sender '{sender}' in delete list", 'senders': [sender],
+                                    'labels': [], 'exclude_labels': unit['exclude_labels']}
+    else:
+        buckets = {}
+        for unit in sender_units:
+            sender = unit['senders'][0]
+            buckets.setdefault(zlib.crc32(sender.encode()) % SENDER_BUCKETS, []).append(sender)
+        exclude = sender_units[0]['exclude_labels']
+        for bucket in sorted(buckets):
+            query = " OR ".join(sender_query(sender) for sender in buckets[bucket])
+            units[scoped_query(f"({query})", exclude)] = {'reason': CRITERION_REASONS['senders'],
+                                                          'senders': buckets[bucket], 'labels': [],
+                                                          'exclude_labels': exclude}
+
+    for key, unit in rule_units.items():
+        if key[0] != 'sender':
+            units[unit['query']] = {'reason': CRITERION_REASONS.get(unit['criterion'], "Matched Gmail search filters"),
+                                    'senders': [], 'labels': unit['labels'], 'exclude_labels': unit['exclude_labels']}
+    for query, unit in units.items():
+        unit['query'] = query
+    return units
+
+
+class SpeculativePrefetch:
+    def __init__(self, gmail_client, max_results=None, preview_size=10, max_workers=2, max_age=300,
+                 metadata_cache=None, cache_max_age=CACHE_MAX_AGE):
+        self.gmail_client = gmail_client
+        self.max_results = max_results
+        self.preview_size = preview_size
+        # Listings older than this are redone before a run uses them
+        self.max_age = max_age
+        self.metadata_cache = metadata_cache
+        self.cache_max_age = cache_max_age
+
+        self.lock = threading.Lock()
+        self.units = {}
+        self.wanted = {}
+        self.metadata = {}
+        # How the last edit changed the units, and how units were resolved so far
+        self.last_diff = {'added': 0, 'removed': 0}
+        self.resolved = collections.Counter()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='speculative')
+
+    def _cache_fresh(self):
+        if self.metadata_cache is None:
+            return False
+        synced_at = self.metadata_cache.get_state('synced_at')
+        return bool(synced_at) and time.time() - int(synced_at) <= self.cache_max_age
+
+    def _list_unit(self, unit):
+        if (unit['senders'] or unit['labels']) and self._cache_fresh():
+            ids = IdList(self.metadata_cache.matching_ids(unit['senders'], unit['labels'], limit=self.max_results,
+                                                          exclude_labels=unit['exclude_labels']))
+            source = 'cache'
+        else:
+            ids = list_ids(self.gmail_client, unit['query'], max_results=self.max_results)
+            source = 'gmail'
+        unit['source'] = source
+        # Warm the headers of the first few matches for the confirmation preview
+        with self.lock:
+            self.resolved[source] += 1
+            missing = [msg_id for msg_id in ids[:self.preview_size] if msg_id not in self.metadata]
+        if missing:
+            messages = self.gmail_client.get_emails_metadata(missing)
+            with self.lock:
+                self.metadata.update(messages)
+        return ids
+
+    def _start(self, spec):
+        unit = dict(spec, started=time.time())
+        unit['future'] = self.executor.submit(self._list_unit, unit)
+        self.units[spec['query']] = unit
+
+    def update(self, preferences):
+        """Start listing units that the new preferences need; cheap enough to call on every edit"""
+        units = speculative_units(preferences)
+        now = time.time()
+        with self.lock:
+            added, removed = diff_units(self.wanted, units)
+            if added or removed:
+                self.last_diff = {'added': len(added), 'removed': len(removed)}
+            for query, spec in units.items():
+                unit = self.units.get(query)
+                # Failed listings are retried, stale ones redone
+                if unit is None or (unit['future'].done() and (unit['future'].exception() is not None
+                                                               or now - unit['started'] > self.max_age)):
+                    self._start(spec)
+            self.wanted = units
+
+            # Forget units that are neither wanted nor fresh
+            for query in [q for q, unit in self.units.items()
+                          if q not in units and now - unit['started'] > self.max_age]:
+                self.units.pop(query)['future'].cancel()
+
+    def status(self):
+        with self.lock:
+            units = [self.units[query] for query in self.wanted if query in self.units]
+            changes = dict(self.last_diff, listed=self.resolved['gmail'], from_cache=self.resolved['cache'])
+        resolved = [unit for unit in units if unit['future'].done() and not unit['future'].exception()]
+        ids = IdSet()
+        for unit in resolved:
+            ids = ids | unit['future'].result().to_set()
+        return dict(changes, units=len(units), resolved=len(resolved), candidates=len(ids))
+
+    def candidates(self, preferences, timeout=None, for_run=False):
+        """
+        Return (id -> reasons as an IdMatches, id -> message metadata) for
+        the preferences, waiting up to timeout for listings still in flight.
+        With for_run the result is what gets trashed, so units answered from
+        the metadata cache are listed again from Gmail first. Returns
+        (None, {}) when any unit failed or did not finish in time, in which
+        case the caller lists from scratch.
+        """
+        self.update(preferences)
+        with self.lock:
+            units = [self.units[query] for query in self.wanted]
+
+        done, pending = wait([unit['future'] for unit in units], timeout=timeout)
+        if pending or any(unit['future'].exception() for unit in units):
+            return None, {}
+
+        if for_run:
+            with self.lock:
+                relist = [unit for unit in units if unit.get('source') == 'cache']
+                for unit in relist:
+                    unit['future'] = self.executor.submit(list_ids, self.gmail_client, unit['query'],
+                                                          max_results=self.max_results)
+                    unit['source'] = 'gmail'
+                self.resolved['gmail'] += len(relist)
+            done, pending = wait([unit['future'] for unit in relist], timeout=timeout)
+            if pending or any(unit['future'].exception() for unit in relist):
+                return None, {}
+
+        matches = IdMatches()
+        for unit in units:
+            matches.add(unit['reason'], unit['future'].result())
+        matches = matches.limit(preferences.get('max_emails_per_run'))
+
+        with self.lock:
+            metadata = {msg_id: message for msg_id, message in self.metadata.items() if msg_id in matches}
+        return matches, metadata
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,556 @@
+// The delete list lives on the server and is fetched a page at a time. Only
+// the rows scrolled into view are rendered, so a list of 20k senders costs
+// about the same as a list of 20.
+const ROW_HEIGHT = 38;
+const PAGE_SIZE = 200;
+const OVERSCAN = 10;
+
+const deleteList = {
+    total: 0,
+    query: '',
+    pages: new Map(),
+    loading: new Set(),
+    generation: 0
+};
+
+// Match-count estimates for delete-list entries and toggles, filled in as they arrive
+const estimates = {senders: new Map(), categories: new Map()};
+const CATEGORIES = ['promotional', 'spam', 'newsletters', 'social'];
+let estimateTimer = null;
+let visibleSenders = [];
+
+function formatEstimate(estimate) {
+    if (!estimate) {
+        return '…';
+    }
+    if (estimate.count === null) {
+        return '?';
+    }
+    let text = '~' + estimate.count + ' emails';
+    if (estimate.total_size) {
+        text += ' · ' + formatBytes(estimate.total_size);
+    }
+    return text;
+}
+
+// Ask for estimates of whatever is on screen once scrolling or typing settles
+function requestEstimates(delay) {
+    clearTimeout(estimateTimer);
+    estimateTimer = setTimeout(() => {
+        fetch('/api/estimates', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({senders: visibleSenders, categories: CATEGORIES,
+                                  protect_personal_mail: document.getElementById('protect-personal-mail').checked})
+        })
+        .then(response => response.json())
+        .then(data => {
+            Object.entries(data.senders || {}).forEach(([sender, estimate]) => estimates.senders.set(sender, estimate));
+            Object.entries(data.categories || {}).forEach(([category, estimate]) => {
+                estimates.categories.set(category, estimate);
+                document.getElementById('estimate-' + category).textContent = '(' + formatEstimate(estimate) + ')';
+            });
+            renderDeleteList();
+            if (data.pending) {
+                requestEstimates(500);
+            }
+        });
+    }, delay === undefined ? 250 : delay);
+}
+
+function updateCounter(count) {
+    document.getElementById('counter').textContent = count + ' emails to delete';
+}
+
+function refreshDeleteList() {
+    deleteList.generation++;
+    deleteList.pages.clear();
+    deleteList.loading.clear();
+    fetchDeleteListPage(0);
+}
+
+function fetchDeleteListPage(page) {
+    if (deleteList.pages.has(page) || deleteList.loading.has(page)) {
+        return;
+    }
+    deleteList.loading.add(page);
+    const generation = deleteList.generation;
+    const params = new URLSearchParams({
+        offset: page * PAGE_SIZE,
+        limit: PAGE_SIZE,
+        q: deleteList.query
+    });
+
+    fetch('/api/delete-list?' + params.toString())
+        .then(response => response.json())
+        .then(data => {
+            // Ignore pages requested before the list was refreshed
+            if (generation !== deleteList.generation) {
+                return;
+            }
+            deleteList.loading.delete(page);
+            deleteList.total = data.total;
+            deleteList.pages.set(page, data.items);
+            updateCounter(data.count);
+            renderDeleteList();
+        });
+}
+
+function renderDeleteList() {
+    const container = document.getElementById('emails-list');
+    const spacer = document.getElementById('emails-spacer');
+    const rows = document.getElementById('emails-rows');
+
+    if (deleteList.total === 0) {
+        spacer.style.height = '0px';
+        // Let the empty-state message take up space in the (otherwise empty) list
+        rows.style.position = 'static';
+        rows.style.transform = '';
+        rows.innerHTML = deleteList.query
+            ? '<div class="empty-state">No matching entries</div>'
+            : '<div class="empty-state">No emails to delete yet<br>Add some email addresses above to get started</div>';
+        return;
+    }
+
+    rows.style.position = '';
+    spacer.style.height = (deleteList.total * ROW_HEIGHT) + 'px';
+    const first = Math.max(0, Math.floor(container.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(deleteList.total, Math.ceil((container.scrollTop + container.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+
+    const html = [];
+    const senders = [];
+    for (let i = first; i < last; i++) {
+        const page = Math.floor(i / PAGE_SIZE);
+        const items = deleteList.pages.get(page);
+        if (!items) {
+            fetchDeleteListPage(page);
+            html.push('<div class="email-item loading"><span>…</span></div>');
+            continue;
+        }
+        const email = items[i - page * PAGE_SIZE];
+        if (email === undefined) {
+            continue;
+        }
+        senders.push(email);
+        html.push(
+            `<div class="email-item">
+                <span>${escapeHtml(email)}</span>
+                <span class="estimate">${formatEstimate(estimates.senders.get(email))}</span>
+                <button data-email="${escapeHtml(email)}">×</button>
+            </div>`
+        );
+    }
+    rows.style.transform = `translateY(${first * ROW_HEIGHT}px)`;
+    rows.innerHTML = html.join('');
+
+    // Only go back to the server when rows without an estimate came into view
+    if (senders.some(sender => !estimates.senders.has(sender)) && senders.join() !== visibleSenders.join()) {
+        visibleSenders = senders;
+        requestEstimates();
+    }
+}
+
+function addEmail() {
+    const input = document.getElementById('email-input');
+    const email = input.value.trim().toLowerCase();
+
+    if (!email) {
+        return;
+    }
+
+    if (!email.includes('@') || !email.includes('.')) {
+        alert('Please enter a valid email address');
+        return;
+    }
+
+    fetch('/add-email', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({email: email})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            refreshDeleteList();
+            input.value = '';
+            input.focus();
+        } else {
+            alert('Error adding email: ' + data.error);
+        }
+    });
+}
+
+function removeEmail(email) {
+    fetch('/remove-email', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({email: email})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            refreshDeleteList();
+        } else {
+            alert('Error removing email: ' + data.error);
+        }
+    });
+}
+
+function importDeleteList(file) {
+    const status = document.getElementById('import-status');
+    status.textContent = 'Importing ' + file.name + '...';
+
+    // The file goes up as-is; the server parses, validates and deduplicates it
+    fetch('/api/delete-list/import', {
+        method: 'POST',
+        headers: {'Content-Type': 'text/plain; charset=utf-8'},
+        body: file
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            status.textContent = 'Import failed: ' + data.error;
+            return;
+        }
+        let message = 'Imported ' + data.added + ' new senders (' + data.duplicates + ' already listed';
+        message += data.invalid ? ', ' + data.invalid + ' invalid rows skipped)' : ')';
+        if (data.invalid_samples.length) {
+            message += ' - e.g. ' + data.invalid_samples.slice(0, 3).join('; ');
+        }
+        status.textContent = message;
+        refreshDeleteList();
+    })
+    .catch(error => {
+        status.textContent = 'Import failed: ' + error;
+    });
+}
+
+// Start a background job on the server and poll until its result is ready
+function runJob(url) {
+    return fetch(url)
+        .then(response => response.json())
+        .then(data => new Promise((resolve, reject) => {
+            function poll() {
+                fetch('/jobs/' + data.job_id)
+                    .then(response => response.json())
+                    .then(job => {
+                        if (job.status === 'done') {
+                            resolve(job.result);
+                        } else if (job.status === 'error') {
+                            reject(new Error(job.error));
+                        } else {
+                            setTimeout(poll, 500);
+                        }
+                    })
+                    .catch(reject);
+            }
+            poll();
+        }));
+}
+
+function loadRecentSenders() {
+    const button = event.target;
+    const originalText = button.textContent;
+    button.textContent = '⏳ Loading...';
+    button.disabled = true;
+
+    runJob('/recent-senders')
+        .then(data => {
+            if (data.senders && data.senders.length > 0) {
+                const selection = prompt(
+                    'Recent senders (will be added to DELETE list):\n\n' + 
+                    data.senders.map((sender, i) => `${i+1}. ${sender}`).join('\n') +
+                    '\n\nEnter numbers to DELETE (e.g., 1,3,5) or type email addresses:'
+                );
+
+                if (selection) {
+                    // Check if it's numbers or email addresses
+                    if (/^[0-9,\s]+$/.test(selection)) {
+                        // Numbers
+                        const numbers = selection.split(',').map(n => parseInt(n.trim()) - 1);
+                        numbers.forEach(index => {
+                            if (index >= 0 && index < data.senders.length) {
+                                addEmailDirectly(data.senders[index]);
+                            }
+                        });
+                    } else {
+                        // Email addresses
+                        const emails = selection.split(',').map(e => e.trim());
+                        emails.forEach(email => {
+                            if (email.includes('@')) {
+                                addEmailDirectly(email);
+                            }
+                        });
+                    }
+                }
+            } else {
+                alert('No recent senders found');
+            }
+
+            button.textContent = originalText;
+            button.disabled = false;
+        })
+        .catch(error => {
+            alert('Error loading recent senders');
+            button.textContent = originalText;
+            button.disabled = false;
+        });
+}
+
+function addEmailDirectly(email) {
+    fetch('/add-email', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({email: email})
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            refreshDeleteList();
+        }
+    });
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+function toggleParams() {
+    return {
+        delete_promotional: document.getElementById('delete-promotional').checked ? '1' : '0',
+        delete_spam: document.getElementById('delete-spam').checked ? '1' : '0',
+        delete_newsletters: document.getElementById('delete-newsletters').checked ? '1' : '0',
+        delete_social: document.getElementById('delete-social').checked ? '1' : '0',
+        protect_personal_mail: document.getElementById('protect-personal-mail').checked ? '1' : '0'
+    };
+}
+
+// Tell the server about toggle edits so it can start listing before Save is pressed
+let prefetchTimer = null;
+function notifyTogglesChanged() {
+    clearTimeout(prefetchTimer);
+    prefetchTimer = setTimeout(() => {
+        fetch('/api/prefetch?' + new URLSearchParams(toggleParams()).toString());
+    }, 300);
+}
+
+function loadPreview(page) {
+    const container = document.getElementById('preview');
+    const params = new URLSearchParams(Object.assign({page: page}, toggleParams()));
+    container.innerHTML = '<div class="help-text">⏳ Loading preview...</div>';
+
+    runJob('/preview?' + params.toString())
+        .then(data => {
+            if (data.error) {
+                container.innerHTML = '<div class="help-text">Error loading preview: ' + escapeHtml(data.error) + '</div>';
+                return;
+            }
+            if (!data.total) {
+                container.innerHTML = '<div class="empty-state">No emails match the current settings</div>';
+                return;
+            }
+            const items = data.emails.map(email =>
+                `<div class="preview-item">${escapeHtml(email.subject)}<br><small>${escapeHtml(email.sender)} - ${escapeHtml(email.reason)}</small></div>`
+            ).join('');
+            const prev = page > 0 ? `<button class="secondary" onclick="loadPreview(${page - 1})">◀ Prev</button>` : '';
+            const next = page + 1 < data.page_count ? `<button class="secondary" onclick="loadPreview(${page + 1})">Next ▶</button>` : '';
+            container.innerHTML = `<div class="counter">Page ${page + 1} of ${data.page_count} • ${data.total} emails match</div>` +
+                `<div class="emails-list">${items}</div>` + prev + next;
+        })
+        .catch(error => {
+            container.innerHTML = '<div class="help-text">Error loading preview: ' + escapeHtml(String(error.message || error)) + '</div>';
+        });
+}
+
+function formatBytes(bytes) {
+    const units = ['B', 'KB', 'MB', 'GB'];
+    let i = 0;
+    while (bytes >= 1024 && i < units.length - 1) {
+        bytes /= 1024;
+        i++;
+    }
+    return bytes.toFixed(i ? 1 : 0) + ' ' + units[i];
+}
+
+function formatDate(ms) {
+    return ms ? new Date(ms).toLocaleDateString() : '';
+}
+
+function loadStats(page) {
+    const params = new URLSearchParams({
+        page: page,
+        page_size: 25,
+        group: document.getElementById('stats-group').value,
+        sort: document.getElementById('stats-sort').value,
+        q: document.getElementById('stats-search').value
+    });
+    fetch('/api/senders?' + params.toString())
+        .then(response => response.json())
+        .then(data => {
+            const container = document.getElementById('stats');
+            if (data.error) {
+                container.innerHTML = '<div class="help-text">Error: ' + escapeHtml(data.error) + '</div>';
+                return;
+            }
+            if (!data.messages_cached) {
+                container.innerHTML = '<div class="empty-state">No metadata cached yet<br>Click "Scan Mailbox" to build it</div>';
+                return;
+            }
+            const rows = data.rows.map(row =>
+                `<tr class="row" onclick="addFromStats('${escapeHtml(row.key)}')">
+                    <td>${escapeHtml(row.key)}</td>
+                    <td class="num">${row.count}</td>
+                    <td class="num">${formatBytes(row.total_size)}</td>
+                    <td>${formatDate(row.newest)}</td>
+                    <td>${formatDate(row.oldest)}</td>
+                </tr>`
+            ).join('');
+            const pages = Math.max(1, Math.ceil(data.total / data.page_size));
+            const prev = page > 0 ? `<button class="secondary" onclick="loadStats(${page - 1})">◀ Prev</button>` : '';
+            const next = page + 1 < pages ? `<button class="secondary" onclick="loadStats(${page + 1})">Next ▶</button>` : '';
+            container.innerHTML = `<table class="stats-table">
+                    <tr><th>Sender</th><th class="num">Emails</th><th class="num">Size</th><th>Newest</th><th>Oldest</th></tr>
+                    ${rows}
+                </table>
+                <div class="counter">Page ${page + 1} of ${pages} • ${data.total} total • ${data.messages_cached} emails scanned</div>` + prev + next;
+        });
+}
+
+function syncStats() {
+    const button = event.target;
+    const originalText = button.textContent;
+    button.textContent = '⏳ Scanning...';
+    button.disabled = true;
+    runJob('/api/senders/sync')
+        .then(result => loadStats(0))
+        .catch(error => alert('Error scanning mailbox: ' + error.message))
+        .finally(() => {
+            button.textContent = originalText;
+            button.disabled = false;
+        });
+}
+
+function addFromStats(key) {
+    if (confirm('Add ' + key + ' to the delete list?')) {
+        addEmailDirectly(key);
+    }
+}
+
+function saveAndStart() {
+    const settings = {
+        delete_promotional: document.getElementById('delete-promotional').checked,
+        delete_spam: document.getElementById('delete-spam').checked,
+        delete_newsletters: document.getElementById('delete-newsletters').checked,
+        delete_social: document.getElementById('delete-social').checked,
+        protect_personal_mail: document.getElementById('protect-personal-mail').checked
+    };
+
+    const button = event.target;
+    const originalText = button.textContent;
+    button.textContent = '💾 Saving...';
+    button.disabled = true;
+
+    fetch('/save-settings', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(settings)
+    })
+    .then(response => {
+        const contentType = response.headers.get('content-type');
+        if (contentType && contentType.includes('text/html')) {
+            // Success - HTML response means settings were saved
+            return response.text().then(html => {
+                document.write(html);
+                document.close();
+            });
+        } else {
+            // Error - JSON response
+            return response.json().then(data => {
+                alert('❌ Error: ' + data.error);
+                button.textContent = originalText;
+                button.disabled = false;
+            });
+        }
+    })
+    .catch(error => {
+        alert('❌ Error: ' + error);
+        button.textContent = originalText;
+        button.disabled = false;
+    });
+}
+
+function cancel() {
+    if (confirm('❌ Cancel email cleanup?')) {
+        fetch('/cancel', {
+            method: 'POST'
+        })
+        .then(response => response.text())
+        .then(html => {
+            document.write(html);
+            document.close();
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            window.close();
+        });
+    }
+}
+
+function loadPreferences() {
+    fetch('/api/preferences')
+        .then(response => response.json())
+        .then(preferences => {
+            document.getElementById('delete-promotional').checked = !!preferences.delete_promotional;
+            document.getElementById('delete-spam').checked = !!preferences.delete_spam;
+            document.getElementById('delete-newsletters').checked = !!preferences.delete_newsletters;
+            document.getElementById('delete-social').checked = !!preferences.delete_social;
+            document.getElementById('protect-personal-mail').checked = !!preferences.protect_personal_mail;
+            requestEstimates(0);
+        });
+}
+
+let searchTimer = null;
+document.getElementById('delete-search').addEventListener('input', function(e) {
+    clearTimeout(searchTimer);
+    searchTimer = setTimeout(() => {
+        deleteList.query = e.target.value.trim().toLowerCase();
+        document.getElementById('emails-list').scrollTop = 0;
+        refreshDeleteList();
+    }, 200);
+});
+
+document.getElementById('emails-list').addEventListener('scroll', () => requestAnimationFrame(renderDeleteList));
+
+// One listener for every row's remove button
+document.getElementById('emails-rows').addEventListener('click', function(e) {
+    if (e.target.dataset.email) {
+        removeEmail(e.target.dataset.email);
+    }
+});
+
+document.getElementById('import-file').addEventListener('change', function(e) {
+    if (e.target.files.length) {
+        importDeleteList(e.target.files[0]);
+    }
+    e.target.value = '';
+});
+
+document.querySelectorAll('.checkbox-group input[type="checkbox"]').forEach(checkbox => {
+    checkbox.addEventListener('change', notifyTogglesChanged);
+});
+// Protection changes every query, so the estimates on screen are recounted
+document.getElementById('protect-personal-mail').addEventListener('change', () => requestEstimates(0));
+
+loadPreferences();
+requestEstimates(0);
+refreshDeleteList();
+loadStats(0);
+
+// Enter key to add email
+document.getElementById('email-input').addEventListener('keypress', function(e) {
+    if (e.key === 'Enter') {
+        addEmail();
+    }
+});
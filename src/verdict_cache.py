@@ -0,0 +1,95 @@
+"""
+Local store of Gemini verdicts
+
+Every email Gemini classifies is kept here (headers, labels, a short body
+prefix and the verdict) so the local model can learn from it. Verdicts are
+keyed by a fingerprint of the settings that shape Gemini's answer: the
+same email can rightly be deleted under one set of toggles and kept under
+another, so only verdicts made under the current settings are used for
+training.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_VERDICT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'verdict_cache.db')
+
+# Enough body text for the model's features; no need to keep whole emails on disk
+BODY_PREFIX_CHARS = 300
+
+# The settings that go into a classification prompt (the delete list is handled by rules, not Gemini)
+PROMPT_SETTINGS = ('delete_promotional', 'delete_spam', 'delete_newsletters', 'delete_social', 'keep_categories')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS verdicts (
+    message_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    sender TEXT,
+    subject TEXT,
+    labels TEXT,
+    body TEXT,
+    verdict INTEGER NOT NULL,
+    category TEXT,
+    confidence REAL,
+    created INTEGER,
+    PRIMARY KEY (message_id, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS verdicts_fingerprint ON verdicts(fingerprint, created);
+'''
+
+
+def preferences_fingerprint(preferences):
+    """Short stable hash of the settings a verdict depends on"""
+    settings = {key: preferences.get(key) for key in PROMPT_SETTINGS}
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+class VerdictCache:
+    def __init__(self, path=None):
+        self.path = path or DEFAULT_VERDICT_PATH
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def add(self, items, fingerprint):
+        """Store (email_content, decision) pairs; the verdict is whether the email would be deleted"""
+        now = int(time.time())
+        rows = [
+            (
+                content['message_id'], fingerprint, content['sender'], content['subject'],
+                ','.join(content.get('labels', [])), (content.get('body') or '')[:BODY_PREFIX_CHARS],
+                int(bool(decision['delete']) and decision['confidence'] > 0.6),
+                decision.get('category'), decision['confidence'], now,
+            )
+            for content, decision in items
+        ]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def count(self, fingerprint):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM verdicts WHERE fingerprint = ?', (fingerprint,)).fetchone()[0]
+
+    def samples(self, fingerprint, limit=50000):
+        """Newest verdicts first, as (email_content, verdict) pairs"""
+        with self.lock:
+            rows = self.conn.execute(
+                'SELECT message_id, sender, subject, labels, body, verdict FROM verdicts '
+                'WHERE fingerprint = ? ORDER BY created DESC LIMIT ?',
+                (fingerprint, int(limit))
+            ).fetchall()
+        return [
+            ({'message_id': r[0], 'sender': r[1], 'subject': r[2],
+              'labels': [label for label in r[3].split(',') if label], 'body': r[4]}, r[5])
+            for r in rows
+        ]
@@ -1,27 +1,104 @@
+import hashlib
 import http.server
-import socketserver
 import webbrowser
 import json
 import os
+import threading
 import time
 from urllib.parse import parse_qs, urlparse
-from config import USER_PREFERENCES, save_user_preferences
+from config import USER_PREFERENCES, PreferencesWriter
+from cleanup_criteria import build_search_queries, clean_sender_address, get_header, normalize_delete_entry, parse_sender_list
+from attribution import list_ids
+from message_ids import IdList
+from preview import LazyPreview
+from jobs import JobManager
+from progress import ProgressTracker
+from metadata_cache import MetadataCache
+from speculative import SpeculativePrefetch
+from estimates import MatchEstimator
+from rules import PROTECT_PREFERENCE
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+_static_cache = {}
+
+TOGGLES = ('delete_promotional', 'delete_spam', 'delete_newsletters', 'delete_social', PROTECT_PREFERENCE)
+
+# Largest sender list accepted by a single import
+MAX_IMPORT_BYTES = 10 * 1024 * 1024
+
+# Seconds between progress events on the /events stream
+SSE_INTERVAL = 0.25
+
+# How long a preview waits for speculative listings before listing from scratch
+PREVIEW_TIMEOUT = 60
 
 should_start_cleanup = False
+# Set once the user has saved or cancelled
+decision_made = threading.Event()
 
 class WebGUIHandler(http.server.BaseHTTPRequestHandler):
     gmail_client = None
     preferences = None
+    jobs = None
+    metadata_cache = None
+    progress = None
+    progress_subscribers = 0
+    # Requests are handled on separate threads, so guard shared preference edits
+    preferences_lock = threading.Lock()
+    # Set mirror of to_delete_senders for O(1) duplicate checks
+    delete_index = None
+    # Coalesces bursts of edits into one atomic write
+    preferences_writer = None
+    # Lists candidates for the settings being edited before Save is pressed
+    prefetcher = None
+    draft_toggles = {}
+    estimator = None
+    # Lazily hydrated preview of the current candidate set and the settings it was built for
+    preview = None
+    preview_key = None
+    preview_lock = threading.Lock()
 
     def log_message(self, format, *args):
         # Suppress server logs
         pass
 
     def do_GET(self):
+        parsed = urlparse(self.path)
         if self.path == '/':
             self.serve_main_page()
         elif self.path == '/recent-senders':
-            self.serve_recent_senders()
+            self.start_job('recent-senders', load_recent_senders, self.gmail_client)
+        elif parsed.path == '/preview':
+            self.start_job('preview', self.build_preview, parse_qs(parsed.query))
+        elif parsed.path.startswith('/jobs/'):
+            self.serve_job(parsed.path[len('/jobs/'):])
+        elif parsed.path == '/api/senders':
+            self.serve_sender_stats(parse_qs(parsed.query))
+        elif self.path == '/api/senders/sync':
+            self.start_job('sync', self.metadata_cache.sync, self.gmail_client)
+        elif parsed.path.startswith('/static/'):
+            self.serve_static(parsed.path[len('/static/'):], parse_qs(parsed.query).get('v', [None])[0])
+        elif parsed.path == '/api/delete-list':
+            self.serve_delete_list(parse_qs(parsed.query))
+        elif parsed.path == '/api/prefetch':
+            self.update_prefetch(self.toggles_from_params(parse_qs(parsed.query)))
+            self.send_json(self.prefetcher.status())
+        elif parsed.path == '/api/delete-list/export':
+            self.serve_delete_list_export(parse_qs(parsed.query))
+        elif self.path == '/api/preferences':
+            self.serve_preferences()
+        elif self.path == '/progress':
+            self.send_response(200)
+            self.send_header('Content-type', 'text/html')
+            self.end_headers()
+            self.wfile.write(load_static('progress.html')[0])
+        elif self.path == '/events':
+            self.serve_events()
         elif self.path == '/close':
             self.handle_close()
         else:
@@ -32,6 +109,10 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
             self.handle_add_email()
         elif self.path == '/remove-email':
             self.handle_remove_email()
+        elif self.path == '/api/estimates':
+            self.handle_estimates()
+        elif self.path == '/api/delete-list/import':
+            self.handle_import_delete_list()
         elif self.path == '/save-settings':
             self.handle_save_settings()
         elif self.path == '/cancel':
@@ -40,456 +121,135 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
             self.send_error(404)
 
     def serve_main_page(self):
-        blocked_emails_html = ""
-        for i, email in enumerate(self.preferences['to_delete_senders']):
-            blocked_emails_html += f'<div class="email-item" data-email="{email}"><span>{email}</span><button onclick="removeEmail(\'{email}\')">×</button></div>'
+        # Assets are referenced by content hash so browsers can cache them indefinitely
+        html = load_static('index.html')[0].decode()
+        html = html.replace('__APP_CSS_VERSION__', load_static('app.css')[1])
+        html = html.replace('__APP_JS_VERSION__', load_static('app.js')[1])
         
-        html = f'''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Gmail Cleanup - Emails to Delete</title>
-    <meta charset="UTF-8">
-    <style>
-        body {{ 
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; 
-            margin: 0; 
-            padding: 20px; 
-            background-color: #f5f7fa; 
-            color: #333;
-        }}
-        .container {{ 
-            max-width: 700px; 
-            margin: 0 auto; 
-            background: white; 
-            padding: 40px; 
-            border-radius: 12px; 
-            box-shadow: 0 4px 20px rgba(0,0,0,0.1); 
-        }}
-        h1 {{ 
-            color: #2c3e50; 
-            text-align: center; 
-            margin-bottom: 30px;
-            font-size: 24px;
-        }}
-        .add-section {{
-            margin: 25px 0;
-            padding: 20px;
-            background-color: #f8f9fa;
-            border-radius: 8px;
-        }}
-        .input-group {{
-            display: flex;
-            gap: 10px;
-            margin-bottom: 15px;
-        }}
-        #email-input {{
-            flex: 1;
-            padding: 12px;
-            border: 2px solid #e1e8ed;
-            border-radius: 6px;
-            font-size: 14px;
-        }}
-        #email-input:focus {{
-            outline: none;
-            border-color: #3498db;
-        }}
-        .add-btn {{
-            padding: 12px 20px;
-            background-color: #e74c3c;
-            color: white;
-            border: none;
-            border-radius: 6px;
-            cursor: pointer;
-            font-size: 14px;
-        }}
-        .add-btn:hover {{
-            background-color: #c0392b;
-        }}
-        .emails-list {{
-            margin: 25px 0;
-            max-height: 300px;
-            overflow-y: auto;
-            border: 1px solid #e1e8ed;
-            border-radius: 6px;
-            background-color: #fafafa;
-        }}
-        .email-item {{
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 10px 15px;
-            border-bottom: 1px solid #e1e8ed;
-            font-family: monospace;
-            font-size: 13px;
-        }}
-        .email-item:last-child {{
-            border-bottom: none;
-        }}
-        .email-item:hover {{
-            background-color: #f1f3f4;
-        }}
-        .email-item button {{
-            background: #e74c3c;
-            color: white;
-            border: none;
-            border-radius: 50%;
-            width: 20px;
-            height: 20px;
-            cursor: pointer;
-            font-size: 12px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }}
-        .email-item button:hover {{
-            background: #c0392b;
-        }}
-        .counter {{
-            text-align: center;
-            color: #7f8c8d;
-            font-size: 14px;
-            margin: 15px 0;
-        }}
-        .empty-state {{
-            text-align: center;
-            color: #95a5a6;
-            padding: 40px;
-            font-style: italic;
-        }}
-        .checkbox-group {{ 
-            margin: 20px 0; 
-            display: flex;
-            gap: 25px;
-            flex-wrap: wrap;
-        }}
-        .checkbox-group label {{ 
-            display: flex;
-            align-items: center;
-            font-size: 14px;
-            cursor: pointer;
-        }}
-        .checkbox-group input[type="checkbox"] {{
-            margin-right: 8px;
-            transform: scale(1.1);
-        }}
-        .button-group {{ 
-            text-align: center; 
-            margin-top: 40px; 
-            padding-top: 30px;
-            border-top: 1px solid #ecf0f1;
-        }}
-        button {{ 
-            padding: 12px 24px; 
-            margin: 8px; 
-            border: none; 
-            border-radius: 6px; 
-            cursor: pointer; 
-            font-size: 14px; 
-            font-weight: 500;
-            transition: all 0.2s ease;
-        }}
-        .success {{ 
-            background-color: #27ae60; 
-            color: white; 
-            font-size: 16px;
-            padding: 15px 30px;
-        }}
-        .success:hover {{
-            background-color: #219a52;
-        }}
-        .danger {{ 
-            background-color: #e74c3c; 
-            color: white; 
-        }}
-        .danger:hover {{
-            background-color: #c0392b;
-        }}
-        .secondary {{
-            background-color: #95a5a6;
-            color: white;
-        }}
-        .secondary:hover {{
-            background-color: #7f8c8d;
-        }}
-        .help-text {{
-            color: #7f8c8d;
-            font-size: 12px;
-            margin: 10px 0;
-        }}
-        .delete-warning {{
-            background-color: #fff3cd;
-            border: 1px solid #ffeaa7;
-            color: #856404;
-            padding: 10px;
-            border-radius: 6px;
-            margin: 15px 0;
-            font-size: 13px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🗑️ Gmail Cleanup - Emails to Delete</h1>
+        self.send_response(200)
+        self.send_header('Content-type', 'text/html')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(html.encode())
+
+    def serve_static(self, name, version=None):
+        try:
+            content, etag = load_static(name)
+        except (FileNotFoundError, ValueError):
+            self.send_error(404)
+            return
         
-        <div class="add-section">
-            <h3>Add Email to Delete</h3>
-            <div class="input-group">
-                <input type="email" id="email-input" placeholder="Enter email address to delete..." autofocus>
-                <button class="add-btn" onclick="addEmail()">🗑️ Add to Delete</button>
-            </div>
-            <button class="secondary" onclick="loadRecentSenders()">📬 Load Recent Senders</button>
-            <div class="help-text">Press Enter to add email • Click on recent senders to add them to delete list</div>
-            <div class="delete-warning">
-                ⚠️ <strong>Warning:</strong> Emails from these senders will be automatically deleted from your inbox.
-            </div>
-        </div>
-
-        <div class="counter" id="counter">{len(self.preferences['to_delete_senders'])} emails to delete</div>
+        if self.headers.get('If-None-Match') == f'"{etag}"':
+            self.send_response(304)
+            self.send_header('ETag', f'"{etag}"')
+            self.end_headers()
+            return
         
-        <div class="emails-list" id="emails-list">
-            {blocked_emails_html if blocked_emails_html else '<div class="empty-state">No emails to delete yet<br>Add some email addresses above to get started</div>'}
-        </div>
-
-        <div class="add-section">
-            <h3>⚙️ Filter Settings</h3>
-            <div class="checkbox-group">
-                <label><input type="checkbox" id="delete-promotional" {"checked" if self.preferences.get('delete_promotional') else ""}> 🛍️ Delete promotional emails</label>
-                <label><input type="checkbox" id="delete-spam" {"checked" if self.preferences.get('delete_spam') else ""}> 🚫 Delete spam emails</label>
-                <label><input type="checkbox" id="delete-newsletters" {"checked" if self.preferences.get('delete_newsletters') else ""}> 📰 Delete newsletters</label>
-                <label><input type="checkbox" id="delete-social" {"checked" if self.preferences.get('delete_social') else ""}> 👥 Delete social emails</label>
-            </div>
-        </div>
-
-        <div class="button-group">
-            <button class="danger" onclick="cancel()">❌ Cancel</button>
-            <button class="success" onclick="saveAndStart()">✅ Save & Start Cleanup</button>
-        </div>
-    </div>
-
-    <script>
-        let emailsToDelete = {json.dumps(self.preferences['to_delete_senders'])};
-
-        function updateCounter() {{
-            document.getElementById('counter').textContent = emailsToDelete.length + ' emails to delete';
-        }}
-
-        function updateEmailsList() {{
-            const container = document.getElementById('emails-list');
-            
-            if (emailsToDelete.length === 0) {{
-                container.innerHTML = '<div class="empty-state">No emails to delete yet<br>Add some email addresses above to get started</div>';
-            }} else {{
-                container.innerHTML = emailsToDelete.map(email => 
-                    `<div class="email-item" data-email="${{email}}">
-                        <span>${{email}}</span>
-                        <button onclick="removeEmail('${{email}}')">×</button>
-                    </div>`
-                ).join('');
-            }}
-            
-            updateCounter();
-        }}
+        self.send_response(200)
+        self.send_header('Content-type', STATIC_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', f'"{etag}"')
+        if version == etag:
+            self.send_header('Cache-Control', 'public, max-age=31536000, immutable')
+        else:
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content)
 
-        function addEmail() {{
-            const input = document.getElementById('email-input');
-            const email = input.value.trim().toLowerCase();
-            
-            if (!email) {{
-                return;
-            }}
-            
-            if (!email.includes('@') || !email.includes('.')) {{
-                alert('Please enter a valid email address');
-                return;
-            }}
-            
-            if (emailsToDelete.includes(email)) {{
-                alert('Email already in delete list');
-                input.value = '';
-                return;
-            }}
-            
-            fetch('/add-email', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{email: email}})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success) {{
-                    emailsToDelete.push(email);
-                    updateEmailsList();
-                    input.value = '';
-                    input.focus();
-                }} else {{
-                    alert('Error adding email: ' + data.error);
-                }}
-            }});
-        }}
-
-        function removeEmail(email) {{
-            if (true) {{
-                fetch('/remove-email', {{
-                    method: 'POST',
-                    headers: {{'Content-Type': 'application/json'}},
-                    body: JSON.stringify({{email: email}})
-                }})
-                .then(response => response.json())
-                .then(data => {{
-                    if (data.success) {{
-                        emailsToDelete = emailsToDelete.filter(e => e !== email);
-                        updateEmailsList();
-                    }} else {{
-                        alert('Error removing email: ' + data.error);
-                    }}
-                }});
-            }}
-        }}
-
-        function loadRecentSenders() {{
-            const button = event.target;
-            const originalText = button.textContent;
-            button.textContent = '⏳ Loading...';
-            button.disabled = true;
-            
-            fetch('/recent-senders')
-                .then(response => response.json())
-                .then(data => {{
-                    if (data.senders && data.senders.length > 0) {{
-                        const selection = prompt(
-                            'Recent senders (will be added to DELETE list):\\n\\n' + 
-                            data.senders.map((sender, i) => `${{i+1}}. ${{sender}}`).join('\\n') +
-                            '\\n\\nEnter numbers to DELETE (e.g., 1,3,5) or type email addresses:'
-                        );
-                        
-                        if (selection) {{
-                            // Check if it's numbers or email addresses
-                            if (/^[0-9,\\s]+$/.test(selection)) {{
-                                // Numbers
-                                const numbers = selection.split(',').map(n => parseInt(n.trim()) - 1);
-                                numbers.forEach(index => {{
-                                    if (index >= 0 && index < data.senders.length) {{
-                                        const email = data.senders[index];
-                                        if (!emailsToDelete.includes(email)) {{
-                                            addEmailDirectly(email);
-                                        }}
-                                    }}
-                                }});
-                            }} else {{
-                                // Email addresses
-                                const emails = selection.split(',').map(e => e.trim());
-                                emails.forEach(email => {{
-                                    if (email.includes('@') && !emailsToDelete.includes(email)) {{
-                                        addEmailDirectly(email);
-                                    }}
-                                }});
-                            }}
-                        }}
-                    }} else {{
-                        alert('No recent senders found');
-                    }}
-                    
-                    button.textContent = originalText;
-                    button.disabled = false;
-                }})
-                .catch(error => {{
-                    alert('Error loading recent senders');
-                    button.textContent = originalText;
-                    button.disabled = false;
-                }});
-        }}
-
-        function addEmailDirectly(email) {{
-            fetch('/add-email', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify({{email: email}})
-            }})
-            .then(response => response.json())
-            .then(data => {{
-                if (data.success) {{
-                    emailsToDelete.push(email);
-                    updateEmailsList();
-                }}
-            }});
-        }}
-
-        function saveAndStart() {{
-            const settings = {{
-                to_delete_senders: emailsToDelete,
-                delete_promotional: document.getElementById('delete-promotional').checked,
-                delete_spam: document.getElementById('delete-spam').checked,
-                delete_newsletters: document.getElementById('delete-newsletters').checked,
-                delete_social: document.getElementById('delete-social').checked
-            }};
-
-            const button = event.target;
-            const originalText = button.textContent;
-            button.textContent = '💾 Saving...';
-            button.disabled = true;
-
-            fetch('/save-settings', {{
-                method: 'POST',
-                headers: {{'Content-Type': 'application/json'}},
-                body: JSON.stringify(settings)
-            }})
-            .then(response => {{
-                const contentType = response.headers.get('content-type');
-                if (contentType && contentType.includes('text/html')) {{
-                    // Success - HTML response means settings were saved
-                    return response.text().then(html => {{
-                        document.write(html);
-                        document.close();
-                    }});
-                }} else {{
-                    // Error - JSON response
-                    return response.json().then(data => {{
-                        alert('❌ Error: ' + data.error);
-                        button.textContent = originalText;
-                        button.disabled = false;
-                    }});
-                }}
-            }})
-            .catch(error => {{
-                alert('❌ Error: ' + error);
-                button.textContent = originalText;
-                button.disabled = false;
-            }});
-        }}
-
-        function cancel() {{
-            if (confirm('❌ Cancel email cleanup?')) {{
-                fetch('/cancel', {{
-                    method: 'POST'
-                }})
-                .then(response => response.text())
-                .then(html => {{
-                    document.write(html);
-                    document.close();
-                }})
-                .catch(error => {{
-                    console.error('Error:', error);
-                    window.close();
-                }});
-            }}
-        }}
-
-        // Enter key to add email
-        document.getElementById('email-input').addEventListener('keypress', function(e) {{
-            if (e.key === 'Enter') {{
-                addEmail();
-            }}
-        }});
-    </script>
-</body>
-</html>
-        '''
+    def serve_delete_list(self, params):
+        """One page of the delete list, optionally filtered by a search string"""
+        try:
+            offset = max(int(params.get('offset', ['0'])[0]), 0)
+            limit = min(max(int(params.get('limit', ['200'])[0]), 1), 1000)
+            query = params.get('q', [''])[0].strip().lower()
+            with self.preferences_lock:
+                senders = self.preferences['to_delete_senders']
+                count = len(senders)
+                matching = [sender for sender in senders if query in sender.lower()] if query else senders
+                response = {
+                    'count': count,
+                    'total': len(matching),
+                    'offset': offset,
+                    'items': matching[offset:offset + limit]
+                }
+        except Exception as e:
+            response = {'items': [], 'count': 0, 'total': 0, 'error': str(e)}
+        self.send_json(response)
+
+    def handle_import_delete_list(self):
+        """Bulk-add senders from a CSV or newline-delimited file posted as the request body"""
+        try:
+            content_length = int(self.headers['Content-Length'])
+            if content_length > MAX_IMPORT_BYTES:
+                response = {'success': False, 'error': f'File too large (limit {MAX_IMPORT_BYTES // (1024 * 1024)} MB)'}
+            else:
+                text = self.rfile.read(content_length).decode('utf-8-sig', errors='replace')
+                entries, invalid = parse_sender_list(text)
+                
+                added = 0
+                with self.preferences_lock:
+                    for entry in entries:
+                        if entry not in self.delete_index:
+                            self.delete_index.add(entry)
+                            self.preferences['to_delete_senders'].append(entry)
+                            added += 1
+                    count = len(self.delete_index)
+                if added:
+                    self.preferences_writer.schedule()
+                    self.update_prefetch()
+                
+                response = {
+                    'success': True,
+                    'added': added,
+                    'duplicates': len(entries) - added,
+                    'invalid': len(invalid),
+                    'invalid_samples': invalid[:10],
+                    'count': count
+                }
+        except Exception as e:
+            response = {'success': False, 'error': str(e)}
+        self.send_json(response)
+
+    def handle_estimates(self):
+        """Match-count and size estimates for the delete-list entries and toggles on screen"""
+        try:
+            content_length = int(self.headers['Content-Length'])
+            data = json.loads(self.rfile.read(content_length).decode())
+            # The page asks for the rows in view; cap it so one request cannot queue the whole list
+            senders = [entry for entry in map(normalize_delete_entry, data.get('senders', [])[:500]) if entry]
+            response = self.estimator.request(senders, data.get('categories', []),
+                                              protect=bool(data.get(PROTECT_PREFERENCE)))
+        except Exception as e:
+            response = {'senders': {}, 'categories': {}, 'pending': 0, 'error': str(e)}
+        self.send_json(response)
+
+    def serve_delete_list_export(self, params):
+        """Download the delete list as CSV (with a header row) or one sender per line"""
+        export_format = params.get('format', ['csv'])[0]
+        with self.preferences_lock:
+            senders = list(self.preferences['to_delete_senders'])
+        
+        if export_format == 'txt':
+            content = ''.join(f'{sender}\n' for sender in senders)
+            content_type = 'text/plain; charset=utf-8'
+        else:
+            export_format = 'csv'
+            content = 'sender\n' + ''.join(f'{sender}\n' for sender in senders)
+            content_type = 'text/csv; charset=utf-8'
+        body = content.encode()
         
         self.send_response(200)
-        self.send_header('Content-type', 'text/html')
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition', f'attachment; filename="delete_senders.{export_format}"')
         self.end_headers()
-        self.wfile.write(html.encode())
+        self.wfile.write(body)
+
+    def serve_preferences(self):
+        with self.preferences_lock:
+            response = {key: value for key, value in self.preferences.items() if key != 'to_delete_senders'}
+            response['to_delete_count'] = len(self.preferences['to_delete_senders'])
+        self.send_json(response)
 
     def handle_add_email(self):
         content_length = int(self.headers['Content-Length'])
@@ -497,15 +257,19 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
         
         try:
             data = json.loads(post_data.decode())
-            email = data['email'].strip().lower()
+            # Bare domains (e.g. from the domain analytics view) delete everything from that domain
+            email = normalize_delete_entry(data['email'])
             
-            if email and '@' in email and email not in self.preferences['to_delete_senders']:
-                self.preferences['to_delete_senders'].append(email)
-                # Save to JSON file immediately
-                success = save_user_preferences(self.preferences)
-                response = {'success': success}
-            else:
-                response = {'success': False, 'error': 'Invalid or duplicate email'}
+            with self.preferences_lock:
+                if email and email not in self.delete_index:
+                    self.delete_index.add(email)
+                    self.preferences['to_delete_senders'].append(email)
+                    response = {'success': True}
+                else:
+                    response = {'success': False, 'error': 'Invalid or duplicate email'}
+            if response['success']:
+                self.preferences_writer.schedule()
+                self.update_prefetch()
             
         except Exception as e:
             response = {'success': False, 'error': str(e)}
@@ -523,13 +287,16 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
             data = json.loads(post_data.decode())
             email = data['email']
             
-            if email in self.preferences['to_delete_senders']:
-                self.preferences['to_delete_senders'].remove(email)
-                # Save to JSON file immediately
-                success = save_user_preferences(self.preferences)
-                response = {'success': success}
-            else:
-                response = {'success': False, 'error': 'Email not found'}
+            with self.preferences_lock:
+                if email in self.delete_index:
+                    self.delete_index.discard(email)
+                    self.preferences['to_delete_senders'].remove(email)
+                    response = {'success': True}
+                else:
+                    response = {'success': False, 'error': 'Email not found'}
+            if response['success']:
+                self.preferences_writer.schedule()
+                self.update_prefetch()
             
         except Exception as e:
             response = {'success': False, 'error': str(e)}
@@ -539,38 +306,147 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(json.dumps(response).encode())
 
-    def serve_recent_senders(self):
+    def send_json(self, data):
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
+
+    def start_job(self, name, fn, *args):
+        """Run slow Gmail work in the background and hand the page a job id to poll"""
+        job_id = self.jobs.submit(name, fn, *args)
+        self.send_json({'job_id': job_id})
+
+    def serve_job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            self.send_error(404)
+            return
+        self.send_json({
+            'id': job['id'],
+            'status': job['status'],
+            'result': job['result'],
+            'error': job['error']
+        })
+
+    def serve_sender_stats(self, params):
+        """Paginated, sortable per-sender or per-domain analytics from the metadata cache"""
         try:
-            emails = self.gmail_client.get_emails(query="in:inbox", max_results=30)
-            
-            senders = set()
-            for email in emails:
-                try:
-                    details = self.gmail_client.get_email_details(msg_id=email['id'])
-                    headers = details['payload'].get('headers', [])
-                    
-                    sender = next((h['value'] for h in headers if h['name'] == 'From'), '')
-                    
-                    if '<' in sender and '>' in sender:
-                        clean_sender = sender.split('<')[1].split('>')[0].strip()
-                    else:
-                        clean_sender = sender.strip();
-                        
-                    if clean_sender and '@' in clean_sender and len(clean_sender) < 100:
-                        senders.add(clean_sender)
-                        
-                except Exception:
-                    continue
-            
-            response = {'senders': sorted(list(senders))[:15]}
-            
+            page = max(int(params.get('page', ['0'])[0]), 0)
+            page_size = min(max(int(params.get('page_size', ['50'])[0]), 1), 500)
+            total, rows = self.metadata_cache.sender_stats(
+                group=params.get('group', ['sender'])[0],
+                sort=params.get('sort', ['count'])[0],
+                order=params.get('order', ['desc'])[0],
+                offset=page * page_size,
+                limit=page_size,
+                search=params.get('q', [''])[0]
+            )
+            response = {
+                'page': page,
+                'page_size': page_size,
+                'total': total,
+                'messages_cached': self.metadata_cache.count(),
+                'synced_at': self.metadata_cache.get_state('synced_at'),
+                'rows': rows
+            }
         except Exception as e:
-            response = {'senders': [], 'error': str(e)}
+            response = {'rows': [], 'error': str(e)}
+        self.send_json(response)
+
+    @staticmethod
+    def toggles_from_params(params):
+        return {key: params[key][0] == '1' for key in TOGGLES if key in params}
+
+    @classmethod
+    def update_prefetch(cls, toggles=None):
+        """Point speculative listing at the settings as currently edited"""
+        with cls.preferences_lock:
+            if toggles:
+                cls.draft_toggles.update(toggles)
+            preferences = dict(cls.preferences)
+            preferences['to_delete_senders'] = list(preferences['to_delete_senders'])
+            preferences.update(cls.draft_toggles)
+        cls.prefetcher.update(preferences)
+
+    @classmethod
+    def build_preview(cls, params):
+        page = int(params.get('page', ['0'])[0])
+        with cls.preferences_lock:
+            preferences = dict(cls.preferences)
+            # The handlers edit the sender list in place under the lock
+            preferences['to_delete_senders'] = list(preferences['to_delete_senders'])
+        preferences.update(cls.toggles_from_params(params))
+        cls.update_prefetch(cls.toggles_from_params(params))
         
+        # Only re-list candidates when the settings behind the preview changed
+        preview_key = json.dumps(
+            [preferences.get(key) for key in ('to_delete_senders', 'delete_promotional', 'delete_spam',
+                                              'delete_newsletters', 'delete_social', PROTECT_PREFERENCE,
+                                              'max_emails_per_run')]
+        )
+        with cls.preview_lock:
+            if cls.preview is None or cls.preview_key != preview_key:
+                if cls.preview is not None:
+                    cls.preview.close()
+                # Only the rules the edit added are listed; the rest come from earlier listings
+                matches, metadata = cls.prefetcher.candidates(preferences, timeout=PREVIEW_TIMEOUT)
+                if matches is not None:
+                    cls.preview = LazyPreview(cls.gmail_client, IdList(matches), preferences, reasons=matches,
+                                              metadata=metadata)
+                else:
+                    search_queries = build_search_queries(preferences)
+                    query = " OR ".join(q for _, q in search_queries)
+                    msg_ids = list_ids(cls.gmail_client, query, max_results=preferences.get('max_emails_per_run')) if query else []
+                    cls.preview = LazyPreview(cls.gmail_client, msg_ids, preferences)
+                cls.preview_key = preview_key
+            preview = cls.preview
+        
+        return {
+            'page': page,
+            'page_count': preview.page_count,
+            'total': preview.total,
+            'emails': preview.get_page(page)
+        }
+
+    def serve_events(self):
+        """Stream cleanup progress as Server-Sent Events until the run finishes"""
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
         self.end_headers()
-        self.wfile.write(json.dumps(response).encode())
+        # The stream ends when the run does; closing the connection tells the browser
+        self.close_connection = True
+        
+        last_version = None
+        last_sent = 0
+        self.progress_subscribers_changed(1)
+        try:
+            while True:
+                version, state = self.progress.snapshot()
+                now = time.time()
+                if version != last_version:
+                    # However fast the counters move, at most one event per interval goes out
+                    self.wfile.write(f"data: {json.dumps(state)}\n\n".encode())
+                    self.wfile.flush()
+                    last_version = version
+                    last_sent = now
+                    if state['finished']:
+                        break
+                elif now - last_sent > 15:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    last_sent = now
+                time.sleep(SSE_INTERVAL)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.progress_subscribers_changed(-1)
+
+    @classmethod
+    def progress_subscribers_changed(cls, delta):
+        with cls.preferences_lock:
+            cls.progress_subscribers += delta
 
     def handle_save_settings(self):
         global should_start_cleanup
@@ -581,38 +457,30 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
         try:
             settings = json.loads(post_data.decode())
             
-            self.preferences['to_delete_senders'] = settings['to_delete_senders']
-            self.preferences['delete_promotional'] = settings['delete_promotional']
-            self.preferences['delete_spam'] = settings['delete_spam']
-            self.preferences['delete_newsletters'] = settings['delete_newsletters']
-            self.preferences['delete_social'] = settings['delete_social']
+            with self.preferences_lock:
+                # The page no longer holds the whole delete list; keep the server's copy unless one is sent
+                if 'to_delete_senders' in settings:
+                    senders = [entry for entry in map(normalize_delete_entry, settings['to_delete_senders']) if entry]
+                    self.preferences['to_delete_senders'] = list(dict.fromkeys(senders))
+                    self.delete_index.clear()
+                    self.delete_index.update(self.preferences['to_delete_senders'])
+                for key in TOGGLES:
+                    self.preferences[key] = settings[key]
             
-            # Save to JSON file
-            success = save_user_preferences(self.preferences)
+            # The cleanup reads the file next, so write any pending edits out now
+            self.preferences_writer.schedule()
+            success = self.preferences_writer.flush()
             
             should_start_cleanup = True
+            decision_made.set()
             
             if success:
                 # Return success page that closes the window
                 self.send_response(200)
                 self.send_header('Content-type', 'text/html')
                 self.end_headers()
-                close_html = '''
-                <html>
-                <head><title>Gmail Cleanup - Success</title></head>
-                <body style="font-family: Arial, sans-serif; text-align: center; padding: 50px;">
-                    <h2>✅ Settings Saved Successfully!</h2>
-                    <p>Starting email cleanup...</p>
-                    <p>You can close this window.</p>
-                    <script>
-                        setTimeout(function() {
-                            window.close();
-                        }, 2000);
-                    </script>
-                </body>
-                </html>
-                '''
-                self.wfile.write(close_html.encode())
+                # Keep the tab open and stream the run's progress into it
+                self.wfile.write(load_static('progress.html')[0])
             else:
                 # Return error as JSON for JavaScript to handle
                 response = {'success': False, 'error': 'Failed to save settings'}
@@ -637,6 +505,7 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
     def handle_cancel(self):
         global should_start_cleanup
         should_start_cleanup = False  # Ensure cleanup doesn't start
+        decision_made.set()
         
         self.send_response(200)
         self.send_header('Content-type', 'text/html')
@@ -658,36 +527,120 @@ class WebGUIHandler(http.server.BaseHTTPRequestHandler):
         '''
         self.wfile.write(cancel_html.encode())
 
+def load_static(name):
+    """Return (content, etag) for a file in static/, read once and kept in memory"""
+    if name != os.path.basename(name) or name.startswith('.'):
+        raise ValueError(f"Invalid static file name: {name}")
+    if name not in _static_cache:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            content = f.read()
+        _static_cache[name] = (content, hashlib.sha1(content).hexdigest()[:16])
+    return _static_cache[name]
+
+def load_recent_senders(gmail_client):
+    """Collect up to 15 distinct senders from the 30 newest inbox emails"""
+    emails = gmail_client.get_emails(query="in:inbox", max_results=30)
+    # One batched metadata request instead of a messages.get per email
+    messages = gmail_client.get_emails_metadata([email['id'] for email in emails], headers=('From',))
+    
+    senders = set()
+    for email in emails:
+        message = messages.get(email['id'])
+        if message is None:
+            continue
+        clean_sender = clean_sender_address(get_header(message, 'From'))
+        if clean_sender and '@' in clean_sender and len(clean_sender) < 100:
+            senders.add(clean_sender)
+    
+    return {'senders': sorted(list(senders))[:15]}
+
 class WebGUI:
     def __init__(self, gmail_client):
         self.gmail_client = gmail_client
         self.port = 8080
+        self.httpd = None
+        self.progress = ProgressTracker()
         
     def run(self):
         global should_start_cleanup
         should_start_cleanup = False
+        decision_made.clear()
         
         # Set up the handler class with gmail client and preferences
         WebGUIHandler.gmail_client = self.gmail_client
         WebGUIHandler.preferences = USER_PREFERENCES.copy()
+        WebGUIHandler.preferences['to_delete_senders'] = list(USER_PREFERENCES.get('to_delete_senders', []))
+        WebGUIHandler.delete_index = set(WebGUIHandler.preferences['to_delete_senders'])
+        WebGUIHandler.preferences_writer = PreferencesWriter(WebGUIHandler.preferences, WebGUIHandler.preferences_lock)
+        WebGUIHandler.draft_toggles = {}
+        if WebGUIHandler.metadata_cache is None:
+            WebGUIHandler.metadata_cache = MetadataCache()
+        WebGUIHandler.prefetcher = SpeculativePrefetch(
+            self.gmail_client, max_results=WebGUIHandler.preferences.get('max_emails_per_run'),
+            metadata_cache=WebGUIHandler.metadata_cache
+        )
+        WebGUIHandler.estimator = MatchEstimator(self.gmail_client, WebGUIHandler.metadata_cache)
+        # Start listing for the saved settings straight away; edits adjust it from there
+        WebGUIHandler.update_prefetch()
+        WebGUIHandler.jobs = JobManager()
+        WebGUIHandler.progress = self.progress
         
         # Find an available port
         for port in range(8080, 8090):
             try:
-                with socketserver.TCPServer(("", port), WebGUIHandler) as httpd:
-                    self.port = port
-                    print(f"🌐 Opening web interface at http://localhost:{port}")
-                    
-                    # Open browser
-                    webbrowser.open(f'http://localhost:{port}')
-                    
-                    # Handle requests until user saves or cancels
-                    while not should_start_cleanup:
-                        httpd.handle_request()
-                        
-                    break
-                    
+                # Each request gets its own thread, so a slow Gmail call never blocks the page
+                self.httpd = http.server.ThreadingHTTPServer(("", port), WebGUIHandler)
             except OSError:
                 continue
+            
+            self.port = port
+            self.httpd.daemon_threads = True
+            server_thread = threading.Thread(target=self.httpd.serve_forever, name='web-gui', daemon=True)
+            server_thread.start()
+            print(f"🌐 Opening web interface at http://localhost:{port}")
+            
+            # Open browser
+            webbrowser.open(f'http://localhost:{port}')
+            
+            # Serve requests until user saves or cancels
+            try:
+                while not decision_made.wait(timeout=0.5):
+                    pass
+            except KeyboardInterrupt:
+                print("\n⛔ Interrupted")
+            break
         
-        return should_start_cleanup
\ No newline at end of file
+        # After Save the server keeps running to stream the cleanup's progress;
+        # the caller shuts it down when the run is over
+        if not should_start_cleanup:
+            self.shutdown()
+        return should_start_cleanup
+
+    def prefetched_candidates(self, preferences, timeout=120):
+        """Candidates listed speculatively for the saved preferences, or None to list from scratch"""
+        if WebGUIHandler.prefetcher is None:
+            return None
+        print("⚡ Collecting candidates listed while the settings were being edited...")
+        matches, metadata = WebGUIHandler.prefetcher.candidates(preferences, timeout=timeout, for_run=True)
+        if matches is None:
+            return None
+        return matches, metadata
+
+    def shutdown(self, drain_seconds=3):
+        """Stop the web server and any background jobs"""
+        # Give open progress streams a moment to deliver the final event
+        deadline = time.time() + drain_seconds
+        while WebGUIHandler.progress_subscribers > 0 and time.time() < deadline:
+            time.sleep(0.1)
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if WebGUIHandler.jobs is not None:
+            WebGUIHandler.jobs.shutdown()
+        if WebGUIHandler.preferences_writer is not None:
+            WebGUIHandler.preferences_writer.flush()
+        if WebGUIHandler.prefetcher is not None:
+            WebGUIHandler.prefetcher.close()
+        if WebGUIHandler.estimator is not None:
+            WebGUIHandler.estimator.close()